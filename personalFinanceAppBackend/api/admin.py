@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Account, Investment, Item, Transaction
+from .models import Account, Budget, CategorizationRule, Investment, Item, Transaction
 
 # Register your models here.
 
@@ -48,3 +48,31 @@ class InvestmentModel(admin.ModelAdmin):
         "cost_basis",
         "quantity",
     )
+
+
+@admin.register(CategorizationRule)
+class CategorizationRuleModel(admin.ModelAdmin):
+    list_filter = ("user", "primary_category")
+    list_display = (
+        "user",
+        "priority",
+        "name_contains",
+        "name_regex",
+        "min_amount",
+        "max_amount",
+        "primary_category",
+        "detailed_category",
+    )
+
+
+@admin.register(Budget)
+class BudgetModel(admin.ModelAdmin):
+    list_filter = ("user", "period")
+    list_display = (
+        "user",
+        "primary_category",
+        "period",
+        "amount_limit",
+        "period_start",
+        "spent",
+    )
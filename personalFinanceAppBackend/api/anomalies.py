@@ -0,0 +1,422 @@
+from datetime import date
+from logging import getLogger
+
+from django.db import router
+from django.db import transaction as db_transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from .models import AnomalyDetectionRun, SpendingAnomaly, SpendingStatistic, Transaction
+
+logger = getLogger("personal_finance_app")
+
+# Minimum number of transactions, decayed by age, before a category or
+# merchant can have outliers
+MIN_HISTORY = 5
+
+# Days after which a transaction counts half in the spending statistics
+HALF_LIFE_DAYS = 180
+
+# Standard score above which an amount is an outlier
+OUTLIER_Z_SCORE = 3.5
+
+# Spreads below this are raised to it, so charges after a series of equal
+# amounts get a finite score
+MIN_SPREAD = 1.0
+
+# Amounts this close to the mean are never outliers, however small the spread
+MIN_OUTLIER_DIFFERENCE = 20.0
+
+# Charges of the same amount at the same merchant this many days apart
+DUPLICATE_WINDOW_DAYS = 1
+
+
+def _group_ids(keys: list) -> tuple:
+    import numpy as np
+
+    unique_keys, group_ids = np.unique(
+        np.array(keys, dtype=object), return_inverse=True
+    )
+    return list(unique_keys), group_ids
+
+
+def _merge_rows(weight, mean, m2, groups, amounts, row_weights) -> tuple:
+    """
+    Merge weighted rows into per-group weight, mean and sum of squared
+    deviations, using Chan's parallel form of Welford's algorithm.
+    """
+    import numpy as np
+
+    group_count = len(weight)
+    batch_weight = np.bincount(groups, weights=row_weights, minlength=group_count)
+    batch_mean = (
+        np.bincount(groups, weights=row_weights * amounts, minlength=group_count)
+        / batch_weight
+    )
+    batch_m2 = np.bincount(
+        groups,
+        weights=row_weights * (amounts - batch_mean[groups]) ** 2,
+        minlength=group_count,
+    )
+
+    merged_weight = weight + batch_weight
+    delta = batch_mean - mean
+    merged_mean = mean + delta * batch_weight / merged_weight
+    merged_m2 = m2 + batch_m2 + delta**2 * weight * batch_weight / merged_weight
+    return merged_weight, merged_mean, merged_m2
+
+
+def _score_outliers(rows: dict, statistics: dict, kind: str, key_field: str):
+    """
+    Score a chunk's amounts against the running statistics, then merge the
+    chunk into them.
+
+    Statistics decay exponentially with a half-life of HALF_LIFE_DAYS, so
+    they follow a user's recent spending. Rows are scored against the
+    stored statistics of their (user, key) from before the chunk. Until
+    these weigh MIN_HISTORY, e.g. on a user's first run, rows are scored
+    against the stored statistics merged with the rest of the chunk instead,
+    leaving each row out so an outlier does not widen its own spread. The
+    rows of the chunk count fully there, so a first run over a user's
+    history does not judge old charges by later spending.
+    """
+    import numpy as np
+
+    keys = [
+        f"{user_id}\x00{key}" for user_id, key in zip(rows["user_id"], rows[key_field])
+    ]
+    unique_keys, groups = _group_ids(keys)
+    group_count = len(unique_keys)
+    amounts = rows["amount"]
+    days = rows["date"]
+
+    stored = [statistics.get((kind, key)) for key in unique_keys]
+    weight = np.array([stat.weight if stat else 0.0 for stat in stored])
+    mean = np.array([stat.mean if stat else 0.0 for stat in stored])
+    m2 = np.array([stat.m2 if stat else 0.0 for stat in stored])
+    as_of = np.array(
+        [stat.as_of.toordinal() if stat and stat.as_of else np.nan for stat in stored]
+    )
+
+    # Decay the stored statistics and the rows to the latest date of a group
+    reference = np.zeros(group_count)
+    np.maximum.at(reference, groups, days)
+    reference = np.fmax(reference, as_of)
+    decay = 0.5 ** (
+        (reference - np.where(np.isnan(as_of), reference, as_of)) / HALF_LIFE_DAYS
+    )
+    weight *= decay
+    m2 *= decay
+
+    # Statistics of the stored rows and the rest of the chunk, for every row
+    ones = np.ones(len(amounts))
+    all_weight, all_mean, all_m2 = _merge_rows(weight, mean, m2, groups, amounts, ones)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        others_weight = all_weight[groups] - 1
+        others_mean = (all_weight[groups] * all_mean[groups] - amounts) / others_weight
+        others_m2 = all_m2[groups] - (amounts - all_mean[groups]) * (
+            amounts - others_mean
+        )
+
+    seeded = weight[groups] >= MIN_HISTORY
+    base_weight = np.where(seeded, weight[groups], others_weight)
+    base_mean = np.where(seeded, mean[groups], others_mean)
+    base_m2 = np.where(seeded, m2[groups], others_m2)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        std = np.sqrt(np.maximum(base_m2, 0) / base_weight)
+        z_scores = (amounts - base_mean) / np.maximum(std, MIN_SPREAD)
+    outliers = (
+        (base_weight >= MIN_HISTORY)
+        & (z_scores > OUTLIER_Z_SCORE)
+        & (amounts - base_mean > MIN_OUTLIER_DIFFERENCE)
+    )
+
+    row_weights = 0.5 ** ((reference[groups] - days) / HALF_LIFE_DAYS)
+    merged_weight, merged_mean, merged_m2 = _merge_rows(
+        weight, mean, m2, groups, amounts, row_weights
+    )
+
+    updated = []
+    for index, key in enumerate(unique_keys):
+        user_id, value = key.split("\x00", 1)
+        stat = stored[index] or SpendingStatistic(
+            user_id=int(user_id), kind=kind, key=value
+        )
+        stat.weight = float(merged_weight[index])
+        stat.mean = float(merged_mean[index])
+        stat.m2 = float(merged_m2[index])
+        stat.as_of = date.fromordinal(int(reference[index]))
+        updated.append(stat)
+
+    first_seen = np.array([stat is None for stat in stored])[groups]
+    return z_scores, outliers, first_seen, updated
+
+
+def _find_duplicates(rows: dict, checkpoint: int):
+    """
+    Flag new charges repeating an earlier charge of the same amount and merchant.
+
+    Rows of the chunk are combined with the already processed charges of the
+    same accounts in the date window, sorted by (account, merchant, amount,
+    date), and compared with their predecessor in one vectorized pass.
+    """
+    import numpy as np
+
+    accounts = set(rows["account_id"].tolist())
+    window_start = rows["date"].min() - DUPLICATE_WINDOW_DAYS
+    earlier = Transaction.objects.filter(
+        account__in=accounts,
+        pk__lte=checkpoint,
+        amount__gt=0,
+        date__gte=date.fromordinal(int(window_start)),
+    ).values_list("id", "account_id", "merchant", "amount", "date")
+
+    ids = rows["id"].tolist()
+    account_ids = rows["account_id"].tolist()
+    merchants = list(rows["merchant"])
+    amounts = rows["amount"].tolist()
+    dates = rows["date"].tolist()
+    for pk, account_id, merchant, amount, day in earlier:
+        ids.append(pk)
+        account_ids.append(account_id)
+        merchants.append(merchant)
+        amounts.append(amount)
+        dates.append(day.toordinal())
+
+    _, merchant_ids = _group_ids(merchants)
+    named = np.array([bool(merchant) for merchant in merchants])
+    account_ids = np.asarray(account_ids)
+    cents = np.round(np.asarray(amounts) * 100).astype(np.int64)
+    dates = np.asarray(dates)
+
+    order = np.lexsort((np.asarray(ids), dates, cents, merchant_ids, account_ids))
+    same_charge = (
+        (account_ids[order][1:] == account_ids[order][:-1])
+        & (merchant_ids[order][1:] == merchant_ids[order][:-1])
+        & (cents[order][1:] == cents[order][:-1])
+        & (np.diff(dates[order]) <= DUPLICATE_WINDOW_DAYS)
+        & named[order][1:]
+    )
+
+    duplicates = np.zeros(len(ids), dtype=bool)
+    duplicates[order[1:]] = same_charge
+    return duplicates[: len(rows["id"])]
+
+
+def _process_chunk(chunk: list, checkpoint: int) -> list:
+    import numpy as np
+
+    rows = {
+        "id": np.array([row["id"] for row in chunk]),
+        "user_id": np.array([row["account__item__user_id"] for row in chunk]),
+        "account_id": np.array([row["account_id"] for row in chunk]),
+        "merchant": [row["merchant"] for row in chunk],
+        "primary_category": [row["primary_category"] for row in chunk],
+        "amount": np.array([row["amount"] for row in chunk], dtype=float),
+        "date": np.array([row["date"].toordinal() for row in chunk]),
+    }
+    user_ids = set(rows["user_id"].tolist())
+
+    statistics = {
+        (stat.kind, f"{stat.user_id}\x00{stat.key}"): stat
+        for stat in SpendingStatistic.objects.filter(user__in=user_ids)
+    }
+    users_with_history = {
+        stat.user_id
+        for stat in statistics.values()
+        if stat.kind == SpendingStatistic.CATEGORY
+    }
+
+    category_z, category_outliers, _, category_stats = _score_outliers(
+        rows, statistics, SpendingStatistic.CATEGORY, "primary_category"
+    )
+    merchant_z, merchant_outliers, new_merchants, merchant_stats = _score_outliers(
+        rows, statistics, SpendingStatistic.MERCHANT, "merchant"
+    )
+    duplicates = _find_duplicates(rows, checkpoint)
+
+    # Only the first charge of a merchant is new, and not on a user's first run
+    has_history = np.array(
+        [user_id in users_with_history for user_id in rows["user_id"]]
+    )
+    _, first_rows = np.unique(
+        np.array(
+            [
+                f"{user}\x00{merchant}"
+                for user, merchant in zip(rows["user_id"], rows["merchant"])
+            ],
+            dtype=object,
+        ),
+        return_index=True,
+    )
+    first_charge = np.zeros(len(chunk), dtype=bool)
+    first_charge[first_rows] = True
+    new_merchants &= first_charge & has_history
+
+    anomalies = []
+    for index in np.flatnonzero(category_outliers | merchant_outliers):
+        z_score = max(
+            category_z[index] if category_outliers[index] else 0.0,
+            merchant_z[index] if merchant_outliers[index] else 0.0,
+        )
+        anomalies.append(
+            SpendingAnomaly(
+                user_id=int(rows["user_id"][index]),
+                transaction_id=int(rows["id"][index]),
+                anomaly_type=SpendingAnomaly.AMOUNT_OUTLIER,
+                score=round(float(z_score), 2),
+            )
+        )
+    for index in np.flatnonzero(new_merchants):
+        anomalies.append(
+            SpendingAnomaly(
+                user_id=int(rows["user_id"][index]),
+                transaction_id=int(rows["id"][index]),
+                anomaly_type=SpendingAnomaly.NEW_MERCHANT,
+            )
+        )
+    for index in np.flatnonzero(duplicates):
+        anomalies.append(
+            SpendingAnomaly(
+                user_id=int(rows["user_id"][index]),
+                transaction_id=int(rows["id"][index]),
+                anomaly_type=SpendingAnomaly.DUPLICATE_CHARGE,
+            )
+        )
+
+    statistics_to_update = category_stats + merchant_stats
+    SpendingStatistic.objects.bulk_update(
+        [stat for stat in statistics_to_update if stat.pk],
+        ["weight", "mean", "m2", "as_of"],
+        batch_size=1000,
+    )
+    SpendingStatistic.objects.bulk_create(
+        [stat for stat in statistics_to_update if not stat.pk], batch_size=1000
+    )
+    SpendingAnomaly.objects.bulk_create(
+        anomalies, batch_size=1000, ignore_conflicts=True
+    )
+
+    return anomalies
+
+
+def forget_transactions(user_id: int, transactions: list) -> None:
+    """
+    Take deleted transactions back out of a user's spending statistics.
+
+    Only charges up to the detection checkpoint were merged into the
+    statistics, and each is removed with the decayed weight it has there.
+    The anomalies of the transactions are deleted along with them.
+
+    Args:
+        user_id: The id of the user owning the transactions
+        transactions: Deleted Transaction instances, with their primary keys
+    """
+    charges = [transaction for transaction in transactions if transaction.amount > 0]
+    if not charges:
+        return
+    checkpoint = (
+        AnomalyDetectionRun.objects.aggregate(last=Max("last_transaction_pk"))["last"]
+        or 0
+    )
+    charges = [transaction for transaction in charges if transaction.pk <= checkpoint]
+    if not charges:
+        return
+
+    statistics = {
+        (stat.kind, stat.key): stat
+        for stat in SpendingStatistic.objects.filter(
+            Q(kind=SpendingStatistic.CATEGORY)
+            & Q(key__in={charge.primary_category for charge in charges})
+            | Q(kind=SpendingStatistic.MERCHANT)
+            & Q(key__in={charge.merchant for charge in charges}),
+            user_id=user_id,
+        )
+    }
+    for charge in charges:
+        for key in (
+            (SpendingStatistic.CATEGORY, charge.primary_category),
+            (SpendingStatistic.MERCHANT, charge.merchant),
+        ):
+            stat = statistics.get(key)
+            if stat is None:
+                continue
+            age = (stat.as_of - charge.date).days if stat.as_of else 0
+            weight = 0.5 ** (max(age, 0) / HALF_LIFE_DAYS)
+            remaining = stat.weight - weight
+            if remaining <= 1e-9:
+                stat.weight, stat.mean, stat.m2 = 0.0, 0.0, 0.0
+                continue
+            mean = (stat.weight * stat.mean - weight * charge.amount) / remaining
+            stat.m2 = max(
+                0.0,
+                stat.m2 - weight * (charge.amount - stat.mean) * (charge.amount - mean),
+            )
+            stat.weight, stat.mean = remaining, mean
+
+    SpendingStatistic.objects.bulk_update(
+        statistics.values(), ["weight", "mean", "m2"], batch_size=1000
+    )
+
+
+def detect_anomalies(chunk_size: int = 20000) -> AnomalyDetectionRun:
+    """
+    Flag unusual charges among the transactions added since the last run.
+
+    New spending transactions of all users are read in primary key order,
+    chunk by chunk. Each chunk is scored against the stored per-user
+    category and merchant statistics, which are then updated, so a run only
+    touches the new rows no matter how long the users' histories are.
+    Statistics decay with the age of the transactions, see _score_outliers.
+
+    Args:
+        chunk_size: Number of transactions processed per chunk
+
+    Returns:
+        The finished AnomalyDetectionRun
+    """
+    # Interrupted runs committed their progress together with the statistics
+    checkpoint = (
+        AnomalyDetectionRun.objects.aggregate(last=Max("last_transaction_pk"))["last"]
+        or 0
+    )
+    run = AnomalyDetectionRun.objects.create(last_transaction_pk=checkpoint)
+
+    while True:
+        chunk = list(
+            Transaction.objects.filter(pk__gt=run.last_transaction_pk)
+            .order_by("pk")
+            .values(
+                "id",
+                "account_id",
+                "account__item__user_id",
+                "merchant",
+                "primary_category",
+                "amount",
+                "date",
+            )[:chunk_size]
+        )
+        if not chunk:
+            break
+
+        spending = [row for row in chunk if row["amount"] > 0]
+        with db_transaction.atomic(using=router.db_for_write(SpendingAnomaly)):
+            anomalies = (
+                _process_chunk(spending, run.last_transaction_pk) if spending else []
+            )
+            run.last_transaction_pk = chunk[-1]["id"]
+            run.transactions_processed += len(chunk)
+            run.anomalies_found += len(anomalies)
+            run.save()
+
+    run.finished_at = timezone.now()
+    run.save()
+
+    logger.info(
+        "Anomaly detection processed %d transactions and found %d anomalies",
+        run.transactions_processed,
+        run.anomalies_found,
+    )
+
+    return run
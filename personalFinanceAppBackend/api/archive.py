@@ -0,0 +1,140 @@
+import json
+import zlib
+from datetime import date, timedelta
+from logging import getLogger
+
+from django.conf import settings
+from django.db import router
+from django.db import transaction as db_transaction
+
+from .models import Transaction, TransactionArchive
+from .serializers import TransactionSerializer
+
+logger = getLogger("personal_finance_app")
+
+
+def compress_rows(rows: list) -> bytes:
+    return zlib.compress(json.dumps(rows, separators=(",", ":")).encode())
+
+
+def decompress_rows(data) -> list:
+    return json.loads(zlib.decompress(bytes(data)))
+
+
+def archive_cutoff() -> date:
+    """
+    Return the date before which transactions may be archived.
+    """
+    return date.today() - timedelta(days=settings.TRANSACTION_ARCHIVE_AGE_DAYS)
+
+
+def reaches_archive(start_date) -> bool:
+    """
+    Return whether a date range starting at start_date can hold archived
+    transactions, so ranges of recent transactions skip the archive.
+    """
+    return date.fromisoformat(str(start_date)) < archive_cutoff()
+
+
+def archived_transactions(user, start_date, end_date) -> list:
+    """
+    Return the archived transactions of a user inside a date range.
+
+    Args:
+        user: The User whose transactions are read
+        start_date: First day of the date range
+        end_date: Last day of the date range
+
+    Returns:
+        List of transactions as serialized by the TransactionSerializer
+    """
+    start_date = str(start_date)
+    end_date = str(end_date)
+    archives = TransactionArchive.objects.filter(
+        user=user,
+        year__range=(
+            date.fromisoformat(start_date).year,
+            date.fromisoformat(end_date).year,
+        ),
+    ).only("data")
+
+    return [
+        row
+        for archive in archives
+        for row in decompress_rows(archive.data)
+        if start_date <= row["date"] <= end_date
+    ]
+
+
+def archive_user_transactions(user_id, before: date) -> int:
+    """
+    Move the posted transactions of a user dated before a day to archives.
+
+    Transactions are merged into the archive of their year one year at a
+    time. Anomalies flagged on them are deleted along with them.
+
+    Args:
+        user_id: Id of the User whose transactions are archived
+        before: Transactions dated before this day are archived
+
+    Returns:
+        Number of transactions archived
+    """
+    transactions = Transaction.objects.filter(
+        account__item__user=user_id, date__lt=before, pending=False
+    )
+    archived_count = 0
+
+    for year in transactions.dates("date", "year"):
+        with db_transaction.atomic(using=router.db_for_write(TransactionArchive)):
+            year_transactions = transactions.filter(date__year=year.year).order_by("pk")
+            rows = TransactionSerializer(year_transactions, many=True).data
+            if not rows:
+                continue
+
+            archive, _ = TransactionArchive.objects.select_for_update().get_or_create(
+                user_id=user_id, year=year.year, defaults={"data": compress_rows([])}
+            )
+            merged = {
+                row["transaction_id"]: row for row in decompress_rows(archive.data)
+            }
+            merged.update((row["transaction_id"], row) for row in rows)
+
+            archive.data = compress_rows(list(merged.values()))
+            archive.row_count = len(merged)
+            archive.save()
+
+            Transaction.objects.filter(pk__in=[row["id"] for row in rows]).delete()
+            archived_count += len(rows)
+
+    if archived_count:
+        logger.info(
+            "Archived %d transactions dated before %s for user %s",
+            archived_count,
+            before,
+            user_id,
+        )
+
+    return archived_count
+
+
+def archive_transactions(before: date = None) -> int:
+    """
+    Archive the old transactions of every user of the current shard.
+
+    Args:
+        before: Transactions dated before this day are archived, by default
+            those older than TRANSACTION_ARCHIVE_AGE_DAYS
+
+    Returns:
+        Number of transactions archived
+    """
+    before = before or archive_cutoff()
+    user_ids = list(
+        Transaction.objects.filter(date__lt=before, pending=False)
+        .values_list("account__item__user", flat=True)
+        .distinct()
+        .order_by()
+    )
+
+    return sum(archive_user_transactions(user_id, before) for user_id in user_ids)
@@ -0,0 +1,130 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from logging import getLogger
+
+from django.db.models import F, Sum
+
+from .models import Budget, Transaction
+
+logger = getLogger("personal_finance_app")
+
+
+def get_period_start(period: str, day: date) -> date:
+    """
+    Return the first day of the budget period containing the given day.
+    """
+    if period == Budget.WEEKLY:
+        return day - timedelta(days=day.weekday())
+    if period == Budget.YEARLY:
+        return day.replace(month=1, day=1)
+    return day.replace(day=1)
+
+
+def get_period_end(period: str, start: date) -> date:
+    """
+    Return the first day after the budget period starting on the given day.
+    """
+    if period == Budget.WEEKLY:
+        return start + timedelta(days=7)
+    if period == Budget.YEARLY:
+        return start.replace(year=start.year + 1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value))
+
+
+def budget_entry(transaction) -> tuple:
+    """
+    Return the (primary_category, date, amount) a transaction counts towards.
+    """
+    return (
+        transaction.primary_category,
+        _as_date(transaction.date),
+        transaction.amount,
+    )
+
+
+def apply_budget_changes(user_id: int, removed=(), added=()) -> None:
+    """
+    Incrementally update the spent counters of a user's budgets.
+
+    Each budget only tracks its current period: changes to older periods
+    are ignored, and a change in a later period rolls the budget forward,
+    recomputing the spending of that period from the stored transactions.
+    Transactions must so be saved before their changes are applied.
+
+    Args:
+        user_id: The id of the user owning the transactions
+        removed: Iterable of budget entries for deleted or pre-edit transactions
+        added: Iterable of budget entries for new or post-edit transactions
+    """
+    changes = [(entry, -1) for entry in removed] + [(entry, 1) for entry in added]
+    if not changes:
+        return
+
+    categories = {category for (category, _, _), _ in changes}
+    budgets = Budget.objects.filter(
+        user_id=user_id, primary_category__in=categories
+    ).only("id", "primary_category", "period", "period_start")
+
+    for budget in budgets:
+        deltas = defaultdict(float)
+        for (category, day, amount), sign in changes:
+            if category == budget.primary_category:
+                deltas[get_period_start(budget.period, day)] += sign * amount
+
+        current_delta = deltas.pop(budget.period_start, 0.0)
+        later_periods = [start for start in deltas if start > budget.period_start]
+
+        if later_periods:
+            latest_start = max(later_periods)
+            # The period may hold transactions stored before this change
+            rolled = Budget.objects.filter(
+                pk=budget.pk, period_start__lt=latest_start
+            ).update(
+                period_start=latest_start,
+                spent=_period_spent(
+                    user_id, budget.primary_category, budget.period, latest_start
+                ),
+            )
+            if not rolled:
+                # Another request already rolled the budget into this period
+                Budget.objects.filter(pk=budget.pk, period_start=latest_start).update(
+                    spent=F("spent") + deltas[latest_start]
+                )
+        elif current_delta:
+            Budget.objects.filter(
+                pk=budget.pk, period_start=budget.period_start
+            ).update(spent=F("spent") + current_delta)
+
+
+def _period_spent(user_id: int, category: str, period: str, start: date) -> float:
+    spent = Transaction.objects.filter(
+        account__item__user_id=user_id,
+        primary_category=category,
+        date__gte=start,
+        date__lt=get_period_end(period, start),
+    ).aggregate(spent=Sum("amount"))["spent"]
+    return spent or 0.0
+
+
+def recalculate_budget(budget: Budget, today: date | None = None) -> Budget:
+    """
+    Reset a budget to the current period and recompute its spent counter.
+
+    Used when a budget is created or its category or period changes; the
+    counter is then maintained incrementally by apply_budget_changes.
+    """
+    budget.period_start = get_period_start(budget.period, today or date.today())
+    budget.spent = _period_spent(
+        budget.user_id, budget.primary_category, budget.period, budget.period_start
+    )
+    return budget
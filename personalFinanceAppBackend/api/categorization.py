@@ -0,0 +1,333 @@
+import re
+from logging import getLogger
+
+from .budgets import apply_budget_changes, budget_entry
+from .models import CategorizationRule, Transaction
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+logger = getLogger("personal_finance_app")
+
+_REPEATS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+_GROUPREFS = (sre_parse.GROUPREF, sre_parse.GROUPREF_EXISTS)
+# Added in Python 3.11, they never backtrack
+_ATOMIC_GROUP = getattr(sre_parse, "ATOMIC_GROUP", None)
+_POSSESSIVE_REPEAT = getattr(sre_parse, "POSSESSIVE_REPEAT", None)
+
+
+def _regex_nodes(items, repeated: bool = False):
+    """
+    Yield the (op, argument, repeated) nodes of a parsed regex, where
+    repeated tells whether the node is inside an unbounded repeat.
+    """
+    for op, av in items:
+        yield op, av, repeated
+        if op in _REPEATS:
+            yield from _regex_nodes(av[2], repeated or av[1] == sre_parse.MAXREPEAT)
+        elif op == sre_parse.SUBPATTERN:
+            yield from _regex_nodes(av[-1], repeated)
+        elif op == sre_parse.BRANCH:
+            for branch in av[1]:
+                yield from _regex_nodes(branch, repeated)
+        elif op == sre_parse.GROUPREF_EXISTS:
+            for branch in av[1:]:
+                if branch is not None:
+                    yield from _regex_nodes(branch, repeated)
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            yield from _regex_nodes(av[1], repeated)
+        elif op == _ATOMIC_GROUP:
+            yield from _regex_nodes(av, repeated)
+        elif op == _POSSESSIVE_REPEAT:
+            yield from _regex_nodes(av[2], repeated)
+
+
+def has_nested_quantifiers(pattern: str) -> bool:
+    """
+    Tell whether a regex repeats without bound a part that itself repeats
+    without bound, like (a+)+. Backtracking over such a pattern takes
+    exponential time on names that nearly match.
+    """
+    return any(
+        op in _REPEATS and repeated and av[1] == sre_parse.MAXREPEAT
+        for op, av, repeated in _regex_nodes(sre_parse.parse(pattern))
+    )
+
+
+def has_backreferences(pattern: str) -> bool:
+    return any(op in _GROUPREFS for op, _, _ in _regex_nodes(sre_parse.parse(pattern)))
+
+
+def _trie_pattern(words: list) -> str:
+    """
+    Build a regex alternation for the given literal words, shaped like a trie.
+
+    Branches are keyed by their first character, so at any position of the
+    scanned text at most one branch can be followed, and greedy optional
+    groups make each match the longest word starting at that position.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def node_pattern(node: dict) -> str:
+        branches = [
+            re.escape(char) + node_pattern(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if not branches:
+            return ""
+
+        pattern = branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+        if "" in node:
+            pattern = f"(?:{pattern})?"
+        return pattern
+
+    return node_pattern(trie)
+
+
+class CategorizationMatcher:
+    """
+    Match transactions against a user's categorization rules in priority order.
+
+    All ``name_contains`` needles are compiled into a single trie-shaped regex
+    that is scanned once per name with an overlapping lookahead, which reports
+    the longest needle starting at every position. Each needle carries the
+    rules of every needle it contains, so shorter needles hidden by a longer
+    match at the same position are still found (the Aho-Corasick output set).
+    ``name_regex`` rules are prefiltered with one combined regex, and only the
+    few candidate rules are then checked for amount range and account.
+    Rules whose regex is invalid or may backtrack exponentially, stored
+    before such regexes were rejected, never match.
+    """
+
+    def __init__(self, rules: list):
+        self.rules = sorted(
+            (rule for rule in rules if self._is_usable(rule)),
+            key=lambda rule: (rule.priority, rule.pk or 0),
+        )
+        self._regexes = {}
+        self._needle_rules = {}
+        self._regex_only_rules = []
+        self._unconditional_rules = []
+        self._name_cache = {}
+
+        for index, rule in enumerate(self.rules):
+            if rule.name_regex:
+                self._regexes[index] = re.compile(rule.name_regex, re.IGNORECASE)
+
+            needle = rule.name_contains.lower()
+            if needle:
+                self._needle_rules.setdefault(needle, []).append(index)
+            elif rule.name_regex:
+                self._regex_only_rules.append(index)
+            else:
+                self._unconditional_rules.append(index)
+
+        # Every needle also yields the rules of the needles it contains
+        self._needle_closure = {
+            needle: frozenset(
+                index
+                for other, indexes in self._needle_rules.items()
+                if other in needle
+                for index in indexes
+            )
+            for needle in self._needle_rules
+        }
+
+        self._needle_scanner = None
+        if self._needle_rules:
+            words = sorted(self._needle_rules)
+            self._needle_scanner = re.compile(f"(?=({_trie_pattern(words)}))")
+
+        # Combined, numbered back-references point at other patterns' groups
+        # and named groups clash, so such rules are always candidates
+        self._prefiltered_rules = [
+            index
+            for index in self._regex_only_rules
+            if not self._regexes[index].groupindex
+            and not has_backreferences(self.rules[index].name_regex)
+        ]
+        self._unfiltered_rules = [
+            index
+            for index in self._regex_only_rules
+            if index not in self._prefiltered_rules
+        ]
+
+        self._regex_prefilter = None
+        if self._prefiltered_rules:
+            try:
+                self._regex_prefilter = re.compile(
+                    "|".join(
+                        f"(?:{self.rules[index].name_regex})"
+                        for index in self._prefiltered_rules
+                    ),
+                    re.IGNORECASE,
+                )
+            except re.error:
+                # Patterns with inline global flags cannot be combined,
+                # so every regex-only rule is checked on its own instead
+                self._unfiltered_rules = self._regex_only_rules
+                self._prefiltered_rules = []
+
+    @staticmethod
+    def _is_usable(rule) -> bool:
+        if not rule.name_regex:
+            return True
+        try:
+            if not has_nested_quantifiers(rule.name_regex):
+                re.compile(rule.name_regex)
+                return True
+        except re.error:
+            pass
+        logger.warning("Skipping categorization rule %s with unsafe regex", rule.pk)
+        return False
+
+    @classmethod
+    def for_user(cls, user):
+        return cls(list(CategorizationRule.objects.filter(user=user)))
+
+    def __bool__(self):
+        return bool(self.rules)
+
+    def _name_candidates(self, name: str) -> tuple:
+        """
+        Return the sorted indexes of the rules whose name conditions may match.
+        """
+        candidates = self._name_cache.get(name)
+        if candidates is not None:
+            return candidates
+
+        found = set(self._unconditional_rules)
+
+        if self._needle_scanner is not None:
+            for match in self._needle_scanner.finditer(name.lower()):
+                found.update(self._needle_closure[match.group(1)])
+
+        found.update(self._unfiltered_rules)
+        if self._regex_prefilter is not None and self._regex_prefilter.search(name):
+            found.update(self._prefiltered_rules)
+
+        candidates = tuple(sorted(found))
+        self._name_cache[name] = candidates
+        return candidates
+
+    def match(self, name: str, amount: float, account_id: int):
+        """
+        Find the highest priority rule matching a transaction.
+
+        Args:
+            name: The transaction name
+            amount: The transaction amount
+            account_id: The primary key of the transaction's account
+
+        Returns:
+            The matching CategorizationRule, or None if no rule applies
+        """
+        if not self.rules:
+            return None
+
+        name = name or ""
+        for index in self._name_candidates(name):
+            rule = self.rules[index]
+
+            if rule.account_id is not None and rule.account_id != account_id:
+                continue
+            if rule.min_amount is not None and amount < rule.min_amount:
+                continue
+            if rule.max_amount is not None and amount > rule.max_amount:
+                continue
+
+            regex = self._regexes.get(index)
+            if regex is not None and not regex.search(name):
+                continue
+
+            return rule
+
+        return None
+
+    def categorize(self, transaction: dict) -> bool:
+        """
+        Apply the matching rule to a cleaned transaction in place.
+
+        Returns:
+            True if a rule matched and the categories were overwritten
+        """
+        rule = self.match(
+            transaction["name"], transaction["amount"], transaction["account"]
+        )
+        if rule is None:
+            return False
+
+        transaction["primary_category"] = rule.primary_category
+        transaction["detailed_category"] = rule.detailed_category
+        return True
+
+
+def apply_categorization_rules(user) -> int:
+    """
+    Re-apply a user's categorization rules to all of their stored transactions.
+
+    Args:
+        user: The user whose transactions should be re-categorized
+
+    Returns:
+        The number of transactions whose categories changed
+    """
+    matcher = CategorizationMatcher.for_user(user)
+    if not matcher:
+        return 0
+
+    transactions = Transaction.objects.filter(account__item__user=user).only(
+        "id",
+        "account_id",
+        "name",
+        "amount",
+        "date",
+        "primary_category",
+        "detailed_category",
+    )
+
+    updated_transactions = []
+    removed_entries = []
+    added_entries = []
+    for transaction in transactions.iterator(chunk_size=2000):
+        rule = matcher.match(
+            transaction.name, transaction.amount, transaction.account_id
+        )
+        if rule is None:
+            continue
+        if (transaction.primary_category, transaction.detailed_category) == (
+            rule.primary_category,
+            rule.detailed_category,
+        ):
+            continue
+
+        entry = budget_entry(transaction)
+        transaction.primary_category = rule.primary_category
+        transaction.detailed_category = rule.detailed_category
+        updated_transactions.append(transaction)
+        if entry[0] != rule.primary_category:
+            removed_entries.append(entry)
+            added_entries.append(budget_entry(transaction))
+
+    Transaction.objects.bulk_update(
+        updated_transactions,
+        ["primary_category", "detailed_category"],
+        batch_size=1000,
+    )
+    apply_budget_changes(user.pk, removed=removed_entries, added=added_entries)
+
+    logger.info(
+        "Re-categorized %d transactions for user %s",
+        len(updated_transactions),
+        user.pk,
+    )
+
+    return len(updated_transactions)
@@ -0,0 +1,159 @@
+import uuid
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import Account, RecurringStream, Transaction
+
+# Days of history used for the discretionary daily spend distribution
+HISTORY_DAYS = 90
+
+# z-score of the reported low/high band around the expected balance (80%)
+BAND_Z_SCORE = 1.2816
+
+# Account types whose balance grows with spending instead of shrinking
+LIABILITY_ACCOUNT_TYPES = {"credit", "loan"}
+
+
+def _version_key(user_id: int) -> str:
+    return f"cash_flow_forecast_version:{user_id}"
+
+
+def _forecast_key(user_id: int, days: int, today: date) -> str:
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(_version_key(user_id), version, None)
+    return f"cash_flow_forecast:{user_id}:{version}:{today.isoformat()}:{days}"
+
+
+def invalidate_cash_flow_forecast(user_id: int) -> None:
+    """
+    Drop every cached forecast of a user, e.g. after a Plaid sync.
+    """
+    cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def project_cash_flow(user, days: int, today: date | None = None) -> dict:
+    """
+    Project the balance of each of a user's accounts for the next days.
+
+    The projection starts from Account.current_balance and subtracts the
+    detected recurring streams on their scheduled dates, plus the mean
+    daily discretionary spend of the last HISTORY_DAYS days. The low/high
+    band widens with the square root of the horizon using the standard
+    deviation of that daily spend.
+
+    Args:
+        user: The user whose accounts should be projected
+        days: Number of days to project
+        today: First projected day, defaults to the current date
+
+    Returns:
+        Dictionary with the projected dates and per-account balances
+    """
+    import numpy as np
+
+    today = today or date.today()
+    history_start = today - timedelta(days=HISTORY_DAYS)
+    dates = [today + timedelta(days=offset) for offset in range(days)]
+
+    accounts = list(
+        Account.objects.filter(item__user=user)
+        .order_by("pk")
+        .values("id", "name", "account_type", "current_balance")
+    )
+    if not accounts:
+        return {"dates": dates, "accounts": []}
+
+    account_index = {account["id"]: index for index, account in enumerate(accounts)}
+    account_count = len(accounts)
+
+    # Scheduled recurring flows, in Plaid's sign (positive amounts are outflows)
+    recurring_flows = np.zeros((account_count, days))
+    streams = RecurringStream.objects.filter(user=user).values_list(
+        "account_id", "merchant", "average_amount", "interval_days", "next_date"
+    )
+    recurring_merchants = set()
+    for account_id, merchant, amount, interval, next_date in streams:
+        recurring_merchants.add((account_id, merchant))
+        if account_id not in account_index or interval <= 0:
+            continue
+
+        first_offset = (next_date - today).days
+        # Overdue streams are moved to their next occurrence from today
+        skipped = max(0, int(np.ceil(-first_offset / interval)))
+        occurrences = np.arange(skipped, skipped + int(days / interval) + 2)
+        offsets = first_offset + np.round(occurrences * interval).astype(np.int64)
+        offsets = offsets[(offsets >= 0) & (offsets < days)]
+        np.add.at(recurring_flows[account_index[account_id]], offsets, amount)
+
+    # Daily discretionary spend over the history window
+    history = np.zeros((account_count, HISTORY_DAYS))
+    transactions = Transaction.objects.filter(
+        account__in=list(account_index), date__gte=history_start, date__lt=today
+    ).values_list("account_id", "merchant", "date", "amount")
+    rows = [
+        (account_index[account_id], (day - history_start).days, amount)
+        for account_id, merchant, day, amount in transactions
+        if (account_id, merchant) not in recurring_merchants
+    ]
+    if rows:
+        row_accounts, row_days, row_amounts = (
+            np.asarray(column) for column in zip(*rows)
+        )
+        np.add.at(history, (row_accounts, row_days), row_amounts)
+
+    daily_mean = history.mean(axis=1)
+    daily_std = history.std(axis=1)
+
+    horizon = np.arange(1, days + 1)
+    expected_outflows = np.cumsum(recurring_flows, axis=1) + np.outer(
+        daily_mean, horizon
+    )
+    spread = BAND_Z_SCORE * np.outer(daily_std, np.sqrt(horizon))
+
+    direction = np.array(
+        [
+            1.0 if account["account_type"] in LIABILITY_ACCOUNT_TYPES else -1.0
+            for account in accounts
+        ]
+    )
+    current_balances = np.array([account["current_balance"] for account in accounts])
+
+    balances = current_balances[:, None] + direction[:, None] * expected_outflows
+    low = balances - spread
+    high = balances + spread
+
+    return {
+        "dates": dates,
+        "accounts": [
+            {
+                "account": account["id"],
+                "name": account["name"],
+                "current_balance": account["current_balance"],
+                "daily_spend_mean": round(float(daily_mean[index]), 2),
+                "daily_spend_std": round(float(daily_std[index]), 2),
+                "balances": np.round(balances[index], 2).tolist(),
+                "low": np.round(low[index], 2).tolist(),
+                "high": np.round(high[index], 2).tolist(),
+            }
+            for index, account in enumerate(accounts)
+        ],
+    }
+
+
+def get_cash_flow_forecast(user, days: int) -> dict:
+    """
+    Return the user's cash-flow forecast, computing it only on a cache miss.
+    """
+    today = date.today()
+    key = _forecast_key(user.pk, days, today)
+
+    forecast = cache.get(key)
+    if forecast is None:
+        forecast = project_cash_flow(user, days, today)
+        cache.set(key, forecast, settings.CASH_FLOW_FORECAST_CACHE_TIMEOUT)
+
+    return forecast
@@ -0,0 +1,106 @@
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+MAX_KEY_LENGTH = 255
+
+# Seconds between checks of a request still in flight under the same key
+POLL_INTERVAL = 0.1
+
+
+def _cache_key(request, key: str) -> str:
+    # Hashed, as clients choose the key and cache servers such as Memcached
+    # take keys of up to 250 characters without spaces or control characters
+    digest = hashlib.sha256(f"{request.path}:{key}".encode()).hexdigest()
+    return f"idempotency:{request.user.pk}:{digest}"
+
+
+def _fingerprint(request) -> str:
+    body = json.dumps(request.data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def _replay(entry: dict) -> Response:
+    return Response(
+        entry["data"], status=entry["status"], headers={"Idempotent-Replayed": "true"}
+    )
+
+
+def idempotent(post):
+    """
+    Make a view's POST handler idempotent under the Idempotency-Key header.
+
+    The first request with a key runs the handler and its response is kept
+    in the default cache, shared by every worker, for IDEMPOTENCY_KEY_SECONDS.
+    Requests repeating the key get the kept response back, or wait up to
+    IDEMPOTENCY_WAIT_SECONDS for the first one to finish, instead of calling
+    Plaid and writing again. Server errors are not kept, so a retry after one
+    runs the handler again. Requests without the header are handled as before.
+    """
+
+    @functools.wraps(post)
+    def handler(self, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return post(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response(
+                "Idempotency-Key Too Long", status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cache_key = _cache_key(request, key)
+        fingerprint = _fingerprint(request)
+        deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+
+        while not cache.add(
+            cache_key,
+            {"fingerprint": fingerprint, "status": None},
+            settings.IDEMPOTENCY_LOCK_SECONDS,
+        ):
+            entry = cache.get(cache_key)
+            if entry is None:
+                # The first request failed or its entry expired, claim the key
+                continue
+            if entry["fingerprint"] != fingerprint:
+                return Response(
+                    "Idempotency-Key Used for a Different Request",
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if entry["status"] is not None:
+                return _replay(entry)
+            if time.monotonic() > deadline:
+                return Response(
+                    "Request With Idempotency-Key In Progress",
+                    status=status.HTTP_409_CONFLICT,
+                )
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = post(self, request, *args, **kwargs)
+        except BaseException:
+            cache.delete(cache_key)
+            raise
+
+        if response.status_code >= 500:
+            cache.delete(cache_key)
+            return response
+
+        # Serializer output keeps references to its serializer, store plain JSON
+        data = json.loads(JSONRenderer().render(response.data) or "null")
+        cache.set(
+            cache_key,
+            {"fingerprint": fingerprint, "status": response.status_code, "data": data},
+            settings.IDEMPOTENCY_KEY_SECONDS,
+        )
+
+        return response
+
+    return handler
@@ -0,0 +1,40 @@
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from personalFinanceAppBackend.api.archive import archive_transactions
+from personalFinanceAppBackend.core.routers import use_shard
+
+
+class Command(BaseCommand):
+    help = "Move old transactions out of the transaction table into archives"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=settings.TRANSACTION_ARCHIVE_AGE_DAYS,
+            help="Archive transactions older than this many days",
+        )
+
+    def handle(self, *args, **options):
+        days = options["older_than_days"]
+        if days < settings.TRANSACTION_ARCHIVE_AGE_DAYS:
+            # Reads only look for archived rows older than the configured age
+            raise CommandError(
+                "--older-than-days must be at least TRANSACTION_ARCHIVE_AGE_DAYS "
+                f"({settings.TRANSACTION_ARCHIVE_AGE_DAYS})"
+            )
+        before = date.today() - timedelta(days=days)
+
+        for shard in settings.DATABASE_SHARDS:
+            with use_shard(shard):
+                archived_count = archive_transactions(before)
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{shard}: archived {archived_count} transactions "
+                    f"dated before {before}"
+                )
+            )
@@ -0,0 +1,130 @@
+import json
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+PROJECT_DIR = Path(__file__).resolve().parents[4]
+
+# Commands whose startup is measured, each run in a fresh interpreter
+TARGETS = {
+    "check": ["manage.py", "check"],
+    # The URLconf is loaded too, as on the first request a worker serves
+    "wsgi": [
+        "-c",
+        "from personalFinanceAppBackend.core.wsgi import application; "
+        "from django.urls import get_resolver; get_resolver().url_patterns",
+    ],
+}
+
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+def parse_import_times(output: str) -> dict:
+    """
+    Parse the report of python -X importtime.
+
+    Returns:
+        Dictionary of top level module name to cumulative import seconds
+    """
+    modules = {}
+    for line in output.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match and not match.group(3):
+            modules[match.group(4)] = int(match.group(2)) / 1_000_000
+    return modules
+
+
+def measure(arguments: list) -> tuple:
+    """
+    Run a Python command with -X importtime in a new process.
+
+    Returns:
+        Seconds the process took and its top level import times
+    """
+    start = time.perf_counter()
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", *arguments],
+        cwd=PROJECT_DIR,
+        capture_output=True,
+        text=True,
+    )
+    seconds = time.perf_counter() - start
+
+    if process.returncode != 0:
+        raise CommandError(
+            f"{' '.join(arguments)} failed: {process.stderr.strip()[-2000:]}"
+        )
+
+    return seconds, parse_import_times(process.stderr)
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the cold start time of manage.py check and of the WSGI app, "
+        "and list the imports taking the longest"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--repeat", type=int, default=5, help="Number of runs of each target"
+        )
+        parser.add_argument(
+            "--top", type=int, default=10, help="Number of slowest imports listed"
+        )
+        parser.add_argument(
+            "--max-seconds",
+            type=float,
+            help="Fail if the median start time of a target exceeds this",
+        )
+        parser.add_argument(
+            "--json", help="Write the results to this file to track them over time"
+        )
+
+    def handle(self, *args, **options):
+        results = {}
+        for name, arguments in TARGETS.items():
+            runs = [measure(arguments) for _ in range(options["repeat"])]
+            wall_times = [seconds for seconds, _ in runs]
+            # The imports of the median run are representative of the rest
+            _, modules = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+
+            results[name] = {
+                "median_seconds": round(statistics.median(wall_times), 4),
+                "min_seconds": round(min(wall_times), 4),
+                "import_seconds": round(sum(modules.values()), 4),
+                "slowest_imports": {
+                    module: round(seconds, 4)
+                    for module, seconds in sorted(
+                        modules.items(), key=lambda item: item[1], reverse=True
+                    )[: options["top"]]
+                },
+            }
+
+            self.stdout.write(
+                f"{name}: median {results[name]['median_seconds']:.3f}s, "
+                f"min {results[name]['min_seconds']:.3f}s, "
+                f"imports {results[name]['import_seconds']:.3f}s"
+            )
+            for module, seconds in results[name]["slowest_imports"].items():
+                self.stdout.write(f"  {seconds * 1000:8.1f} ms  {module}")
+
+        if options["json"]:
+            Path(options["json"]).write_text(json.dumps(results, indent=2))
+
+        if options["max_seconds"] is not None:
+            slow = [
+                name
+                for name, result in results.items()
+                if result["median_seconds"] > options["max_seconds"]
+            ]
+            if slow:
+                raise CommandError(
+                    f"Start time over {options['max_seconds']}s: {', '.join(slow)}"
+                )
+
+        self.stdout.write(self.style.SUCCESS("Startup benchmark finished"))
@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from personalFinanceAppBackend.api.anomalies import detect_anomalies
+from personalFinanceAppBackend.core.routers import use_shard
+
+
+class Command(BaseCommand):
+    help = "Flag unusual transactions added since the last anomaly detection run"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=20000,
+            help="Number of transactions processed per chunk",
+        )
+
+    def handle(self, *args, **options):
+        # Every shard keeps its own checkpoint next to its transactions
+        for shard in settings.DATABASE_SHARDS:
+            with use_shard(shard):
+                run = detect_anomalies(chunk_size=options["chunk_size"])
+
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{shard}: processed {run.transactions_processed} transactions, "
+                    f"found {run.anomalies_found} anomalies "
+                    f"(checkpoint {run.last_transaction_pk})"
+                )
+            )
@@ -0,0 +1,108 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from personalFinanceAppBackend.api.sharding import move_user, shard_sizes
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        "Move users between shards until every shard holds about as many "
+        "transactions, or move a single user with --user and --to"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="Id of a user to move")
+        parser.add_argument("--to", help="Alias of the shard to move the user to")
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.1,
+            help="Accepted difference between shards, as a share of the average",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the planned moves without moving any data",
+        )
+
+    def handle(self, *args, **options):
+        if options["user"] is not None or options["to"] is not None:
+            moves = self.plan_user_move(options["user"], options["to"])
+        else:
+            moves = self.plan_rebalance(options["tolerance"])
+
+        for user_id, source, target, rows in moves:
+            self.stdout.write(
+                f"Moving user {user_id} ({rows} transactions) "
+                f"from {source} to {target}"
+            )
+            if not options["dry_run"]:
+                move_user(User.objects.get(pk=user_id), target)
+
+        self.stdout.write(self.style.SUCCESS(f"Planned {len(moves)} moves"))
+
+    def plan_user_move(self, user_id, target) -> list:
+        if user_id is None or target is None:
+            raise CommandError("--user and --to must be given together")
+        if target not in settings.DATABASE_SHARDS:
+            raise CommandError(f"{target} is not listed in DATABASE_SHARDS")
+
+        try:
+            user = User.objects.get(pk=user_id)
+        except User.DoesNotExist:
+            raise CommandError(f"User {user_id} does not exist")
+
+        source = user.shard or "default"
+        if source == target:
+            return []
+        rows = shard_sizes([source])[source].get(user.pk, 0)
+        return [(user.pk, source, target, rows)]
+
+    def plan_rebalance(self, tolerance: float) -> list:
+        """
+        Greedily move the user of the fullest shard that best evens it out
+        with the emptiest shard, until their gap is within tolerance.
+        """
+        shards = settings.DATABASE_SHARDS
+        if len(shards) < 2:
+            return []
+
+        user_shards = dict(User.objects.values_list("pk", "shard"))
+        users = {shard: {} for shard in shards}
+        for shard, sizes in shard_sizes(shards).items():
+            for user_id, rows in sizes.items():
+                # Rows left behind by an interrupted move are not the user's
+                if (user_shards.get(user_id) or "default") == shard:
+                    users[shard][user_id] = rows
+
+        totals = {shard: sum(users[shard].values()) for shard in shards}
+        allowed_gap = tolerance * sum(totals.values()) / len(shards)
+
+        moves = []
+        while True:
+            fullest = max(shards, key=totals.get)
+            emptiest = min(shards, key=totals.get)
+            gap = totals[fullest] - totals[emptiest]
+            if gap <= allowed_gap:
+                break
+
+            # Moving fewer rows than the gap always narrows it
+            candidates = [
+                (abs(gap - 2 * rows), user_id, rows)
+                for user_id, rows in users[fullest].items()
+                if 0 < rows < gap
+            ]
+            if not candidates:
+                break
+
+            _, user_id, rows = min(candidates)
+            del users[fullest][user_id]
+            users[emptiest][user_id] = rows
+            totals[fullest] -= rows
+            totals[emptiest] += rows
+            moves.append((user_id, fullest, emptiest, rows))
+
+        return moves
@@ -0,0 +1,101 @@
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from personalFinanceAppBackend.api.categorization import CategorizationMatcher
+from personalFinanceAppBackend.api.forecasting import invalidate_cash_flow_forecast
+from personalFinanceAppBackend.api.models import Item
+from personalFinanceAppBackend.api.payloads import load_payloads
+from personalFinanceAppBackend.api.sync import (
+    PRODUCTS,
+    apply_transaction_changes,
+    coalesced_sync,
+    ingest_accounts,
+    ingest_investments,
+    ingest_transactions,
+)
+from personalFinanceAppBackend.core.log import log_context
+from personalFinanceAppBackend.core.routers import use_shard
+
+
+def replay_accounts(item, pages: list) -> int:
+    rows = len(ingest_accounts(item, pages[0]["response"]["accounts"]))
+    invalidate_cash_flow_forecast(item.user_id)
+    return rows
+
+
+def replay_transactions(item, pages: list) -> int:
+    request = pages[0]["request"]
+    saved_transactions, removed_transactions = ingest_transactions(
+        item,
+        CategorizationMatcher.for_user(item.user_id),
+        [
+            transaction
+            for page in pages
+            for transaction in page["response"]["transactions"]
+        ],
+        request["start_date"],
+        request["end_date"],
+    )
+    apply_transaction_changes(item.user, saved_transactions, removed_transactions)
+    return len(saved_transactions)
+
+
+def replay_investments(item, pages: list) -> int:
+    response = pages[0]["response"]
+    return len(ingest_investments(item, response["holdings"], response["securities"]))
+
+
+REPLAYS = {
+    "accounts": replay_accounts,
+    "transactions": replay_transactions,
+    "investments": replay_investments,
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the cleaning and ingest of the stored raw Plaid responses again, "
+        "without calling Plaid"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--products",
+            nargs="+",
+            choices=PRODUCTS,
+            default=list(PRODUCTS),
+            help="Products to replay, in this order",
+        )
+        parser.add_argument("--user", type=int, help="Only replay this user's Items")
+
+    def handle(self, *args, **options):
+        items = 0
+        rows = Counter()
+        for shard in settings.DATABASE_SHARDS:
+            with use_shard(shard):
+                shard_items = Item.objects.order_by("pk")
+                if options["user"] is not None:
+                    shard_items = shard_items.filter(user=options["user"])
+
+                for item in shard_items:
+                    items += 1
+                    with log_context(item_id=item.pk):
+                        for product in options["products"]:
+                            pages = load_payloads(item, product)
+                            if not pages:
+                                continue
+                            # Waits for a sync of the product running meanwhile
+                            saved, _ = coalesced_sync(
+                                product,
+                                item,
+                                REPLAYS[product],
+                                pages,
+                                params="replay",
+                            )
+                            rows[product] += saved
+
+        for product in options["products"]:
+            self.stdout.write(f"  {product}: {rows[product]} new rows")
+        self.stdout.write(self.style.SUCCESS(f"Replayed {items} Items"))
@@ -0,0 +1,192 @@
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from personalFinanceAppBackend.api.reprocessing import (
+    SOURCES,
+    chunk_ranges,
+    refresh_recurring_streams,
+    reprocess_chunk,
+)
+from personalFinanceAppBackend.core.routers import use_shard
+
+from .sync_all import _init_worker
+
+DEFAULT_CHECKPOINT_FILE = (
+    Path(tempfile.gettempdir()) / "personal_finance_reprocess.jsonl"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Clean stored transactions again, from their own fields or from the "
+        "stored raw Plaid payloads, in primary key chunks over a pool of "
+        "worker processes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--source",
+            choices=SOURCES,
+            default="transactions",
+            help="Rows to clean again",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=5000,
+            help="Number of transactions per chunk",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes, 0 processes in this process",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip the chunks finished by the previous run",
+        )
+        parser.add_argument(
+            "--checkpoint-file",
+            default=str(DEFAULT_CHECKPOINT_FILE),
+            help="File recording the finished chunks for --resume",
+        )
+        parser.add_argument(
+            "--progress-every",
+            type=int,
+            default=20,
+            help="Report progress every this many chunks",
+        )
+        parser.add_argument("--report", help="Write a JSON summary to this file")
+
+    def handle(self, *args, **options):
+        source = options["source"]
+        checkpoint_file = Path(options["checkpoint_file"])
+        finished = set()
+        # Merchants changed per shard and user id, whose streams are updated last
+        merchants = {}
+        if options["resume"] and checkpoint_file.exists():
+            with checkpoint_file.open() as checkpoint:
+                for line in checkpoint:
+                    if line.strip():
+                        chunk = json.loads(line)
+                        finished.add(tuple(chunk["chunk"]))
+                        self.add_merchants(
+                            merchants, chunk["shard"], chunk["merchants"]
+                        )
+        else:
+            checkpoint_file.write_text("")
+
+        tasks = []
+        for shard in settings.DATABASE_SHARDS:
+            with use_shard(shard):
+                ranges = chunk_ranges(source, options["chunk_size"])
+            tasks.extend(
+                (source, shard, start, end)
+                for start, end in ranges
+                if (source, shard, start) not in finished
+            )
+        self.stdout.write(
+            f"Reprocessing {len(tasks)} chunks of {source} "
+            f"with {options['workers']} workers"
+        )
+
+        start = time.perf_counter()
+        results = []
+        with checkpoint_file.open("a") as checkpoint:
+            try:
+                for result in self.run_tasks(tasks, options["workers"]):
+                    results.append(result)
+                    self.add_merchants(merchants, result["shard"], result["merchants"])
+                    # Chunks finish out of order, each one is recorded
+                    checkpoint.write(
+                        json.dumps(
+                            {
+                                "chunk": [source, result["shard"], result["start"]],
+                                "shard": result["shard"],
+                                "merchants": result["merchants"],
+                            }
+                        )
+                    )
+                    checkpoint.write("\n")
+                    checkpoint.flush()
+
+                    if len(results) % options["progress_every"] == 0:
+                        self.report_progress(results, len(tasks), start)
+            except KeyboardInterrupt:
+                self.stderr.write("Interrupted, continue with --resume")
+                return
+
+        seconds = time.perf_counter() - start
+        for shard, shard_merchants in merchants.items():
+            refresh_recurring_streams(shard, shard_merchants)
+
+        rows = sum(result["rows"] for result in results)
+        updated = sum(result["updated"] for result in results)
+        summary = {
+            "source": source,
+            "chunks": len(results),
+            "chunks_pending": len(tasks) - len(results),
+            "rows": rows,
+            "updated": updated,
+            "seconds": round(seconds, 2),
+            "rows_per_second": round(rows / seconds, 1) if seconds else 0,
+        }
+        if options["report"]:
+            Path(options["report"]).write_text(json.dumps(summary, indent=2))
+
+        self.stdout.write(
+            f"Processed {rows} rows in {seconds:.1f}s "
+            f"({summary['rows_per_second']:.0f} rows/s), updated {updated} transactions"
+        )
+        self.stdout.write(self.style.SUCCESS("Reprocessing finished"))
+
+    def add_merchants(self, merchants: dict, shard: str, changed: dict):
+        for user_id, user_merchants in changed.items():
+            # User ids read back from the checkpoint file are strings
+            merchants.setdefault(shard, {}).setdefault(int(user_id), set()).update(
+                user_merchants
+            )
+
+    def run_tasks(self, tasks: list, workers: int):
+        """
+        Yield the result of every chunk as soon as it is finished.
+        """
+        if workers <= 0:
+            for task in tasks:
+                yield reprocess_chunk(*task)
+            return
+
+        # Every worker opens and keeps its own connections, none may share
+        # a connection inherited from this process
+        connections.close_all()
+
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker
+        ) as executor:
+            futures = [executor.submit(reprocess_chunk, *task) for task in tasks]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def report_progress(self, results: list, total: int, start: float):
+        elapsed = time.perf_counter() - start
+        rows = sum(result["rows"] for result in results)
+        rate = len(results) / elapsed if elapsed else 0
+        remaining = (total - len(results)) / rate if rate else 0
+        self.stdout.write(
+            f"[{len(results)}/{total}] {rows / elapsed if elapsed else 0:.0f} rows/s, "
+            f"{remaining:.0f}s left"
+        )
@@ -0,0 +1,244 @@
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from personalFinanceAppBackend.api.models import Item
+from personalFinanceAppBackend.api.sync import PRODUCTS, sync_item
+
+DEFAULT_STATE_FILE = Path(tempfile.gettempdir()) / "personal_finance_sync_all.jsonl"
+
+
+def _init_worker(client_rate=None):
+    import django
+    from django.apps import apps
+
+    # Forked workers inherit the set up apps, spawned ones start from scratch
+    if not apps.ready:
+        django.setup()
+
+    if client_rate is not None:
+        settings.PLAID_CLIENT_RATE_PER_MINUTE, settings.PLAID_CLIENT_RATE_BURST = (
+            client_rate
+        )
+
+
+def worker_client_rate(workers: int):
+    """
+    Return the Plaid client rate and burst of each of several workers, when
+    their rate limit buckets are kept in a process-local cache.
+
+    Every worker then keeps its own client bucket, so each gets its share
+    of the client rate. Items are synced by one worker each, so their
+    buckets need no share.
+
+    Returns:
+        (rate per minute, burst) of a worker, None when workers share buckets
+    """
+    backend = settings.CACHES[settings.PLAID_RATE_LIMIT_CACHE]["BACKEND"]
+    if (
+        workers <= 1
+        or not settings.PLAID_RATE_LIMIT_ENABLED
+        or backend not in settings.PROCESS_LOCAL_CACHE_BACKENDS
+    ):
+        return None
+    return (
+        settings.PLAID_CLIENT_RATE_PER_MINUTE / workers,
+        max(1, settings.PLAID_CLIENT_RATE_BURST // workers),
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Sync the accounts, transactions and holdings of every Item from Plaid "
+        "over a pool of worker processes"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of worker processes, 0 syncs in this process",
+        )
+        parser.add_argument(
+            "--products",
+            nargs="+",
+            choices=PRODUCTS,
+            default=list(PRODUCTS),
+            help="Products to sync",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=30,
+            help="Number of days of transactions to sync",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip the Items synced by the previous run",
+        )
+        parser.add_argument(
+            "--state-file",
+            default=str(DEFAULT_STATE_FILE),
+            help="File recording the synced Items for --resume",
+        )
+        parser.add_argument(
+            "--progress-every",
+            type=int,
+            default=100,
+            help="Report progress every this many Items",
+        )
+        parser.add_argument("--report", help="Write a JSON summary to this file")
+
+    def handle(self, *args, **options):
+        state_file = Path(options["state_file"])
+        synced = set()
+        if options["resume"] and state_file.exists():
+            with state_file.open() as state:
+                synced = {tuple(json.loads(line)) for line in state if line.strip()}
+        else:
+            state_file.write_text("")
+
+        items = [
+            (shard, item_pk)
+            for shard in settings.DATABASE_SHARDS
+            for item_pk in Item.objects.using(shard)
+            .order_by("pk")
+            .values_list("pk", flat=True)
+        ]
+        pending = [item for item in items if item not in synced]
+        self.stdout.write(
+            f"Syncing {len(pending)} of {len(items)} Items "
+            f"with {options['workers']} workers"
+        )
+
+        end_date = date.today()
+        start_date = end_date - timedelta(days=options["days"])
+        tasks = [
+            (shard, item_pk, options["products"], start_date, end_date)
+            for shard, item_pk in pending
+        ]
+
+        start = time.perf_counter()
+        results = []
+        with state_file.open("a") as state:
+            try:
+                for result in self.run_tasks(tasks, options["workers"]):
+                    results.append(result)
+                    # Failed Items are synced again on resume
+                    if not any(
+                        "error" in outcome for outcome in result["products"].values()
+                    ):
+                        state.write(json.dumps([result["shard"], result["item"]]))
+                        state.write("\n")
+                        state.flush()
+
+                    if len(results) % options["progress_every"] == 0:
+                        self.report_progress(results, len(tasks), start)
+            except KeyboardInterrupt:
+                self.stderr.write("Interrupted, continue with --resume")
+
+        summary = self.summarize(results, len(tasks), time.perf_counter() - start)
+        if options["report"]:
+            Path(options["report"]).write_text(json.dumps(summary, indent=2))
+
+    def run_tasks(self, tasks: list, workers: int):
+        """
+        Yield the result of every task as soon as it is finished.
+        """
+        if workers <= 0:
+            for task in tasks:
+                yield sync_item(*task)
+            return
+
+        client_rate = worker_client_rate(workers)
+        if client_rate is not None:
+            self.stderr.write(
+                self.style.WARNING(
+                    f"{settings.PLAID_RATE_LIMIT_CACHE} is a process-local cache, "
+                    f"each worker is limited to {client_rate[0]:g} Plaid calls "
+                    "per minute"
+                )
+            )
+
+        # Every worker opens and keeps its own connections, none may share
+        # a connection inherited from this process
+        connections.close_all()
+
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker, initargs=(client_rate,)
+        ) as executor:
+            futures = [executor.submit(sync_item, *task) for task in tasks]
+            try:
+                for future in as_completed(futures):
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def report_progress(self, results: list, total: int, start: float):
+        elapsed = time.perf_counter() - start
+        rate = len(results) / elapsed if elapsed else 0
+        failed = sum(
+            any("error" in outcome for outcome in result["products"].values())
+            for result in results
+        )
+        remaining = (total - len(results)) / rate if rate else 0
+        self.stdout.write(
+            f"[{len(results)}/{total}] {rate:.1f} Items/s, {failed} failed, "
+            f"{remaining:.0f}s left"
+        )
+
+    def summarize(self, results: list, total: int, seconds: float) -> dict:
+        products = {}
+        errors = Counter()
+        failed_items = []
+        for result in results:
+            for product, outcome in result["products"].items():
+                counts = products.setdefault(
+                    product, {"synced": 0, "failed": 0, "rows": 0}
+                )
+                if "error" in outcome:
+                    counts["failed"] += 1
+                    errors[f"{product}: {outcome['error']}"] += 1
+                else:
+                    counts["synced"] += 1
+                    counts["rows"] += outcome["rows"]
+            if any("error" in outcome for outcome in result["products"].values()):
+                failed_items.append([result["shard"], result["item"]])
+
+        summary = {
+            "items": len(results),
+            "items_pending": total - len(results),
+            "seconds": round(seconds, 2),
+            "products": products,
+            "errors": dict(errors.most_common()),
+            "failed_items": failed_items,
+        }
+
+        self.stdout.write(
+            f"Synced {len(results)} of {total} Items in {seconds:.1f}s "
+            f"({len(failed_items)} with errors)"
+        )
+        for product, counts in products.items():
+            self.stdout.write(
+                f"  {product}: {counts['synced']} synced, {counts['failed']} failed, "
+                f"{counts['rows']} new rows"
+            )
+        for error, count in errors.most_common(10):
+            self.stdout.write(f"  {count} x {error}")
+
+        style = self.style.WARNING if failed_items else self.style.SUCCESS
+        self.stdout.write(style("Sync finished"))
+
+        return summary
@@ -0,0 +1,41 @@
+from personalFinanceAppBackend.core.metrics import Counter, Histogram
+
+PLAID_REQUEST_DURATION = Histogram(
+    "plaid_request_duration_seconds",
+    "Latency of Plaid API calls.",
+    ("method", "institution"),
+)
+
+PLAID_REQUESTS = Counter(
+    "plaid_requests_total",
+    "Plaid API calls by result, the Plaid error code for failed calls.",
+    ("method", "institution", "result"),
+)
+
+PLAID_RATE_LIMIT_WAIT = Histogram(
+    "plaid_rate_limit_wait_seconds",
+    "Time Plaid API calls waited for a rate limit token.",
+    ("bucket",),
+    buckets=(0.0, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0),
+)
+
+PLAID_ROWS_RETURNED = Counter(
+    "plaid_rows_returned_total",
+    "Rows returned by Plaid API calls.",
+    ("method", "kind"),
+)
+
+INGEST_ROWS = Counter(
+    "ingest_rows_total",
+    "Plaid rows by ingest stage: cleaned, dropped, inserted, skipped or removed.",
+    ("kind", "stage"),
+)
+
+
+def record_ingest(kind: str, **stages) -> None:
+    """
+    Count the rows of one ingest batch, e.g. record_ingest("accounts", inserted=3).
+    """
+    for stage, count in stages.items():
+        if count:
+            INGEST_ROWS.inc(count, kind=kind, stage=stage)
@@ -0,0 +1,56 @@
+# Generated by Django 5.1.2 on 2026-10-19 12:56
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0023_alter_investment_security_id_and_more"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="CategorizationRule",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("name_contains", models.CharField(blank=True, max_length=100)),
+                ("name_regex", models.CharField(blank=True, max_length=200)),
+                ("min_amount", models.FloatField(blank=True, null=True)),
+                ("max_amount", models.FloatField(blank=True, null=True)),
+                ("primary_category", models.CharField(max_length=100)),
+                ("detailed_category", models.CharField(blank=True, max_length=100)),
+                ("priority", models.IntegerField(default=0)),
+                (
+                    "account",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="api.account",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["priority", "id"],
+            },
+        ),
+    ]
@@ -0,0 +1,106 @@
+# Generated by Django 5.1.2 on 2026-10-19 12:58
+
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Copied from api.recurring as of this migration, so later changes to the
+# merchant normalization do not change what the migration does
+_MERCHANT_NOISE = re.compile(r"[^a-z ]+|\b\w*\d\w*\b")
+_MERCHANT_PREFIXES = re.compile(r"^(?:(?:sq|tst|pos|ach|debit|purchase|pp)\s+)+")
+
+
+def normalize_merchant(name):
+    merchant = _MERCHANT_NOISE.sub(" ", (name or "").lower())
+    merchant = " ".join(merchant.split())
+    merchant = _MERCHANT_PREFIXES.sub("", merchant)
+    return merchant[:100]
+
+
+def populate_transaction_merchant(apps, schema_editor):
+    Transaction = apps.get_model("api", "Transaction")
+
+    transactions = Transaction.objects.only("id", "name")
+    updated_transactions = []
+    for transaction in transactions.iterator(chunk_size=2000):
+        transaction.merchant = normalize_merchant(transaction.name)
+        updated_transactions.append(transaction)
+
+        if len(updated_transactions) >= 2000:
+            Transaction.objects.bulk_update(updated_transactions, ["merchant"])
+            updated_transactions = []
+
+    Transaction.objects.bulk_update(updated_transactions, ["merchant"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0024_categorizationrule"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="merchant",
+            field=models.CharField(blank=True, db_index=True, max_length=100),
+        ),
+        migrations.RunPython(populate_transaction_merchant, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="RecurringStream",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("merchant", models.CharField(max_length=100)),
+                ("description", models.CharField(blank=True, max_length=100)),
+                (
+                    "frequency",
+                    models.CharField(
+                        choices=[
+                            ("weekly", "Weekly"),
+                            ("biweekly", "Biweekly"),
+                            ("monthly", "Monthly"),
+                            ("annually", "Annually"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("average_amount", models.FloatField()),
+                ("interval_days", models.FloatField()),
+                ("transaction_count", models.IntegerField()),
+                ("first_date", models.DateField()),
+                ("last_date", models.DateField()),
+                ("next_date", models.DateField()),
+                (
+                    "account",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="api.account"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["user", "merchant"], name="recurring_user_merchant_idx"
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.2 on 2026-10-19 13:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0027_spendingstatistic_spendinganomaly_anomalydetectionrun"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="transaction",
+            name="pending",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name="transaction",
+            name="pending_transaction_id",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
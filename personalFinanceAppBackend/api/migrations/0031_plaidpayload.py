@@ -0,0 +1,46 @@
+# Generated by Django 5.1.2 on 2026-10-19 13:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0030_transactionarchive"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PlaidPayload",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("product", models.CharField(max_length=20)),
+                ("page", models.IntegerField()),
+                ("data", models.BinaryField()),
+                ("fetched_at", models.DateTimeField(auto_now=True)),
+                (
+                    "item",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, to="api.item"
+                    ),
+                ),
+            ],
+            options={
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("item", "product", "page"),
+                        name="item_product_page_unique_constraint",
+                    )
+                ],
+            },
+        ),
+    ]
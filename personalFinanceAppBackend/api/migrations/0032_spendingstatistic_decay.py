@@ -0,0 +1,28 @@
+# Generated by Django 5.1.2 on 2026-10-19 14:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0031_plaidpayload"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="spendingstatistic",
+            old_name="count",
+            new_name="weight",
+        ),
+        migrations.AlterField(
+            model_name="spendingstatistic",
+            name="weight",
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name="spendingstatistic",
+            name="as_of",
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -2,6 +2,9 @@ from django.db import models
 
 from personalFinanceAppBackend.users.models import User
 
+# Models of this app are stored in the shard of their user, see ShardRouter,
+# so their user foreign keys cannot be database constraints
+
 
 class Institution(models.Model):
     institution_id = models.CharField(max_length=100)
@@ -9,7 +12,7 @@ class Institution(models.Model):
 
 
 class Item(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
     institution = models.ForeignKey(Institution, on_delete=models.CASCADE)
     item_id = models.CharField(max_length=100)
     access_token = models.CharField(max_length=100)
@@ -55,11 +58,61 @@ class Transaction(models.Model):
     payment_channel = models.CharField(max_length=100, blank=True)
     primary_category = models.CharField(max_length=100, blank=True)
     detailed_category = models.CharField(max_length=100, blank=True)
+    merchant = models.CharField(max_length=100, blank=True, db_index=True)
+    pending = models.BooleanField(default=False)
+    pending_transaction_id = models.CharField(max_length=100, blank=True)
 
     def __str__(self):
         return self.transaction_id
 
 
+class TransactionArchive(models.Model):
+    """
+    Compressed transactions of a user in a year, moved out of the
+    Transaction table once older than TRANSACTION_ARCHIVE_AGE_DAYS.
+    """
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    year = models.IntegerField()
+    row_count = models.IntegerField(default=0)
+    data = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "year"], name="user_year_unique_constraint"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} ({self.year})"
+
+
+class PlaidPayload(models.Model):
+    """
+    Compressed raw response page of the latest Plaid fetch of a product of
+    an Item, kept for replaying the ingest without calling Plaid.
+    """
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE)
+    product = models.CharField(max_length=20)
+    page = models.IntegerField()
+    data = models.BinaryField()
+    fetched_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["item", "product", "page"],
+                name="item_product_page_unique_constraint",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} {self.product} ({self.page})"
+
+
 class Investment(models.Model):
     account = models.ForeignKey(Account, on_delete=models.CASCADE, blank=True)
     security_id = models.CharField(max_length=100)
@@ -77,3 +130,143 @@ class Investment(models.Model):
                 name="account_security_unique_constraint",
             )
         ]
+
+
+class CategorizationRule(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    account = models.ForeignKey(
+        Account, on_delete=models.CASCADE, blank=True, null=True
+    )
+    name_contains = models.CharField(max_length=100, blank=True)
+    name_regex = models.CharField(max_length=200, blank=True)
+    min_amount = models.FloatField(blank=True, null=True)
+    max_amount = models.FloatField(blank=True, null=True)
+    primary_category = models.CharField(max_length=100)
+    detailed_category = models.CharField(max_length=100, blank=True)
+    priority = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ["priority", "id"]
+
+    def __str__(self):
+        return f"{self.primary_category} ({self.priority})"
+
+
+class RecurringStream(models.Model):
+    WEEKLY = "weekly"
+    BIWEEKLY = "biweekly"
+    MONTHLY = "monthly"
+    ANNUALLY = "annually"
+    FREQUENCY_CHOICES = [
+        (WEEKLY, "Weekly"),
+        (BIWEEKLY, "Biweekly"),
+        (MONTHLY, "Monthly"),
+        (ANNUALLY, "Annually"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    merchant = models.CharField(max_length=100)
+    description = models.CharField(max_length=100, blank=True)
+    frequency = models.CharField(max_length=20, choices=FREQUENCY_CHOICES)
+    average_amount = models.FloatField()
+    interval_days = models.FloatField()
+    transaction_count = models.IntegerField()
+    first_date = models.DateField()
+    last_date = models.DateField()
+    next_date = models.DateField()
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["user", "merchant"], name="recurring_user_merchant_idx"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.merchant} ({self.frequency})"
+
+
+class Budget(models.Model):
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+    YEARLY = "yearly"
+    PERIOD_CHOICES = [
+        (WEEKLY, "Weekly"),
+        (MONTHLY, "Monthly"),
+        (YEARLY, "Yearly"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    primary_category = models.CharField(max_length=100)
+    period = models.CharField(max_length=20, choices=PERIOD_CHOICES, default=MONTHLY)
+    amount_limit = models.FloatField()
+    period_start = models.DateField()
+    spent = models.FloatField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "primary_category", "period"],
+                name="user_category_period_unique_constraint",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.primary_category} ({self.period})"
+
+
+class SpendingStatistic(models.Model):
+    CATEGORY = "category"
+    MERCHANT = "merchant"
+    KIND_CHOICES = [(CATEGORY, "Category"), (MERCHANT, "Merchant")]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    key = models.CharField(max_length=100, blank=True)
+    # Number of transactions, each decayed by its age on as_of
+    weight = models.FloatField(default=0)
+    mean = models.FloatField(default=0)
+    m2 = models.FloatField(default=0)
+    as_of = models.DateField(blank=True, null=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "kind", "key"],
+                name="user_kind_key_unique_constraint",
+            )
+        ]
+
+
+class SpendingAnomaly(models.Model):
+    AMOUNT_OUTLIER = "amount_outlier"
+    NEW_MERCHANT = "new_merchant"
+    DUPLICATE_CHARGE = "duplicate_charge"
+    ANOMALY_TYPE_CHOICES = [
+        (AMOUNT_OUTLIER, "Amount Outlier"),
+        (NEW_MERCHANT, "New Merchant"),
+        (DUPLICATE_CHARGE, "Duplicate Charge"),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_constraint=False)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE)
+    anomaly_type = models.CharField(max_length=20, choices=ANOMALY_TYPE_CHOICES)
+    score = models.FloatField(blank=True, null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["transaction", "anomaly_type"],
+                name="transaction_anomaly_type_unique_constraint",
+            )
+        ]
+
+
+class AnomalyDetectionRun(models.Model):
+    last_transaction_pk = models.BigIntegerField(default=0)
+    transactions_processed = models.IntegerField(default=0)
+    anomalies_found = models.IntegerField(default=0)
+    started_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
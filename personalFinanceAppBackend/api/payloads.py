@@ -0,0 +1,84 @@
+import json
+import zlib
+from datetime import date
+
+from django.conf import settings
+
+from .models import PlaidPayload
+
+# Fields of Plaid responses holding dates, parsed back when pages are loaded
+DATE_FIELDS = {
+    "date",
+    "authorized_date",
+    "institution_price_as_of",
+    "close_price_as_of",
+}
+
+
+def compress_payload(payload: dict) -> bytes:
+    return zlib.compress(
+        json.dumps(payload, separators=(",", ":"), default=str).encode()
+    )
+
+
+def _parse_dates(fields: dict) -> dict:
+    for name in DATE_FIELDS & fields.keys():
+        if isinstance(fields[name], str):
+            fields[name] = date.fromisoformat(fields[name])
+    return fields
+
+
+def decompress_payload(data) -> dict:
+    return json.loads(zlib.decompress(bytes(data)), object_hook=_parse_dates)
+
+
+def save_payloads(item, product: str, pages: list, request: dict = None) -> None:
+    """
+    Store the raw response pages of a Plaid fetch, replacing the pages of
+    the Item's previous fetch of the product.
+
+    Args:
+        item: The Item fetched
+        product: The product fetched, out of sync.PRODUCTS
+        pages: Plaid responses of the fetch, in page order
+        request: Parameters of the fetch, e.g. its date range
+    """
+    if not settings.PLAID_PAYLOAD_ARCHIVE_ENABLED:
+        return
+
+    PlaidPayload.objects.bulk_create(
+        [
+            PlaidPayload(
+                item=item,
+                product=product,
+                page=page,
+                data=compress_payload(
+                    {"request": request or {}, "response": response.to_dict()}
+                ),
+            )
+            for page, response in enumerate(pages)
+        ],
+        update_conflicts=True,
+        unique_fields=["item", "product", "page"],
+        update_fields=["data", "fetched_at"],
+    )
+    # A previous fetch may have had more pages
+    PlaidPayload.objects.filter(
+        item=item, product=product, page__gte=len(pages)
+    ).delete()
+
+
+def load_payloads(item, product: str) -> list:
+    """
+    Return the stored pages of the latest Plaid fetch of a product of an Item.
+
+    Returns:
+        List of {"request", "response"} dictionaries in page order, empty
+        when the product was never fetched
+    """
+    return [
+        decompress_payload(data)
+        for data in PlaidPayload.objects.filter(item=item, product=product)
+        .order_by("page")
+        .values_list("data", flat=True)
+    ]
@@ -0,0 +1,206 @@
+import functools
+import json
+import os
+import time
+from logging import getLogger
+
+from django.conf import settings
+
+from personalFinanceAppBackend.core.instrumentation import record_plaid_call
+from personalFinanceAppBackend.core.ratelimit import (
+    CacheBucketStore,
+    LocalBucketStore,
+    RateLimiter,
+    TokenBucket,
+)
+
+from .metrics import (
+    PLAID_RATE_LIMIT_WAIT,
+    PLAID_REQUEST_DURATION,
+    PLAID_REQUESTS,
+    PLAID_ROWS_RETURNED,
+)
+
+logger = getLogger("personal_finance_app")
+
+# Response fields whose length is recorded as rows returned
+ROW_FIELDS = ("accounts", "transactions", "holdings", "securities")
+
+# Seconds before the first retry of a call Plaid rejected as rate limited,
+# doubled for every further retry
+RATE_LIMIT_BACKOFF = 1.0
+
+# Buckets used while the rate limit cache is unavailable
+local_buckets = LocalBucketStore()
+
+
+@functools.lru_cache(maxsize=None)
+def get_plaid_api():
+    """
+    Build the PlaidApi client on first use and return the same one after.
+
+    Importing the Plaid API module loads every Plaid model, so it is only
+    imported once a view actually calls Plaid.
+    """
+    from plaid.api import plaid_api
+    from plaid.api_client import ApiClient
+    from plaid.configuration import Configuration, Environment
+
+    if os.getenv("PLAID_ENV") == "production":
+        host = Environment.Production
+    else:
+        host = Environment.Sandbox
+
+    configuration = Configuration(
+        host=host,
+        api_key={
+            "clientId": os.getenv("PLAID_CLIENT_ID"),
+            "secret": os.getenv("PLAID_SECRET"),
+            "plaidVersion": "2020-09-14",
+        },
+    )
+
+    return plaid_api.PlaidApi(ApiClient(configuration))
+
+
+def error_result(error: Exception) -> str:
+    """
+    Return the Plaid error code of a failed call, or else the type of error.
+    """
+    from plaid.exceptions import ApiException
+
+    if isinstance(error, ApiException):
+        try:
+            return json.loads(error.body)["error_code"]
+        except (TypeError, ValueError, KeyError):
+            return f"http_{error.status}"
+    return type(error).__name__
+
+
+def is_rate_limited(error: Exception) -> bool:
+    return getattr(error, "status", None) == 429
+
+
+def wait_for_rate_limits(item_id: str | None = None) -> float:
+    """
+    Take a token of the Item's bucket, if given, then of the client's
+    bucket, sleeping until both can be used.
+
+    Returns:
+        The seconds slept
+    """
+    if not settings.PLAID_RATE_LIMIT_ENABLED:
+        return 0.0
+
+    rate_limiter = RateLimiter(
+        CacheBucketStore(settings.PLAID_RATE_LIMIT_CACHE), local_buckets
+    )
+    waited = 0.0
+    if item_id is not None:
+        wait = rate_limiter.acquire(
+            f"plaid_rate:item:{item_id}",
+            TokenBucket(
+                settings.PLAID_ITEM_RATE_PER_MINUTE / 60, settings.PLAID_ITEM_RATE_BURST
+            ),
+        )
+        PLAID_RATE_LIMIT_WAIT.observe(wait, bucket="item")
+        waited += wait
+
+    wait = rate_limiter.acquire(
+        "plaid_rate:client",
+        TokenBucket(
+            settings.PLAID_CLIENT_RATE_PER_MINUTE / 60, settings.PLAID_CLIENT_RATE_BURST
+        ),
+    )
+    PLAID_RATE_LIMIT_WAIT.observe(wait, bucket="client")
+    return waited + wait
+
+
+class InstrumentedPlaidClient:
+    """
+    Proxy of a PlaidApi client that rate limits and times every API call
+    it makes.
+
+    Each call waits for the client's rate limit, and for the Item's when
+    made through for_item. Calls Plaid still rejects as rate limited are
+    retried with backoff. Each call is added to the current request's
+    timings and recorded in the Plaid metrics, labelled with the institution
+    set by for_institution or for_item. Without a client, the one from
+    get_plaid_api is used once first called.
+    """
+
+    def __init__(
+        self, client=None, institution: str = "unknown", item_id: str | None = None
+    ):
+        self._client = client
+        self._institution = institution
+        self._item_id = item_id
+
+    def for_institution(self, institution_id: str) -> "InstrumentedPlaidClient":
+        return InstrumentedPlaidClient(self._client, institution_id)
+
+    def for_item(self, item) -> "InstrumentedPlaidClient":
+        """
+        Return a client for calls about an Item, limited by its rate limit.
+
+        Args:
+            item: The Item, with its institution selected
+        """
+        return InstrumentedPlaidClient(
+            self._client, item.institution.institution_id, item.item_id
+        )
+
+    def __getattr__(self, name):
+        client = self._client if self._client is not None else get_plaid_api()
+        attribute = getattr(client, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            retries = 0
+            while True:
+                wait_for_rate_limits(self._item_id)
+                try:
+                    response = self._timed_call(name, attribute, args, kwargs)
+                except Exception as e:
+                    if not is_rate_limited(e) or retries >= (
+                        settings.PLAID_RATE_LIMIT_RETRIES
+                    ):
+                        raise
+                    backoff = RATE_LIMIT_BACKOFF * 2**retries
+                    logger.warning(
+                        "Plaid rate limited %s, retrying in %ss", name, backoff
+                    )
+                    time.sleep(backoff)
+                    retries += 1
+                else:
+                    break
+
+            for field in ROW_FIELDS:
+                if field in response:
+                    PLAID_ROWS_RETURNED.inc(
+                        len(response[field]), method=name, kind=field
+                    )
+
+            return response
+
+        return call
+
+    def _timed_call(self, name: str, attribute, args, kwargs):
+        result = "ok"
+        start = time.perf_counter()
+        try:
+            return attribute(*args, **kwargs)
+        except Exception as e:
+            result = error_result(e)
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            record_plaid_call(duration)
+            PLAID_REQUEST_DURATION.observe(
+                duration, method=name, institution=self._institution
+            )
+            PLAID_REQUESTS.inc(
+                method=name, institution=self._institution, result=result
+            )
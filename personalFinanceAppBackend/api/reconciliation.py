@@ -0,0 +1,65 @@
+from datetime import date
+from logging import getLogger
+
+from .models import Transaction
+
+logger = getLogger("personal_finance_app")
+
+
+def reconcile_pending_transactions(
+    item, transactions: list, reported_ids: set, start_date, end_date
+) -> list:
+    """
+    Delete pending transactions that Plaid has since posted or dropped.
+
+    Plaid reports a posted transaction under a new transaction_id that
+    points back to its pending version through pending_transaction_id.
+    Pending rows referenced that way are replaced by the posted rows, and
+    pending rows inside the fetched date range that Plaid no longer
+    reports are stale and purged.
+
+    Args:
+        item: The Item whose transactions were fetched
+        transactions: List of cleaned transaction data fetched for the Item
+        reported_ids: Ids of every transaction Plaid reported, including
+            those cleaning dropped, e.g. for an unknown account
+        start_date: First day of the fetched date range
+        end_date: Last day of the fetched date range
+
+    Returns:
+        List of the deleted Transaction instances
+    """
+    posted_pending_ids = {
+        transaction["pending_transaction_id"]
+        for transaction in transactions
+        if not transaction["pending"] and transaction["pending_transaction_id"]
+    }
+    start_date = date.fromisoformat(str(start_date))
+    end_date = date.fromisoformat(str(end_date))
+
+    pending_transactions = Transaction.objects.filter(
+        account__item=item, pending=True
+    ).only("id", "transaction_id", "merchant", "primary_category", "date", "amount")
+
+    removed_transactions = [
+        transaction
+        for transaction in pending_transactions
+        if transaction.transaction_id in posted_pending_ids
+        or (
+            transaction.transaction_id not in reported_ids
+            and start_date <= transaction.date <= end_date
+        )
+    ]
+
+    if removed_transactions:
+        Transaction.objects.filter(
+            pk__in=[transaction.pk for transaction in removed_transactions]
+        ).delete()
+
+        logger.info(
+            "Removed %d posted or stale pending transactions for item %s",
+            len(removed_transactions),
+            item.pk,
+        )
+
+    return removed_transactions
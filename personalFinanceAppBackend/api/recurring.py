@@ -0,0 +1,244 @@
+import re
+from datetime import date, timedelta
+from logging import getLogger
+
+from django.db import router
+from django.db import transaction as db_transaction
+
+from .models import RecurringStream, Transaction
+
+logger = getLogger("personal_finance_app")
+
+# (frequency, expected interval in days, allowed deviation in days, minimum count)
+FREQUENCIES = [
+    (RecurringStream.WEEKLY, 7, 2, 3),
+    (RecurringStream.BIWEEKLY, 14, 2, 3),
+    (RecurringStream.MONTHLY, 30.44, 4, 3),
+    (RecurringStream.ANNUALLY, 365.25, 10, 2),
+]
+
+# Share of intervals that must match the frequency for a series to be periodic
+MIN_REGULARITY = 0.75
+
+# Consecutive amounts further apart than this (relative) start a new amount band
+AMOUNT_BAND_TOLERANCE = 0.2
+
+_MERCHANT_NOISE = re.compile(r"[^a-z ]+|\b\w*\d\w*\b")
+_MERCHANT_PREFIXES = re.compile(r"^(?:(?:sq|tst|pos|ach|debit|purchase|pp)\s+)+")
+
+
+def normalize_merchant(name: str) -> str:
+    """
+    Reduce a transaction name to a stable merchant key.
+
+    Store numbers, reference codes, punctuation and payment processor
+    prefixes are removed so that e.g. "SQ *BLUE BOTTLE #0421" and
+    "Blue Bottle 0388" share the key "blue bottle".
+    """
+    merchant = _MERCHANT_NOISE.sub(" ", (name or "").lower())
+    merchant = " ".join(merchant.split())
+    merchant = _MERCHANT_PREFIXES.sub("", merchant)
+    return merchant[:100]
+
+
+def _group_medians(values, groups, group_count: int):
+    """
+    Return the count and median of values for every group id in one pass.
+    """
+    import numpy as np
+
+    counts = np.bincount(groups, minlength=group_count)
+    medians = np.full(group_count, np.nan)
+
+    order = np.lexsort((values, groups))
+    sorted_values = values[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    present = counts > 0
+    low = starts[present] + (counts[present] - 1) // 2
+    high = starts[present] + counts[present] // 2
+    medians[present] = (sorted_values[low] + sorted_values[high]) / 2
+
+    return counts, medians
+
+
+def detect_recurring_streams(user, transactions: list) -> list:
+    """
+    Find periodic series among the given transactions.
+
+    Transactions are grouped by account, merchant and amount band, and the
+    intervals between consecutive dates of every group are analysed at
+    once with NumPy rather than group by group.
+
+    Args:
+        user: The user owning the transactions
+        transactions: List of (account_id, merchant, name, date, amount) tuples
+
+    Returns:
+        List of unsaved RecurringStream instances
+    """
+    import numpy as np
+
+    if not transactions:
+        return []
+
+    account_ids, merchants, names, dates, amounts = zip(*transactions)
+    amounts = np.asarray(amounts, dtype=float)
+    ordinals = np.fromiter((d.toordinal() for d in dates), dtype=np.int64)
+
+    # Group by (account, merchant), then split each group into amount bands
+    keys = list(zip(account_ids, merchants))
+    _, merchant_groups = np.unique(
+        np.array([f"{account}\x00{merchant}" for account, merchant in keys]),
+        return_inverse=True,
+    )
+
+    order = np.lexsort((amounts, merchant_groups))
+    sorted_amounts = amounts[order]
+    sorted_merchant_groups = merchant_groups[order]
+
+    new_band = np.ones(len(order), dtype=bool)
+    new_band[1:] = (
+        (sorted_merchant_groups[1:] != sorted_merchant_groups[:-1])
+        | (np.sign(sorted_amounts[1:]) != np.sign(sorted_amounts[:-1]))
+        | (
+            np.abs(sorted_amounts[1:] - sorted_amounts[:-1])
+            > np.maximum(1.0, AMOUNT_BAND_TOLERANCE * np.abs(sorted_amounts[:-1]))
+        )
+    )
+    groups = np.empty(len(order), dtype=np.int64)
+    groups[order] = np.cumsum(new_band) - 1
+    group_count = int(groups.max()) + 1
+
+    # Intervals between consecutive distinct dates within each group
+    order = np.lexsort((ordinals, groups))
+    sorted_groups = groups[order]
+    sorted_ordinals = ordinals[order]
+
+    intervals = np.diff(sorted_ordinals)
+    interval_groups = sorted_groups[1:]
+    keep = (sorted_groups[1:] == sorted_groups[:-1]) & (intervals > 0)
+    intervals = intervals[keep].astype(float)
+    interval_groups = interval_groups[keep]
+
+    interval_counts, median_intervals = _group_medians(
+        intervals, interval_groups, group_count
+    )
+
+    # Classify every group by its median interval
+    expected = np.full(group_count, np.nan)
+    tolerance = np.zeros(group_count)
+    minimum_count = np.zeros(group_count)
+    frequency_index = np.full(group_count, -1)
+    for index, (_, days, deviation, min_count) in enumerate(FREQUENCIES):
+        matches = (frequency_index == -1) & (
+            np.abs(median_intervals - days) <= deviation
+        )
+        expected[matches] = days
+        tolerance[matches] = deviation
+        minimum_count[matches] = min_count
+        frequency_index[matches] = index
+
+    on_schedule = (
+        np.abs(intervals - expected[interval_groups]) <= tolerance[interval_groups]
+    )
+    regular_counts = np.bincount(
+        interval_groups, weights=on_schedule, minlength=group_count
+    )
+    with np.errstate(invalid="ignore", divide="ignore"):
+        regularity = regular_counts / interval_counts
+
+    periodic = (
+        (frequency_index >= 0)
+        & (interval_counts + 1 >= minimum_count)
+        & (regularity >= MIN_REGULARITY)
+    )
+    if not periodic.any():
+        return []
+
+    transaction_counts = np.bincount(groups, minlength=group_count)
+    amount_totals = np.bincount(groups, weights=amounts, minlength=group_count)
+
+    # Rows are sorted by date within each group, so the group boundaries
+    # hold the first and latest transaction of every group
+    group_ends = np.flatnonzero(
+        np.append(sorted_groups[1:] != sorted_groups[:-1], True)
+    )
+    group_starts = np.append(0, group_ends[:-1] + 1)
+    first_ordinals = sorted_ordinals[group_starts]
+    last_ordinals = sorted_ordinals[group_ends]
+    last_rows = order[group_ends]
+
+    streams = []
+    for group in np.flatnonzero(periodic):
+        # The latest transaction supplies the stream's account and description
+        row = last_rows[group]
+        frequency = FREQUENCIES[frequency_index[group]][0]
+        last_date = date.fromordinal(int(last_ordinals[group]))
+        average_amount = amount_totals[group] / transaction_counts[group]
+
+        streams.append(
+            RecurringStream(
+                user=user,
+                account_id=account_ids[row],
+                merchant=merchants[row],
+                description=names[row],
+                frequency=frequency,
+                average_amount=round(float(average_amount), 2),
+                interval_days=float(median_intervals[group]),
+                transaction_count=int(transaction_counts[group]),
+                first_date=date.fromordinal(int(first_ordinals[group])),
+                last_date=last_date,
+                next_date=last_date
+                + timedelta(days=int(round(median_intervals[group]))),
+            )
+        )
+
+    return streams
+
+
+def update_recurring_streams(user, merchants=None) -> list:
+    """
+    Re-detect a user's recurring streams for the given merchants.
+
+    Only the transactions of the touched merchants are loaded, and only
+    their streams are replaced, so a sync does not recompute the user's
+    whole history.
+
+    Args:
+        user: The user whose streams should be updated
+        merchants: Normalized merchant keys with new transactions, or None
+            to recompute every merchant
+
+    Returns:
+        List of the saved RecurringStream instances
+    """
+    transactions = Transaction.objects.filter(account__item__user=user).exclude(
+        merchant=""
+    )
+    streams = RecurringStream.objects.filter(user=user)
+
+    if merchants is not None:
+        merchants = {merchant for merchant in merchants if merchant}
+        if not merchants:
+            return []
+        transactions = transactions.filter(merchant__in=merchants)
+        streams = streams.filter(merchant__in=merchants)
+
+    rows = list(
+        transactions.values_list("account_id", "merchant", "name", "date", "amount")
+    )
+    detected_streams = detect_recurring_streams(user, rows)
+
+    with db_transaction.atomic(using=router.db_for_write(RecurringStream)):
+        streams.delete()
+        RecurringStream.objects.bulk_create(detected_streams)
+
+    logger.info(
+        "Detected %d recurring streams from %d transactions for user %s",
+        len(detected_streams),
+        len(rows),
+        user.pk,
+    )
+
+    return detected_streams
@@ -0,0 +1,265 @@
+import time
+
+from django.db import router
+from django.db import transaction as db_transaction
+from django.db.models import F, Max, Min
+
+from personalFinanceAppBackend.core.routers import use_shard
+from personalFinanceAppBackend.users.models import User
+
+from .budgets import apply_budget_changes, budget_entry
+from .categorization import CategorizationMatcher
+from .forecasting import invalidate_cash_flow_forecast
+from .models import CategorizationRule, PlaidPayload, Transaction
+from .payloads import decompress_payload
+from .recurring import normalize_merchant, update_recurring_streams
+from .utils import clean_transaction_data
+
+SOURCES = ("transactions", "payloads")
+
+# Transactions per Plaid response page, to size chunks of payload pages
+PAYLOAD_PAGE_SIZE = 500
+
+# Transactions saved per UPDATE query
+WRITE_BATCH = 500
+
+# Fields of stored transactions rewritten from their own fields
+TRANSACTION_FIELDS = ["merchant", "primary_category", "detailed_category"]
+
+# Fields of stored transactions rewritten from a re-cleaned Plaid payload
+PAYLOAD_FIELDS = [
+    "amount",
+    "date",
+    "name",
+    "payment_channel",
+    "primary_category",
+    "detailed_category",
+    "merchant",
+    "pending",
+    "pending_transaction_id",
+]
+
+
+def source_model(source: str):
+    return PlaidPayload if source == "payloads" else Transaction
+
+
+def chunk_ranges(source: str, chunk_size: int) -> list:
+    """
+    Split the primary keys of a source on the current shard into ranges.
+
+    Ranges are fixed steps from the lowest to the highest primary key, so
+    gaps left by deleted rows only make chunks smaller.
+
+    Args:
+        source: The rows reprocessed, out of SOURCES
+        chunk_size: Transactions per chunk
+
+    Returns:
+        List of (start, end) primary key ranges, start excluded
+    """
+    model = source_model(source)
+    rows = model.objects.all()
+    if source == "payloads":
+        rows = rows.filter(product="transactions")
+        chunk_size = max(1, chunk_size // PAYLOAD_PAGE_SIZE)
+
+    bounds = rows.aggregate(first=Min("pk"), last=Max("pk"))
+    if bounds["first"] is None:
+        return []
+    return [
+        (start, min(start + chunk_size, bounds["last"]))
+        for start in range(bounds["first"] - 1, bounds["last"], chunk_size)
+    ]
+
+
+def _matchers(user_ids) -> dict:
+    """
+    Build the CategorizationMatcher of every user with one query.
+    """
+    rules = {}
+    for rule in CategorizationRule.objects.filter(user__in=user_ids):
+        rules.setdefault(rule.user_id, []).append(rule)
+    return {
+        user_id: CategorizationMatcher(rules.get(user_id, [])) for user_id in user_ids
+    }
+
+
+def _reprocess_transactions(start: int, end: int) -> tuple:
+    transactions = list(
+        Transaction.objects.filter(pk__gt=start, pk__lte=end)
+        .select_for_update(of=("self",))
+        .only(
+            "id",
+            "account_id",
+            "name",
+            "amount",
+            "date",
+            "merchant",
+            "primary_category",
+            "detailed_category",
+        )
+        .annotate(owner=F("account__item__user"))
+    )
+    matchers = _matchers({transaction.owner for transaction in transactions})
+
+    changes = []
+    for transaction in transactions:
+        before = (
+            transaction.merchant,
+            transaction.primary_category,
+            transaction.detailed_category,
+        )
+        entry = budget_entry(transaction)
+        transaction.merchant = normalize_merchant(transaction.name)
+        rule = matchers[transaction.owner].match(
+            transaction.name, transaction.amount, transaction.account_id
+        )
+        # Without a rule the category Plaid reported is kept
+        if rule is not None:
+            transaction.primary_category = rule.primary_category
+            transaction.detailed_category = rule.detailed_category
+
+        if before != (
+            transaction.merchant,
+            transaction.primary_category,
+            transaction.detailed_category,
+        ):
+            changes.append((transaction.owner, before[0], entry, transaction))
+
+    return len(transactions), changes, TRANSACTION_FIELDS
+
+
+def _reprocess_payloads(start: int, end: int) -> tuple:
+    payloads = list(
+        PlaidPayload.objects.filter(
+            pk__gt=start, pk__lte=end, product="transactions"
+        ).annotate(owner=F("item__user"))
+    )
+    matchers = _matchers({payload.owner for payload in payloads})
+
+    cleaned = {}
+    for payload in payloads:
+        for row in clean_transaction_data(
+            decompress_payload(payload.data)["response"]["transactions"],
+            matchers[payload.owner],
+        ):
+            cleaned[row["transaction_id"]] = (payload.owner, row)
+
+    # Transactions since removed or archived are not stored to update
+    changes = []
+    for transaction in (
+        Transaction.objects.filter(transaction_id__in=cleaned)
+        .select_for_update()
+        .only("id", "transaction_id", *PAYLOAD_FIELDS)
+    ):
+        owner, row = cleaned[transaction.transaction_id]
+        if any(getattr(transaction, field) != row[field] for field in PAYLOAD_FIELDS):
+            merchant = transaction.merchant
+            entry = budget_entry(transaction)
+            for field in PAYLOAD_FIELDS:
+                setattr(transaction, field, row[field])
+            changes.append((owner, merchant, entry, transaction))
+
+    return len(cleaned), changes, PAYLOAD_FIELDS
+
+
+def _write_back(transactions: list, fields: list) -> None:
+    """
+    Save fields of changed transactions.
+
+    Rows sharing their new values, as after a categorization or merchant
+    change, are saved with one UPDATE per value and batch. bulk_update
+    builds a CASE per row and field, which is slower but saves distinct
+    values, such as fields re-cleaned from payloads, in one query per batch.
+    """
+    groups = {}
+    for transaction in transactions:
+        values = tuple(getattr(transaction, field) for field in fields)
+        groups.setdefault(values, []).append(transaction.pk)
+
+    if len(groups) * 10 > len(transactions):
+        Transaction.objects.bulk_update(transactions, fields, batch_size=WRITE_BATCH)
+        return
+
+    for values, pks in groups.items():
+        for index in range(0, len(pks), WRITE_BATCH):
+            Transaction.objects.filter(pk__in=pks[index : index + WRITE_BATCH]).update(
+                **dict(zip(fields, values))
+            )
+
+
+def reprocess_chunk(source: str, shard: str, start: int, end: int) -> dict:
+    """
+    Clean a chunk of stored rows again and write back the changed
+    transactions, as a task of the reprocess command.
+
+    Transactions are re-cleaned from their own fields, which recomputes
+    merchants and applies the current categorization rules, or from the
+    stored raw Plaid payloads, which recomputes every cleaned field. The
+    budgets of the changed transactions are updated too, while their
+    recurring streams are left to the caller, as the merchants of a user
+    may change in several chunks at once.
+
+    The transactions are locked from the time they are read until their
+    changes and budgets are saved. A sync or edit of the same rows meanwhile
+    then either waits for the chunk or is read by it, and never overwritten.
+
+    Args:
+        source: The rows reprocessed, out of SOURCES
+        shard: Alias of the shard holding the rows
+        start: Primary key the chunk starts after
+        end: Last primary key of the chunk
+
+    Returns:
+        Dictionary with the chunk, the rows processed, the transactions
+        updated, the merchants changed per user id and the seconds taken
+    """
+    started = time.perf_counter()
+    reprocess = _reprocess_payloads if source == "payloads" else _reprocess_transactions
+
+    # One transaction per chunk keeps row locks brief
+    with use_shard(shard), db_transaction.atomic(
+        using=router.db_for_write(Transaction)
+    ):
+        rows, changes, fields = reprocess(start, end)
+        _write_back([transaction for *_, transaction in changes], fields)
+
+        users = {}
+        for owner, merchant, entry, transaction in changes:
+            removed, added, merchants = users.setdefault(owner, ([], [], set()))
+            removed.append(entry)
+            added.append(budget_entry(transaction))
+            merchants.update((merchant, transaction.merchant))
+        for owner, (removed, added, _) in users.items():
+            apply_budget_changes(owner, removed=removed, added=added)
+
+    return {
+        "source": source,
+        "shard": shard,
+        "start": start,
+        "end": end,
+        "rows": rows,
+        "updated": len(changes),
+        "merchants": {
+            owner: sorted(merchants) for owner, (_, _, merchants) in users.items()
+        },
+        "seconds": time.perf_counter() - started,
+    }
+
+
+def refresh_recurring_streams(shard: str, merchants: dict) -> None:
+    """
+    Re-detect the recurring streams and drop the cached forecasts of the
+    users whose transactions were reprocessed.
+
+    Args:
+        shard: Alias of the shard holding the users' rows
+        merchants: Dictionary of user id to the merchants changed
+    """
+    users = User.objects.in_bulk(merchants)
+    with use_shard(shard):
+        for user_id, user_merchants in merchants.items():
+            if user_id in users:
+                update_recurring_streams(users[user_id], user_merchants)
+            invalidate_cash_flow_forecast(user_id)
@@ -1,6 +1,34 @@
+import re
+from datetime import date
+
 from rest_framework import serializers
 
-from .models import Account, Institution, Investment, Item, Transaction
+from .budgets import get_period_start, recalculate_budget
+from .categorization import has_nested_quantifiers
+from .models import (
+    Account,
+    Budget,
+    CategorizationRule,
+    Institution,
+    Investment,
+    Item,
+    RecurringStream,
+    SpendingAnomaly,
+    Transaction,
+)
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin keeping only the fields given as fields, e.g. those
+    of a list request's ?fields= parameter. All fields are kept by default.
+    """
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
 
 
 class InstitutionSerializer(serializers.ModelSerializer):
@@ -21,7 +49,7 @@ class ItemSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
-class AccountSerializer(serializers.ModelSerializer):
+class AccountSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Account
         fields = [
@@ -36,7 +64,7 @@ class AccountSerializer(serializers.ModelSerializer):
         ]
 
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Transaction
         fields = [
@@ -49,10 +77,56 @@ class TransactionSerializer(serializers.ModelSerializer):
             "payment_channel",
             "primary_category",
             "detailed_category",
+            "merchant",
+            "pending",
+            "pending_transaction_id",
         ]
 
 
-class InvestmentSerializer(serializers.ModelSerializer):
+class TransactionFilterSerializer(serializers.Serializer):
+    account = serializers.IntegerField(required=False)
+    start_date = serializers.DateField(required=False)
+    end_date = serializers.DateField(required=False)
+    primary_category = serializers.CharField(required=False, allow_blank=True)
+    merchant = serializers.CharField(required=False, allow_blank=True)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("At least one filter is required")
+        return attrs
+
+
+class TransactionBulkSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), required=False, allow_empty=False
+    )
+    filter = TransactionFilterSerializer(required=False)
+
+    def validate(self, attrs):
+        if ("ids" in attrs) == ("filter" in attrs):
+            raise serializers.ValidationError("Provide either ids or filter")
+        return attrs
+
+
+class TransactionChangesSerializer(serializers.Serializer):
+    primary_category = serializers.CharField(
+        required=False, allow_blank=True, max_length=100
+    )
+    detailed_category = serializers.CharField(
+        required=False, allow_blank=True, max_length=100
+    )
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("At least one change is required")
+        return attrs
+
+
+class TransactionBulkUpdateSerializer(TransactionBulkSerializer):
+    changes = TransactionChangesSerializer()
+
+
+class InvestmentSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Investment
         fields = [
@@ -66,3 +140,143 @@ class InvestmentSerializer(serializers.ModelSerializer):
             "cost_basis",
             "quantity",
         ]
+
+
+class CategorizationRuleSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CategorizationRule
+        fields = [
+            "id",
+            "account",
+            "name_contains",
+            "name_regex",
+            "min_amount",
+            "max_amount",
+            "primary_category",
+            "detailed_category",
+            "priority",
+        ]
+
+    def validate_account(self, account):
+        if account is not None and account.item.user_id != self.context["user"].pk:
+            raise serializers.ValidationError("Account does not belong to user")
+        return account
+
+    def validate_name_regex(self, name_regex):
+        try:
+            re.compile(name_regex)
+        except re.error as e:
+            raise serializers.ValidationError(f"Invalid regular expression: {e}")
+        if has_nested_quantifiers(name_regex):
+            raise serializers.ValidationError(
+                "Regular expression repeats a repeated part, e.g. (a+)+"
+            )
+        return name_regex
+
+    def validate(self, attrs):
+        min_amount = attrs.get("min_amount", getattr(self.instance, "min_amount", None))
+        max_amount = attrs.get("max_amount", getattr(self.instance, "max_amount", None))
+        if (
+            min_amount is not None
+            and max_amount is not None
+            and min_amount > max_amount
+        ):
+            raise serializers.ValidationError("min_amount must not exceed max_amount")
+        return attrs
+
+    def create(self, validated_data):
+        # Retrieve the user from the serializer's context
+        validated_data["user"] = self.context["user"]
+        return super().create(validated_data)
+
+
+class RecurringStreamSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = RecurringStream
+        fields = [
+            "id",
+            "account",
+            "merchant",
+            "description",
+            "frequency",
+            "average_amount",
+            "interval_days",
+            "transaction_count",
+            "first_date",
+            "last_date",
+            "next_date",
+        ]
+
+
+class BudgetSerializer(serializers.ModelSerializer):
+    remaining = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Budget
+        fields = [
+            "id",
+            "primary_category",
+            "period",
+            "amount_limit",
+            "period_start",
+            "spent",
+            "remaining",
+        ]
+        read_only_fields = ["period_start", "spent"]
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # Budgets without spending in the current period still hold the last one
+        current_start = get_period_start(instance.period, date.today())
+        if instance.period_start < current_start:
+            data["period_start"] = self.fields["period_start"].to_representation(
+                current_start
+            )
+            data["spent"] = 0.0
+            data["remaining"] = instance.amount_limit
+        return data
+
+    def get_remaining(self, budget):
+        return budget.amount_limit - budget.spent
+
+    def validate(self, attrs):
+        primary_category = attrs.get(
+            "primary_category", getattr(self.instance, "primary_category", None)
+        )
+        period = attrs.get("period", getattr(self.instance, "period", Budget.MONTHLY))
+        budgets = Budget.objects.filter(
+            user=self.context["user"], primary_category=primary_category, period=period
+        )
+        if self.instance is not None:
+            budgets = budgets.exclude(pk=self.instance.pk)
+        if budgets.exists():
+            raise serializers.ValidationError(
+                "Budget for Category and Period Exists for User"
+            )
+        return attrs
+
+    def create(self, validated_data):
+        # Retrieve the user from the serializer's context
+        budget = Budget(user=self.context["user"], **validated_data)
+        recalculate_budget(budget)
+        budget.save()
+        return budget
+
+    def update(self, instance, validated_data):
+        recalculate = any(
+            field in validated_data
+            and validated_data[field] != getattr(instance, field)
+            for field in ("primary_category", "period")
+        )
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        if recalculate:
+            recalculate_budget(instance)
+        instance.save()
+        return instance
+
+
+class SpendingAnomalySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = SpendingAnomaly
+        fields = ["id", "transaction", "anomaly_type", "score", "created_at"]
@@ -0,0 +1,156 @@
+from logging import getLogger
+
+from django.db import transaction as db_transaction
+from django.db.models import Count
+
+from personalFinanceAppBackend.core.routers import shard_for_user
+
+from .archive import compress_rows, decompress_rows
+from .models import (
+    Account,
+    Budget,
+    CategorizationRule,
+    Institution,
+    Investment,
+    Item,
+    PlaidPayload,
+    RecurringStream,
+    SpendingAnomaly,
+    SpendingStatistic,
+    Transaction,
+    TransactionArchive,
+)
+
+logger = getLogger("personal_finance_app")
+
+# Models copied when a user moves, parents first, with the lookup of their
+# user. Spending statistics are not copied: the moved transactions get new
+# primary keys above the target shard's anomaly detection checkpoint, so
+# its next run rebuilds them.
+USER_LOOKUPS = [
+    (Item, "user"),
+    (Account, "item__user"),
+    (Transaction, "account__item__user"),
+    (Investment, "account__item__user"),
+    (CategorizationRule, "user"),
+    (RecurringStream, "user"),
+    (Budget, "user"),
+    (SpendingAnomaly, "user"),
+    (TransactionArchive, "user"),
+    (PlaidPayload, "item__user"),
+]
+
+
+def delete_user_rows(user, shard: str) -> None:
+    """
+    Delete the sharded rows of a user from a shard.
+
+    Institutions are shared by the users of a shard and kept.
+    """
+    with db_transaction.atomic(using=shard):
+        # Cascades to accounts, transactions, investments and their rows
+        Item.objects.using(shard).filter(user=user).delete()
+        for model in (
+            CategorizationRule,
+            RecurringStream,
+            Budget,
+            SpendingStatistic,
+            SpendingAnomaly,
+            TransactionArchive,
+        ):
+            model.objects.using(shard).filter(user=user).delete()
+
+
+def _copy_user_rows(user, source: str, target: str) -> dict:
+    pk_maps = {Institution: {}}
+    for institution in (
+        Institution.objects.using(source).filter(item__user=user).distinct()
+    ):
+        copy, _ = Institution.objects.using(target).get_or_create(
+            institution_id=institution.institution_id,
+            defaults={"institution_name": institution.institution_name},
+        )
+        pk_maps[Institution][institution.pk] = copy.pk
+
+    counts = {}
+    for model, lookup in USER_LOOKUPS:
+        rows = list(model.objects.using(source).filter(**{lookup: user}).order_by("pk"))
+        source_pks = [row.pk for row in rows]
+
+        for row in rows:
+            row.pk = None
+            for field in model._meta.concrete_fields:
+                related_pks = pk_maps.get(field.related_model)
+                value = getattr(row, field.attname)
+                if related_pks is not None and value is not None:
+                    setattr(row, field.attname, related_pks[value])
+
+            if model is TransactionArchive:
+                # Archived rows refer to accounts by primary key too
+                archived_rows = [
+                    {**archived, "account": pk_maps[Account][archived["account"]]}
+                    for archived in decompress_rows(row.data)
+                    if archived["account"] in pk_maps[Account]
+                ]
+                row.data = compress_rows(archived_rows)
+                row.row_count = len(archived_rows)
+
+        created = model.objects.using(target).bulk_create(rows, batch_size=1000)
+        pk_maps[model] = dict(zip(source_pks, (row.pk for row in created)))
+        counts[model.__name__] = len(created)
+
+    return counts
+
+
+def move_user(user, target: str) -> dict:
+    """
+    Move the sharded rows of a user to another shard.
+
+    Rows are copied with new primary keys, the user is switched to the
+    target shard, then the rows are deleted from the source shard. Writes
+    made for the user while it moves are lost, and workers holding the user
+    in their authentication cache keep using the source shard until it
+    expires, so users are best moved while they are inactive.
+
+    Args:
+        user: The User to move
+        target: Alias of the shard to move the rows to
+
+    Returns:
+        Dictionary of the number of rows copied per model name
+    """
+    source = shard_for_user(user)
+    if source == target:
+        return {}
+
+    with db_transaction.atomic(using=target):
+        counts = _copy_user_rows(user, source, target)
+
+    user.shard = target
+    user.save(update_fields=["shard"])
+
+    delete_user_rows(user, source)
+
+    logger.info(
+        "Moved user %s from shard %s to %s: %s", user.pk, source, target, counts
+    )
+
+    return counts
+
+
+def shard_sizes(shards: list) -> dict:
+    """
+    Count the transactions of every user on each shard.
+
+    Returns:
+        Dictionary of shard alias to a dictionary of user id to row count
+    """
+    return {
+        shard: dict(
+            Transaction.objects.using(shard)
+            .values_list("account__item__user")
+            .annotate(rows=Count("id"))
+            .order_by()
+        )
+        for shard in shards
+    }
@@ -0,0 +1,15 @@
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
+
+from personalFinanceAppBackend.core.routers import shard_for_user
+from personalFinanceAppBackend.users.models import User
+
+from .sharding import delete_user_rows
+
+
+@receiver(pre_delete, sender=User)
+def delete_sharded_rows(sender, instance, **kwargs):
+    # Deleting a user only cascades to rows in the default database
+    shard = shard_for_user(instance)
+    if shard != "default":
+        delete_user_rows(instance, shard)
@@ -0,0 +1,411 @@
+import time
+from logging import getLogger
+
+from django.conf import settings
+from django.db import router
+from django.db import transaction as db_transaction
+
+from personalFinanceAppBackend.core.log import log_context
+from personalFinanceAppBackend.core.routers import use_shard
+from personalFinanceAppBackend.core.singleflight import single_flight
+
+from .anomalies import forget_transactions
+from .archive import archived_transactions, reaches_archive
+from .budgets import apply_budget_changes, budget_entry
+from .categorization import CategorizationMatcher
+from .forecasting import invalidate_cash_flow_forecast
+from .metrics import record_ingest
+from .models import Account, Investment, Item, Transaction
+from .payloads import save_payloads
+from .plaid_client import InstrumentedPlaidClient, error_result
+from .reconciliation import reconcile_pending_transactions
+from .recurring import update_recurring_streams
+from .utils import clean_accounts_data, clean_investment_data, clean_transaction_data
+
+logger = getLogger("personal_finance_app")
+
+PRODUCTS = ("accounts", "transactions", "investments")
+
+# Plaid modules are imported by the functions that call Plaid, and the API
+# client is built on first use, keeping them out of process startup
+client = InstrumentedPlaidClient()
+
+
+def sync_accounts(item) -> list:
+    """
+    Save the accounts Plaid reports for an Item that are not stored yet.
+
+    Args:
+        item: The Item to sync, with its institution selected
+
+    Returns:
+        List of the created Account instances
+    """
+    from plaid.model.accounts_get_request import AccountsGetRequest
+
+    accounts_request = AccountsGetRequest(access_token=item.access_token)
+    accounts_response = client.for_item(item).accounts_get(accounts_request)
+    save_payloads(item, "accounts", [accounts_response])
+
+    return ingest_accounts(item, accounts_response["accounts"])
+
+
+def ingest_accounts(item, plaid_accounts: list) -> list:
+    """
+    Save the accounts of a Plaid response that are not stored yet.
+
+    Args:
+        item: The Item the accounts belong to
+        plaid_accounts: Accounts as returned by Plaid
+
+    Returns:
+        List of the created Account instances
+    """
+    # Clean the Account Data
+    accounts = clean_accounts_data(item.pk, plaid_accounts)
+    record_ingest(
+        "accounts",
+        cleaned=len(accounts),
+        dropped=len(plaid_accounts) - len(accounts),
+    )
+
+    # Skip Existing Accounts and Save New Accounts
+    existing_account_ids = set(
+        Account.objects.filter(item=item).values_list("account_id", flat=True)
+    )
+    new_accounts = [
+        Account(
+            item_id=acc["item"],
+            **{key: value for key, value in acc.items() if key != "item"},
+        )
+        for acc in accounts
+        if acc["account_id"] not in existing_account_ids
+    ]
+
+    saved_accounts = Account.objects.bulk_create(new_accounts)
+
+    record_ingest(
+        "accounts",
+        inserted=len(saved_accounts),
+        skipped=len(accounts) - len(new_accounts),
+    )
+
+    return saved_accounts
+
+
+def sync_transactions(item, matcher, start_date, end_date) -> tuple:
+    """
+    Save the new transactions Plaid reports for an Item in a date range.
+
+    Pending transactions that Plaid has since posted or dropped are removed.
+
+    Args:
+        item: The Item to sync, with its institution selected
+        matcher: CategorizationMatcher of the Item's user
+        start_date: First day of the date range
+        end_date: Last day of the date range
+
+    Returns:
+        Lists of the created and of the removed Transaction instances
+    """
+    from plaid.model.transactions_get_request import TransactionsGetRequest
+    from plaid.model.transactions_get_request_options import (
+        TransactionsGetRequestOptions,
+    )
+
+    item_client = client.for_item(item)
+
+    transaction_request = TransactionsGetRequest(
+        access_token=item.access_token,
+        start_date=start_date,
+        end_date=end_date,
+    )
+
+    response = item_client.transactions_get(transaction_request)
+    pages = [response]
+    plaid_transactions = list(response["transactions"])
+
+    # Page through the rest, stale pendings are only known from a full list
+    while len(plaid_transactions) < response["total_transactions"]:
+        transaction_request = TransactionsGetRequest(
+            access_token=item.access_token,
+            start_date=start_date,
+            end_date=end_date,
+            options=TransactionsGetRequestOptions(
+                count=500, offset=len(plaid_transactions)
+            ),
+        )
+        response = item_client.transactions_get(transaction_request)
+        if not response["transactions"]:
+            break
+        pages.append(response)
+        plaid_transactions.extend(response["transactions"])
+
+    save_payloads(
+        item,
+        "transactions",
+        pages,
+        {"start_date": str(start_date), "end_date": str(end_date)},
+    )
+
+    return ingest_transactions(item, matcher, plaid_transactions, start_date, end_date)
+
+
+def ingest_transactions(
+    item, matcher, plaid_transactions: list, start_date, end_date
+) -> tuple:
+    """
+    Save the new transactions of a Plaid fetch over a date range.
+
+    Pending transactions that Plaid has since posted or dropped are removed.
+
+    Args:
+        item: The Item the transactions belong to
+        matcher: CategorizationMatcher of the Item's user
+        plaid_transactions: Every transaction Plaid returned for the range
+        start_date: First day of the date range
+        end_date: Last day of the date range
+
+    Returns:
+        Lists of the created and of the removed Transaction instances
+    """
+    ## Clean the Transaction Data
+    transactions = clean_transaction_data(plaid_transactions, matcher)
+    record_ingest(
+        "transactions",
+        cleaned=len(transactions),
+        dropped=len(plaid_transactions) - len(transactions),
+    )
+
+    # Skip existing transactions and save new transactions
+    existing_transaction_ids = set(
+        Transaction.objects.filter(
+            transaction_id__in=[tran["transaction_id"] for tran in transactions]
+        ).values_list("transaction_id", flat=True)
+    )
+    if reaches_archive(start_date):
+        existing_transaction_ids.update(
+            row["transaction_id"]
+            for row in archived_transactions(item.user_id, start_date, end_date)
+        )
+    new_transactions = [
+        Transaction(
+            account_id=tran["account"],
+            **{key: value for key, value in tran.items() if key != "account"},
+        )
+        for tran in transactions
+        if tran["transaction_id"] not in existing_transaction_ids
+    ]
+
+    with db_transaction.atomic(using=router.db_for_write(Transaction)):
+        # Replace pending transactions with their posted versions
+        removed_transactions = reconcile_pending_transactions(
+            item,
+            transactions,
+            {
+                transaction["transaction_id"]
+                for transaction in plaid_transactions
+                if "transaction_id" in transaction
+            },
+            start_date,
+            end_date,
+        )
+        saved_transactions = Transaction.objects.bulk_create(new_transactions)
+
+    record_ingest(
+        "transactions",
+        inserted=len(saved_transactions),
+        skipped=len(transactions) - len(new_transactions),
+        removed=len(removed_transactions),
+    )
+
+    return saved_transactions, removed_transactions
+
+
+def apply_transaction_changes(user, saved_transactions, removed_transactions):
+    """
+    Update the recurring streams, budgets, spending statistics and forecasts
+    of a user after a transaction sync or deletion.
+    """
+    # Only merchants with new transactions need their streams re-detected
+    update_recurring_streams(
+        user,
+        {
+            transaction.merchant
+            for transaction in [*saved_transactions, *removed_transactions]
+        },
+    )
+    apply_budget_changes(
+        user.pk,
+        removed=[budget_entry(transaction) for transaction in removed_transactions],
+        added=[budget_entry(transaction) for transaction in saved_transactions],
+    )
+    forget_transactions(user.pk, removed_transactions)
+    invalidate_cash_flow_forecast(user.pk)
+
+
+def sync_investments(item) -> list:
+    """
+    Save the holdings Plaid reports for an Item that are not stored yet.
+
+    Args:
+        item: The Item to sync, with its institution selected
+
+    Returns:
+        List of the created Investment instances
+    """
+    from plaid.model.investments_holdings_get_request import (
+        InvestmentsHoldingsGetRequest,
+    )
+
+    investment_request = InvestmentsHoldingsGetRequest(
+        access_token=item.access_token,
+    )
+
+    response = client.for_item(item).investments_holdings_get(investment_request)
+    save_payloads(item, "investments", [response])
+
+    return ingest_investments(item, response["holdings"], response["securities"])
+
+
+def ingest_investments(item, holdings: list, securities: list) -> list:
+    """
+    Save the holdings of a Plaid response that are not stored yet.
+
+    Args:
+        item: The Item the holdings belong to
+        holdings: Holdings as returned by Plaid
+        securities: Securities of the holdings as returned by Plaid
+
+    Returns:
+        List of the created Investment instances
+    """
+    ## Clean Investment Data
+    investment_data = clean_investment_data(holdings, securities)
+    record_ingest(
+        "investments",
+        cleaned=len(investment_data),
+        dropped=len(holdings) - len(investment_data),
+    )
+
+    # Skip Existing Investments for an Account and Save New Investments for an Account
+    existing_investments = set(
+        Investment.objects.filter(account__item=item).values_list(
+            "account_id", "security_id"
+        )
+    )
+    new_investments = [
+        Investment(
+            account_id=investment["account"],
+            **{key: value for key, value in investment.items() if key != "account"},
+        )
+        for investment in investment_data
+        if (investment["account"], investment["security_id"])
+        not in existing_investments
+    ]
+
+    saved_investments = Investment.objects.bulk_create(new_investments)
+
+    record_ingest(
+        "investments",
+        inserted=len(saved_investments),
+        skipped=len(investment_data) - len(new_investments),
+    )
+
+    return saved_investments
+
+
+def coalesced_sync(product: str, item, sync, *args, params: str = "") -> tuple:
+    """
+    Run a sync of one product of an Item, or join the same sync already
+    running for another request or process.
+
+    Syncs of a product of an Item never run at once, so concurrent requests
+    neither fetch the same rows from Plaid twice nor race to insert them.
+
+    Args:
+        product: The product synced, out of PRODUCTS
+        item: The Item to sync
+        sync: Sync function of the product, called with the Item and args
+        params: Parameters of the sync, only syncs with the same params join
+
+    Returns:
+        The result of the sync and whether this call ran it
+
+    Raises:
+        SingleFlightTimeout: When the running sync took over SYNC_WAIT_SECONDS
+    """
+    # Records logged while syncing, or waiting for the sync, name the Item
+    with log_context(item_id=item.pk):
+        return single_flight(
+            f"sync:{item.user_id}:{item.item_id}:{product}",
+            lambda: sync(item, *args),
+            params=params,
+            lock_seconds=settings.SYNC_LOCK_SECONDS,
+            wait_seconds=settings.SYNC_WAIT_SECONDS,
+        )
+
+
+def sync_item(shard: str, item_pk: int, products, start_date, end_date) -> dict:
+    """
+    Sync products of one Item, as a task of the sync_all command.
+
+    A failing product is logged and recorded instead of raised, so the
+    other products and Items still sync.
+
+    Args:
+        shard: Alias of the shard holding the Item
+        item_pk: Primary key of the Item
+        products: Products to sync, out of PRODUCTS
+        start_date: First day of the transactions to sync
+        end_date: Last day of the transactions to sync
+
+    Returns:
+        Dictionary with the shard, the Item, the seconds taken and for each
+        product either the number of rows saved or the error
+    """
+    start = time.perf_counter()
+    result = {"shard": shard, "item": item_pk, "products": {}}
+
+    with use_shard(shard), log_context(item_id=item_pk):
+        item = Item.objects.select_related("institution").filter(pk=item_pk).first()
+        if item is None:
+            # Removed since the Items were listed
+            result["seconds"] = time.perf_counter() - start
+            return result
+
+        for product in products:
+            try:
+                if product == "accounts":
+                    saved_accounts, _ = coalesced_sync("accounts", item, sync_accounts)
+                    rows = len(saved_accounts)
+                    invalidate_cash_flow_forecast(item.user_id)
+                elif product == "transactions":
+                    (saved_transactions, removed_transactions), ran = coalesced_sync(
+                        "transactions",
+                        item,
+                        sync_transactions,
+                        CategorizationMatcher.for_user(item.user_id),
+                        start_date,
+                        end_date,
+                        params=f"{start_date}:{end_date}",
+                    )
+                    # A joined sync's changes are applied by whoever ran it
+                    if ran:
+                        apply_transaction_changes(
+                            item.user, saved_transactions, removed_transactions
+                        )
+                    rows = len(saved_transactions)
+                else:
+                    saved_investments, _ = coalesced_sync(
+                        "investments", item, sync_investments
+                    )
+                    rows = len(saved_investments)
+            except Exception as e:
+                logger.warning("Syncing %s failed: %s", product, e)
+                result["products"][product] = {"error": error_result(e)}
+            else:
+                result["products"][product] = {"rows": rows}
+
+    result["seconds"] = time.perf_counter() - start
+    return result
@@ -1,3 +1,2259 @@
-from django.test import TestCase
+import json
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from datetime import date, timedelta
+from io import StringIO
+from itertools import count
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from personalFinanceAppBackend.core.log import (
+    ContextFilter,
+    JsonFormatter,
+    QueueStreamHandler,
+)
+from personalFinanceAppBackend.core.ratelimit import (
+    CacheBucketStore,
+    RateLimiter,
+    TokenBucket,
+)
+from personalFinanceAppBackend.core.routers import current_shard, use_shard
+from personalFinanceAppBackend.core.singleflight import SingleFlightTimeout
+from personalFinanceAppBackend.core.testing import (
+    QueryBudgetTestCase,
+    SeededUserTestCase,
+    seed_user_data,
+)
+from personalFinanceAppBackend.users.models import RevokedToken
+
+from . import views
+from .anomalies import detect_anomalies
+from .budgets import apply_budget_changes, budget_entry, recalculate_budget
+from .categorization import CategorizationMatcher
+from .forecasting import HISTORY_DAYS, invalidate_cash_flow_forecast, project_cash_flow
+from .management.commands import benchmark_startup, sync_all
+from .metrics import PLAID_REQUEST_DURATION, PLAID_REQUESTS
+from .models import (
+    Account,
+    Budget,
+    CategorizationRule,
+    Institution,
+    Investment,
+    Item,
+    PlaidPayload,
+    RecurringStream,
+    SpendingAnomaly,
+    SpendingStatistic,
+    Transaction,
+    TransactionArchive,
+)
+from .payloads import load_payloads, save_payloads
+from .plaid_client import InstrumentedPlaidClient
+from .recurring import detect_recurring_streams, update_recurring_streams
+from .reprocessing import reprocess_chunk
+from .serializers import AccountSerializer
+from .sync import coalesced_sync, ingest_transactions, sync_transactions
+
+User = get_user_model()
+
+
+class FakePlaidResponse(dict):
+    def to_dict(self):
+        return dict(self)
+
+
+class FakePlaidClient:
+    """
+    Stand-in for the Plaid API returning rows for the seeded Items.
+
+    Account ids match the seeded accounts of an Item, so a sync finds some
+    of them stored already, while transactions and holdings are new.
+    """
+
+    def __init__(self, accounts_per_item: int, rows_per_account: int):
+        self.accounts_per_item = accounts_per_item
+        self.rows_per_account = rows_per_account
+        self.exchanged = count()
+
+    def account_ids(self, access_token: str) -> list:
+        item_id = "item_" + access_token.removeprefix("access-")
+        return [f"{item_id}_account_{index}" for index in range(self.accounts_per_item)]
+
+    def link_token_create(self, request):
+        return FakePlaidResponse(link_token="link-sandbox-token")
+
+    def item_public_token_exchange(self, request):
+        number = next(self.exchanged)
+        return FakePlaidResponse(
+            item_id=f"exchanged_item_{number}",
+            access_token=f"access-exchanged_{number}",
+        )
+
+    def accounts_get(self, request):
+        return FakePlaidResponse(
+            accounts=[
+                {
+                    "account_id": account_id,
+                    "balances": {"available": 100, "current": 120},
+                    "name": "Checking",
+                    "type": "depository",
+                    "subtype": "checking",
+                }
+                for account_id in self.account_ids(request.access_token)
+            ]
+        )
+
+    def transactions_get(self, request):
+        today = date.today()
+        transactions = [
+            {
+                "account_id": account_id,
+                "transaction_id": f"{account_id}_plaid_{index}",
+                "amount": 10 + index % 25,
+                "date": today - timedelta(days=index % 300),
+                "name": ["Coffee Shop", "Book Store", "Gym"][index % 3],
+                "payment_channel": "online",
+                "personal_finance_category": {
+                    "primary": "FOOD_AND_DRINK",
+                    "detailed": "FOOD_AND_DRINK_COFFEE",
+                },
+                "pending": False,
+            }
+            for account_id in self.account_ids(request.access_token)
+            for index in range(self.rows_per_account)
+        ]
+        return FakePlaidResponse(
+            transactions=transactions, total_transactions=len(transactions)
+        )
+
+    def investments_holdings_get(self, request):
+        holdings = [
+            {
+                "account_id": account_id,
+                "security_id": f"{account_id}_plaid_security_{index}",
+                "institution_price": 50,
+                "institution_price_as_of": date.today(),
+                "cost_basis": 40,
+                "quantity": 2,
+            }
+            for account_id in self.account_ids(request.access_token)
+            for index in range(self.rows_per_account)
+        ]
+        return FakePlaidResponse(
+            holdings=holdings,
+            securities=[
+                {
+                    "security_id": holding["security_id"],
+                    "name": "Index Fund",
+                    "ticker_symbol": "IDX",
+                }
+                for holding in holdings
+            ],
+        )
+
+
+def use_fake_plaid(
+    test, accounts_per_item: int = 3, rows_per_account: int = 5
+) -> FakePlaidClient:
+    """
+    Answer the Plaid calls of a test with a FakePlaidClient.
+    """
+    plaid = FakePlaidClient(accounts_per_item, rows_per_account)
+    patcher = mock.patch.object(views.client, "_client", plaid)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    return plaid
+
+
+class ApiQueryBudgetTests(QueryBudgetTestCase):
+    """
+    Every database endpoint of the API runs a fixed number of queries.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="budget@example.com",
+            password="password",
+            first_name="Query",
+            last_name="Budget",
+        )
+        cls.other_user = User.objects.create_user(
+            email="other@example.com",
+            password="password",
+            first_name="Other",
+            last_name="User",
+        )
+        seed_user_data(
+            cls.user,
+            items=2,
+            accounts_per_item=2,
+            transactions_per_account=10,
+            investments_per_account=2,
+        )
+        seed_user_data(
+            cls.other_user,
+            items=1,
+            accounts_per_item=1,
+            transactions_per_account=5,
+        )
+
+        cls.account = Account.objects.filter(item__user=cls.user).first()
+        cls.transaction = Transaction.objects.filter(account=cls.account).first()
+        cls.budget = Budget.objects.create(
+            user=cls.user,
+            primary_category="FOOD_AND_DRINK",
+            amount_limit=500,
+            period_start=date.today().replace(day=1),
+        )
+        cls.rule = CategorizationRule.objects.create(
+            user=cls.user,
+            name_contains="coffee",
+            primary_category="FOOD_AND_DRINK",
+            detailed_category="FOOD_AND_DRINK_COFFEE",
+        )
+        RecurringStream.objects.create(
+            user=cls.user,
+            account=cls.account,
+            merchant="streaming service",
+            description="Streaming Service",
+            frequency=RecurringStream.MONTHLY,
+            average_amount=15,
+            interval_days=30,
+            transaction_count=6,
+            first_date=date.today() - timedelta(days=180),
+            last_date=date.today() - timedelta(days=5),
+            next_date=date.today() + timedelta(days=25),
+        )
+        SpendingAnomaly.objects.create(
+            user=cls.user,
+            transaction=cls.transaction,
+            anomaly_type=SpendingAnomaly.AMOUNT_OUTLIER,
+            score=4.2,
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.names = count()
+
+    def grow(self):
+        items = seed_user_data(
+            self.user,
+            items=6,
+            accounts_per_item=4,
+            transactions_per_account=50,
+            investments_per_account=5,
+        )
+        for item in items:
+            RecurringStream.objects.create(
+                user=self.user,
+                account=item.account_set.first(),
+                merchant=f"gym {item.pk}",
+                description="Gym",
+                frequency=RecurringStream.MONTHLY,
+                average_amount=40,
+                interval_days=30,
+                transaction_count=4,
+                first_date=date.today() - timedelta(days=120),
+                last_date=date.today() - timedelta(days=10),
+                next_date=date.today() + timedelta(days=20),
+            )
+        SpendingAnomaly.objects.bulk_create(
+            SpendingAnomaly(
+                user=self.user,
+                transaction=transaction,
+                anomaly_type=SpendingAnomaly.DUPLICATE_CHARGE,
+            )
+            for transaction in Transaction.objects.filter(account__item__in=items)[:50]
+        )
+        RevokedToken.objects.bulk_create(
+            RevokedToken(
+                jti=f"revoked-{index}",
+                token_type="access",
+                expires_at=timezone.now() + timedelta(hours=1),
+            )
+            for index in range(500)
+        )
+
+    def new_transaction(self, name="Coffee Shop") -> Transaction:
+        return Transaction.objects.create(
+            account=self.account,
+            transaction_id=f"new_transaction_{next(self.names)}",
+            amount=12,
+            date=date.today(),
+            name=name,
+            merchant=name.lower(),
+            primary_category="FOOD_AND_DRINK",
+        )
+
+    def test_get_accounts(self):
+        response = self.assertWithinBudget(
+            1, lambda: ("get", "/api/get_accounts", None)
+        )
+        self.assertEqual(
+            len(response.data), Account.objects.filter(item__user=self.user).count()
+        )
+
+    def test_get_accounts_with_access_token(self):
+        # Token authentication loads the user and the revocation filter once
+        self.set_token_cookies()
+        self.assertWithinBudget(3, lambda: ("get", "/api/get_accounts", None))
+
+    def test_get_transactions_with_warm_access_token(self):
+        # Cached users and unrevoked tokens cost no queries once warm
+        self.set_token_cookies()
+        self.assertWithinBudget(
+            1, lambda: ("get", "/api/get_transactions", None), warm=True
+        )
+
+    def test_get_account(self):
+        self.assertWithinBudget(
+            1, lambda: ("get", f"/api/get_account/{self.account.pk}", None)
+        )
+
+    def test_get_institution_by_account_id(self):
+        self.assertWithinBudget(
+            1,
+            lambda: (
+                "get",
+                f"/api/get_institution_by_account_id/{self.account.pk}",
+                None,
+            ),
+        )
+
+    def test_get_transactions(self):
+        response = self.assertWithinBudget(
+            1, lambda: ("get", "/api/get_transactions", None)
+        )
+        self.assertEqual(
+            len(response.data),
+            Transaction.objects.filter(account__item__user=self.user).count(),
+        )
+
+    def test_get_transaction(self):
+        self.assertWithinBudget(
+            1, lambda: ("get", f"/api/transaction/{self.transaction.pk}", None)
+        )
+
+    def test_update_transaction(self):
+        def build_request():
+            Transaction.objects.filter(pk=self.transaction.pk).update(
+                primary_category="FOOD_AND_DRINK"
+            )
+            return (
+                "patch",
+                f"/api/transaction/{self.transaction.pk}",
+                {"primary_category": "GENERAL_MERCHANDISE"},
+            )
+
+        self.assertWithinBudget(4, build_request)
+
+    def test_delete_transaction(self):
+        self.assertWithinBudget(
+            5,
+            lambda: ("delete", f"/api/transaction/{self.new_transaction().pk}", None),
+            status_code=204,
+        )
+
+    def test_bulk_update_transactions(self):
+        self.assertWithinBudget(
+            6,
+            lambda: (
+                "patch",
+                "/api/transactions/bulk",
+                {
+                    "filter": {"merchant": "gas station"},
+                    "changes": {"primary_category": f"CATEGORY_{next(self.names)}"},
+                },
+            ),
+        )
+
+    def test_bulk_delete_transactions(self):
+        def build_request():
+            # Deleted rows are written in batches, so their number stays fixed.
+            # Their merchant has no recurring stream to re-detect in the data.
+            for _ in range(5):
+                self.new_transaction("Food Truck")
+            return (
+                "delete",
+                "/api/transactions/bulk",
+                {"filter": {"account": self.account.pk, "start_date": date.today()}},
+            )
+
+        # Recurring streams of the merchants and the spending statistics are
+        # refreshed after the delete
+        self.assertWithinBudget(13, build_request)
+
+    def test_get_cash_flow_forecast(self):
+        self.assertWithinBudget(
+            3, lambda: ("get", "/api/get_cash_flow_forecast?days=60", None)
+        )
+
+    def test_get_budgets(self):
+        self.assertWithinBudget(1, lambda: ("get", "/api/budgets", None))
+
+    def test_create_budget(self):
+        self.assertWithinBudget(
+            3,
+            lambda: (
+                "post",
+                "/api/budgets",
+                {
+                    "primary_category": f"CATEGORY_{next(self.names)}",
+                    "amount_limit": 200,
+                },
+            ),
+            status_code=201,
+        )
+
+    def test_get_budget(self):
+        self.assertWithinBudget(
+            1, lambda: ("get", f"/api/budget/{self.budget.pk}", None)
+        )
+
+    def test_update_budget(self):
+        self.assertWithinBudget(
+            3,
+            lambda: ("patch", f"/api/budget/{self.budget.pk}", {"amount_limit": 600}),
+        )
+
+    def test_delete_budget(self):
+        def build_request():
+            budget = Budget.objects.create(
+                user=self.user,
+                primary_category=f"CATEGORY_{next(self.names)}",
+                amount_limit=100,
+                period_start=date.today().replace(day=1),
+            )
+            return "delete", f"/api/budget/{budget.pk}", None
+
+        self.assertWithinBudget(2, build_request, status_code=204)
+
+    def test_get_recurring_streams(self):
+        self.assertWithinBudget(1, lambda: ("get", "/api/get_recurring_streams", None))
+
+    def test_get_anomalies(self):
+        self.assertWithinBudget(1, lambda: ("get", "/api/get_anomalies", None))
+
+    def test_get_categorization_rules(self):
+        self.assertWithinBudget(1, lambda: ("get", "/api/categorization_rules", None))
+
+    def test_create_categorization_rule(self):
+        self.assertWithinBudget(
+            3,
+            lambda: (
+                "post",
+                "/api/categorization_rules",
+                {
+                    "account": self.account.pk,
+                    "name_contains": "gym",
+                    "primary_category": "PERSONAL_CARE",
+                },
+            ),
+            status_code=201,
+        )
+
+    def test_get_categorization_rule(self):
+        self.assertWithinBudget(
+            1, lambda: ("get", f"/api/categorization_rule/{self.rule.pk}", None)
+        )
+
+    def test_update_categorization_rule(self):
+        self.assertWithinBudget(
+            2,
+            lambda: (
+                "patch",
+                f"/api/categorization_rule/{self.rule.pk}",
+                {"priority": 5},
+            ),
+        )
+
+    def test_delete_categorization_rule(self):
+        def build_request():
+            rule = CategorizationRule.objects.create(
+                user=self.user, name_contains="gym", primary_category="PERSONAL_CARE"
+            )
+            return "delete", f"/api/categorization_rule/{rule.pk}", None
+
+        self.assertWithinBudget(2, build_request, status_code=204)
+
+    def test_apply_categorization_rules(self):
+        def build_request():
+            # Changed rows are written in batches, so their number stays fixed
+            transactions = Transaction.objects.filter(
+                account__item__user=self.user, name__icontains="coffee"
+            )
+            transactions.update(
+                primary_category="FOOD_AND_DRINK",
+                detailed_category="FOOD_AND_DRINK_COFFEE",
+            )
+            transactions.filter(account=self.account).update(detailed_category="")
+            return "post", "/api/apply_categorization_rules", None
+
+        self.assertWithinBudget(3, build_request)
+
+    def test_get_investments(self):
+        self.assertWithinBudget(1, lambda: ("get", "/api/get_investments", None))
+
+    def test_other_users_rows_are_not_found(self):
+        other_account = Account.objects.get(item__user=self.other_user)
+
+        for url in (
+            f"/api/get_account/{other_account.pk}",
+            f"/api/get_institution_by_account_id/{other_account.pk}",
+        ):
+            self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class CategorizationRuleTests(SeededUserTestCase):
+    """
+    Rules match names by needle and regex and re-categorize stored rows.
+    """
+
+    def matcher(self, *rules) -> CategorizationMatcher:
+        return CategorizationMatcher(
+            [
+                CategorizationRule(pk=index, user=self.user, **fields)
+                for index, fields in enumerate(rules, start=1)
+            ]
+        )
+
+    def test_needles_inside_a_longer_match_are_found(self):
+        matcher = self.matcher(
+            {"name_contains": "coffee shop", "primary_category": "CAFE", "priority": 1},
+            {"name_contains": "shop", "primary_category": "SHOPPING"},
+            {"name_contains": "coffee", "primary_category": "COFFEE", "priority": 2},
+        )
+
+        self.assertEqual(
+            matcher.match("Coffee Shop", 5, None).primary_category, "SHOPPING"
+        )
+        self.assertEqual(
+            matcher.match("Best Coffee", 5, None).primary_category, "COFFEE"
+        )
+        self.assertIsNone(matcher.match("Gym", 5, None))
+
+    def test_amount_and_account_conditions(self):
+        matcher = self.matcher(
+            {"name_contains": "gas", "max_amount": 10, "primary_category": "SNACKS"},
+            {"name_contains": "gas", "account_id": 1, "primary_category": "OTHER"},
+            {"name_contains": "gas", "primary_category": "TRANSPORTATION"},
+        )
+
+        self.assertEqual(matcher.match("Gas Station", 5, 2).primary_category, "SNACKS")
+        self.assertEqual(matcher.match("Gas Station", 50, 1).primary_category, "OTHER")
+        self.assertEqual(
+            matcher.match("Gas Station", 50, 2).primary_category, "TRANSPORTATION"
+        )
+
+    def test_regexes_with_back_references(self):
+        matcher = self.matcher(
+            {"name_regex": "^(z)z", "primary_category": "SLEEP"},
+            {"name_regex": r"(o)\1k", "primary_category": "BOOKS"},
+        )
+
+        self.assertEqual(matcher.match("Book Store", 5, None).primary_category, "BOOKS")
+        self.assertIsNone(matcher.match("Bok Store", 5, None))
+
+    def test_nested_quantifiers_are_rejected(self):
+        response = self.client.post(
+            "/api/categorization_rules",
+            {"name_regex": "^(a+)+$", "primary_category": "SLOW"},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        # Rules stored before are skipped instead of backtracking on a sync
+        matcher = self.matcher({"name_regex": "^(a+)+$", "primary_category": "SLOW"})
+        self.assertIsNone(matcher.match("a" * 40 + "!", 5, None))
+
+    def test_applying_rules_updates_budgets(self):
+        budgets = [
+            recalculate_budget(
+                Budget(
+                    user=self.user,
+                    primary_category=category,
+                    period=Budget.YEARLY,
+                    amount_limit=1000,
+                )
+            )
+            for category in ("COFFEE", "FOOD_AND_DRINK")
+        ]
+        Budget.objects.bulk_create(budgets)
+        CategorizationRule.objects.create(
+            user=self.user, name_contains="coffee", primary_category="COFFEE"
+        )
+
+        response = self.client.post("/api/apply_categorization_rules")
+
+        self.assertGreater(response.data["updated"], 0)
+        for budget in Budget.objects.filter(user=self.user):
+            self.assertEqual(budget.spent, recalculate_budget(budget).spent)
+        self.assertGreater(Budget.objects.get(primary_category="COFFEE").spent, 0)
+
+
+class RecurringStreamTests(TestCase):
+    """
+    Periodic series of a merchant are detected as recurring streams.
+    """
+
+    def series(self, merchant, amount, days, account_id=1) -> list:
+        start = date(2024, 1, 5)
+        return [
+            (
+                account_id,
+                merchant,
+                merchant.title(),
+                start + timedelta(days=day),
+                amount,
+            )
+            for day in days
+        ]
+
+    def test_detects_monthly_and_weekly_series(self):
+        streams = detect_recurring_streams(
+            None,
+            self.series("streaming", 15.99, [0, 31, 59, 90, 120, 151])
+            + self.series("gym", 10, [0, 7, 14, 22, 28]),
+        )
+
+        by_merchant = {stream.merchant: stream for stream in streams}
+        self.assertEqual(set(by_merchant), {"streaming", "gym"})
+        monthly = by_merchant["streaming"]
+        self.assertEqual(monthly.frequency, RecurringStream.MONTHLY)
+        self.assertEqual(monthly.transaction_count, 6)
+        self.assertEqual(monthly.average_amount, 15.99)
+        self.assertEqual(monthly.last_date, date(2024, 1, 5) + timedelta(days=151))
+        self.assertEqual(monthly.next_date, monthly.last_date + timedelta(days=31))
+        self.assertEqual(by_merchant["gym"].frequency, RecurringStream.WEEKLY)
+
+    def test_irregular_and_short_series_are_not_recurring(self):
+        streams = detect_recurring_streams(
+            None,
+            self.series("coffee", 4, [0, 3, 11, 12, 40, 41, 90])
+            + self.series("rent", 1200, [0, 30]),
+        )
+
+        self.assertEqual(streams, [])
+
+    def test_amount_bands_and_accounts_split_series(self):
+        monthly = [0, 30, 61, 91]
+        streams = detect_recurring_streams(
+            None,
+            self.series("utility", 50, monthly)
+            + self.series("utility", 200, [day + 2 for day in monthly])
+            + self.series("utility", 50, [day + 5 for day in monthly], account_id=2),
+        )
+
+        self.assertEqual(
+            sorted((stream.account_id, stream.average_amount) for stream in streams),
+            [(1, 50), (1, 200), (2, 50)],
+        )
+
+
+class BudgetTests(SeededUserTestCase):
+    """
+    Budget spent counters follow transaction changes and roll into new periods.
+    """
+
+    seed = {"items": 1, "accounts_per_item": 1, "transactions_per_account": 0}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.account = Account.objects.get(item__user=cls.user)
+
+    def create_budget(self, category="FOOD_AND_DRINK", **fields) -> Budget:
+        return Budget.objects.create(
+            user=self.user,
+            primary_category=category,
+            amount_limit=100,
+            period_start=date.today().replace(day=1),
+            **fields,
+        )
+
+    def create_transaction(self, amount, category="FOOD_AND_DRINK") -> Transaction:
+        transaction = Transaction.objects.create(
+            account=self.account,
+            transaction_id=f"transaction_{Transaction.objects.count()}",
+            amount=amount,
+            date=date.today(),
+            name="Grocery Store",
+            primary_category=category,
+        )
+        apply_budget_changes(self.user.pk, added=[budget_entry(transaction)])
+        return transaction
+
+    def test_edits_and_deletes_update_spent(self):
+        food = self.create_budget()
+        travel = self.create_budget("TRAVEL")
+        transaction = self.create_transaction(30)
+        self.create_transaction(20)
+
+        self.client.patch(
+            f"/api/transaction/{transaction.pk}",
+            {"primary_category": "TRAVEL"},
+            format="json",
+        )
+        food.refresh_from_db()
+        travel.refresh_from_db()
+        self.assertEqual((food.spent, travel.spent), (20, 30))
+
+        self.client.delete(f"/api/transaction/{transaction.pk}")
+        travel.refresh_from_db()
+        self.assertEqual(travel.spent, 0)
+
+    def test_spending_in_a_new_period_rolls_the_budget_forward(self):
+        last_month = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+        budget = self.create_budget(spent=80)
+        Budget.objects.filter(pk=budget.pk).update(period_start=last_month)
+
+        self.create_transaction(15)
+
+        budget.refresh_from_db()
+        self.assertEqual(budget.period_start, date.today().replace(day=1))
+        self.assertEqual(budget.spent, 15)
+
+    def test_edit_in_a_new_period_counts_its_stored_spending(self):
+        last_month = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+        budget = self.create_budget(spent=80)
+        Budget.objects.filter(pk=budget.pk).update(period_start=last_month)
+        # Stored this month before anything rolled the budget forward
+        Transaction.objects.bulk_create(
+            Transaction(
+                account=self.account,
+                transaction_id=f"stored_{amount}",
+                amount=amount,
+                date=date.today(),
+                name="Grocery Store",
+                primary_category="FOOD_AND_DRINK",
+            )
+            for amount in (40, 50)
+        )
+        edited = Transaction.objects.get(transaction_id="stored_50")
+
+        self.client.patch(
+            f"/api/transaction/{edited.pk}", {"amount": 60}, format="json"
+        )
+
+        budget.refresh_from_db()
+        self.assertEqual(budget.period_start, date.today().replace(day=1))
+        self.assertEqual(budget.spent, 100)
+
+        Budget.objects.filter(pk=budget.pk).update(period_start=last_month, spent=0)
+        self.client.delete(f"/api/transaction/{edited.pk}")
+
+        budget.refresh_from_db()
+        self.assertEqual(budget.spent, 40)
+
+    def test_stale_budget_is_listed_in_the_current_period(self):
+        last_month = (date.today().replace(day=1) - timedelta(days=1)).replace(day=1)
+        budget = self.create_budget(spent=80)
+        Budget.objects.filter(pk=budget.pk).update(period_start=last_month)
+
+        response = self.client.get(f"/api/budget/{budget.pk}")
+
+        self.assertEqual(
+            response.data["period_start"], str(date.today().replace(day=1))
+        )
+        self.assertEqual((response.data["spent"], response.data["remaining"]), (0, 100))
+        # Listing a budget does not change it
+        budget.refresh_from_db()
+        self.assertEqual((budget.period_start, budget.spent), (last_month, 80))
+
+
+class CashFlowForecastTests(SeededUserTestCase):
+    """
+    Forecasts project recurring and discretionary spending and are cached.
+    """
+
+    seed = {"items": 1, "accounts_per_item": 1, "transactions_per_account": 0}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.account = Account.objects.get(item__user=cls.user)
+        cls.today = date.today()
+        # 20 spent every other day of the history: mean 10, deviation 10
+        Transaction.objects.bulk_create(
+            Transaction(
+                account=cls.account,
+                transaction_id=f"history_{days_ago}",
+                amount=20,
+                date=cls.today - timedelta(days=days_ago),
+                name="Grocery Store",
+                merchant="grocery store",
+            )
+            for days_ago in range(2, HISTORY_DAYS + 1, 2)
+        )
+
+    def create_stream(self, amount=100, days_ahead=5) -> RecurringStream:
+        return RecurringStream.objects.create(
+            user=self.user,
+            account=self.account,
+            merchant="rent",
+            frequency=RecurringStream.MONTHLY,
+            average_amount=amount,
+            interval_days=30,
+            transaction_count=6,
+            first_date=self.today - timedelta(days=150),
+            last_date=self.today - timedelta(days=25),
+            next_date=self.today + timedelta(days=days_ahead),
+        )
+
+    def test_projects_recurring_and_discretionary_spending(self):
+        self.create_stream()
+
+        forecast = project_cash_flow(self.user, 40, self.today)
+
+        account = forecast["accounts"][0]
+        self.assertEqual(
+            (account["daily_spend_mean"], account["daily_spend_std"]), (10, 10)
+        )
+        balances = account["balances"]
+        self.assertEqual(balances[:2], [1190, 1180])
+        # Rent on day 5 and again 30 days later
+        self.assertEqual(balances[5], 1200 - 60 - 100)
+        self.assertEqual(balances[35], 1200 - 360 - 200)
+        self.assertAlmostEqual(
+            account["high"][3] - balances[3], 1.2816 * 10 * 2, places=1
+        )
+
+    def test_liabilities_grow_with_spending(self):
+        Account.objects.filter(pk=self.account.pk).update(account_type="credit")
+
+        forecast = project_cash_flow(self.user, 3, self.today)
+
+        self.assertEqual(forecast["accounts"][0]["balances"], [1210, 1220, 1230])
+
+    def test_forecast_is_cached_until_invalidated(self):
+        def first_balances():
+            response = self.client.get("/api/get_cash_flow_forecast?days=10")
+            return response.data["accounts"][0]["balances"]
+
+        before = first_balances()
+        self.create_stream(amount=500, days_ahead=0)
+        self.assertEqual(first_balances(), before)
+
+        invalidate_cash_flow_forecast(self.user.pk)
+
+        self.assertEqual(first_balances()[0], before[0] - 500)
+
+
+class AnomalyDetectionTests(SeededUserTestCase):
+    """
+    The detection job flags charges far from a user's recent spending.
+    """
+
+    seed = {"items": 1, "accounts_per_item": 1, "transactions_per_account": 0}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.account = Account.objects.get(item__user=cls.user)
+
+    def charge(self, amount, days_ago=0) -> Transaction:
+        return Transaction.objects.create(
+            account=self.account,
+            transaction_id=f"charge_{Transaction.objects.count()}",
+            amount=amount,
+            date=date.today() - timedelta(days=days_ago),
+            name="Grocery Store",
+            merchant="grocery store",
+            primary_category="FOOD_AND_DRINK",
+        )
+
+    def history(self, count=12, days_ago=0):
+        for index in range(count):
+            self.charge(45 + index % 11, days_ago=days_ago + 3 * index)
+
+    def flagged(self) -> set:
+        return set(
+            SpendingAnomaly.objects.filter(
+                anomaly_type=SpendingAnomaly.AMOUNT_OUTLIER
+            ).values_list("transaction_id", flat=True)
+        )
+
+    def test_first_run_flags_an_outlier_in_a_short_history(self):
+        self.history()
+        outlier = self.charge(400, days_ago=1)
+        normal = self.charge(52, days_ago=2)
+
+        run = detect_anomalies()
+
+        self.assertEqual(run.transactions_processed, 14)
+        self.assertEqual(self.flagged(), {outlier.pk})
+        self.assertNotIn(normal.pk, self.flagged())
+
+    def test_new_rows_are_scored_against_the_earlier_statistics(self):
+        self.history()
+        detect_anomalies()
+        normal = self.charge(52)
+        outlier = self.charge(300)
+
+        run = detect_anomalies()
+
+        self.assertEqual(run.transactions_processed, 2)
+        self.assertEqual(self.flagged(), {outlier.pk})
+        statistic = SpendingStatistic.objects.get(
+            kind=SpendingStatistic.CATEGORY, key="FOOD_AND_DRINK"
+        )
+        self.assertAlmostEqual(statistic.weight, 14, delta=1)
+        self.assertEqual(statistic.as_of, normal.date)
+
+    def test_old_spending_decays(self):
+        for index in range(10):
+            self.charge(500 + index, days_ago=730 + 3 * index)
+        self.history(count=10)
+        detect_anomalies()
+
+        outlier = self.charge(500)
+        detect_anomalies()
+
+        self.assertIn(outlier.pk, self.flagged())
+
+
+class PendingReconciliationTests(SeededUserTestCase):
+    """
+    Posted transactions replace their pending versions and stale ones go.
+    """
+
+    seed = {"items": 1, "accounts_per_item": 1, "transactions_per_account": 0}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.account = Account.objects.get(item__user=cls.user)
+        cls.today = date.today()
+
+    def pending(self, transaction_id, days_ago=1) -> Transaction:
+        return Transaction.objects.create(
+            account=self.account,
+            transaction_id=transaction_id,
+            amount=25,
+            date=self.today - timedelta(days=days_ago),
+            name="Book Store",
+            pending=True,
+        )
+
+    def plaid_row(self, transaction_id, account_id=None, **fields) -> dict:
+        return {
+            "account_id": account_id or self.account.account_id,
+            "transaction_id": transaction_id,
+            "amount": 25,
+            "date": self.today,
+            "name": "Book Store",
+            **fields,
+        }
+
+    def ingest(self, rows) -> tuple:
+        return ingest_transactions(
+            self.items[0], None, rows, self.today - timedelta(days=30), self.today
+        )
+
+    def test_posted_transaction_replaces_its_pending_version(self):
+        self.pending("pending_1")
+
+        saved, removed = self.ingest(
+            [self.plaid_row("posted_1", pending_transaction_id="pending_1")]
+        )
+
+        self.assertEqual([row.transaction_id for row in removed], ["pending_1"])
+        self.assertEqual(
+            list(Transaction.objects.values_list("transaction_id", flat=True)),
+            ["posted_1"],
+        )
+
+    def test_stale_pending_transactions_in_range_are_purged(self):
+        self.pending("stale")
+        self.pending("out_of_range", days_ago=60)
+        self.pending("still_pending")
+
+        self.ingest([self.plaid_row("still_pending", pending=True)])
+
+        self.assertEqual(
+            set(Transaction.objects.values_list("transaction_id", flat=True)),
+            {"out_of_range", "still_pending"},
+        )
+
+    def test_reported_rows_dropped_by_cleaning_are_kept(self):
+        self.pending("unknown_account")
+
+        saved, removed = self.ingest(
+            [self.plaid_row("unknown_account", account_id="other", pending=True)]
+        )
+
+        self.assertEqual((saved, removed), ([], []))
+        self.assertTrue(Transaction.objects.filter(pending=True).exists())
+
+
+class BulkTransactionTests(SeededUserTestCase):
+    """
+    Bulk edits and deletes keep the data derived from transactions current.
+    """
+
+    seed = {"items": 1, "accounts_per_item": 1, "transactions_per_account": 0}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.account = Account.objects.get(item__user=cls.user)
+        Transaction.objects.bulk_create(
+            Transaction(
+                account=cls.account,
+                transaction_id=f"{merchant}_{month}",
+                amount=amount + month,
+                date=date.today() - timedelta(days=30 * month + 1),
+                name=merchant.title(),
+                merchant=merchant,
+                primary_category="ENTERTAINMENT",
+            )
+            for merchant, amount in (("streaming", 15), ("cinema", 40))
+            for month in range(6)
+        )
+
+    def bulk_delete(self, **filters):
+        return self.client.delete(
+            "/api/transactions/bulk", {"filter": filters}, format="json"
+        )
+
+    def test_bulk_delete_refreshes_recurring_streams(self):
+        update_recurring_streams(self.user)
+        self.assertEqual(RecurringStream.objects.count(), 2)
+
+        response = self.bulk_delete(merchant="streaming")
+
+        self.assertEqual(response.data, {"deleted": 6})
+        self.assertEqual(
+            list(RecurringStream.objects.values_list("merchant", flat=True)),
+            ["cinema"],
+        )
+
+    def test_bulk_delete_takes_charges_out_of_the_statistics(self):
+        detect_anomalies()
+
+        self.bulk_delete(merchant="cinema")
+
+        statistics = {
+            (stat.kind, stat.key): stat for stat in SpendingStatistic.objects.all()
+        }
+        self.assertAlmostEqual(statistics["merchant", "cinema"].weight, 0)
+        category = statistics["category", "ENTERTAINMENT"]
+        self.assertAlmostEqual(
+            category.weight, statistics["merchant", "streaming"].weight
+        )
+        self.assertAlmostEqual(category.mean, statistics["merchant", "streaming"].mean)
+
+    def test_bulk_update_applies_to_the_filtered_rows(self):
+        response = self.client.patch(
+            "/api/transactions/bulk",
+            {
+                "filter": {"merchant": "cinema"},
+                "changes": {"primary_category": "MOVIES"},
+            },
+            format="json",
+        )
+
+        self.assertEqual(response.data, {"updated": 6})
+        self.assertEqual(
+            Transaction.objects.filter(primary_category="MOVIES").count(), 6
+        )
+
+
+class ServerTimingTests(SeededUserTestCase):
+    def server_timing(self):
+        return self.client.get("/api/get_transactions").headers.get("Server-Timing")
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_hidden_from_clients_by_default(self):
+        self.assertIsNone(self.server_timing())
+
+    @override_settings(SERVER_TIMING_ENABLED=True)
+    def test_sent_when_enabled(self):
+        timing = self.server_timing()
+
+        self.assertIn("total;dur=", timing)
+        self.assertIn("db;dur=", timing)
+
+    @override_settings(SERVER_TIMING_ENABLED=False)
+    def test_sent_to_staff(self):
+        staff = self.create_user("staff@example.com", is_staff=True)
+        self.client.force_authenticate(staff)
+
+        self.assertIn("total;dur=", self.server_timing())
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(SeededUserTestCase):
+    """
+    Read-only endpoints read from a replica unless the user wrote recently.
+    """
+
+    databases = {"default", "replica"}
+    seed = {"items": 1, "accounts_per_item": 2, "transactions_per_account": 0}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        # The replica holds a copy of the rows that can be told apart
+        cls.user.save(using="replica")
+        for model in (Institution, Item, Account):
+            for instance in model.objects.all():
+                if model is Account:
+                    instance.name = f"Replica {instance.name}"
+                instance.save(using="replica")
+
+    def account_names(self) -> set:
+        response = self.client.get("/api/get_accounts")
+        self.assertEqual(response.status_code, 200)
+        return {account["name"] for account in response.data}
+
+    def test_reads_from_replica(self):
+        self.assertEqual(
+            self.account_names(), {"Replica Account 0", "Replica Account 1"}
+        )
+
+    def test_reads_from_primary_after_write(self):
+        response = self.client.post(
+            "/api/budgets",
+            {"primary_category": "FOOD_AND_DRINK", "amount_limit": 200},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 201)
+
+        self.assertEqual(self.account_names(), {"Account 0", "Account 1"})
+
+    def test_pin_needs_no_shared_cache(self):
+        self.client.post(
+            "/api/budgets",
+            {"primary_category": "FOOD_AND_DRINK", "amount_limit": 200},
+            format="json",
+        )
+        # As if the next read was served by another worker process
+        cache.clear()
+
+        self.assertEqual(self.account_names(), {"Account 0", "Account 1"})
+
+    def test_pin_of_other_user_is_ignored(self):
+        other = self.create_user("other@example.com")
+        other.save(using="replica")
+        client = APIClient(SERVER_NAME="localhost")
+        client.force_authenticate(other)
+        client.post(
+            "/api/budgets",
+            {"primary_category": "FOOD_AND_DRINK", "amount_limit": 200},
+            format="json",
+        )
+        self.client.cookies[settings.REPLICA_STICKY_COOKIE] = client.cookies[
+            settings.REPLICA_STICKY_COOKIE
+        ].value
+
+        self.assertEqual(
+            self.account_names(), {"Replica Account 0", "Replica Account 1"}
+        )
+
+    def test_forged_pin_is_ignored(self):
+        self.client.cookies[settings.REPLICA_STICKY_COOKIE] = str(self.user.pk)
+
+        self.assertEqual(
+            self.account_names(), {"Replica Account 0", "Replica Account 1"}
+        )
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_reads_from_primary_without_replicas(self):
+        self.assertEqual(self.account_names(), {"Account 0", "Account 1"})
+
+
+@override_settings(DATABASE_SHARDS=["default", "shard_1"])
+class ShardRoutingTests(TestCase):
+    """
+    The rows of a user are read from and written to the user's shard.
+    """
+
+    databases = {"default", "shard_1"}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="sharded@example.com",
+            password="password",
+            first_name="Sharded",
+            last_name="User",
+            shard="shard_1",
+        )
+        with use_shard("shard_1"):
+            seed_user_data(
+                cls.user, items=2, accounts_per_item=2, transactions_per_account=5
+            )
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME="localhost")
+
+    def authenticate(self, user):
+        refresh = RefreshToken.for_user(user)
+        self.client.cookies[settings.AUTH_COOKIE] = str(refresh.access_token)
+
+    def test_reads_from_user_shard(self):
+        self.authenticate(self.user)
+
+        response = self.client.get("/api/get_accounts")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 4)
+        self.assertFalse(Account.objects.using("default").exists())
+
+    def test_writes_to_user_shard(self):
+        self.authenticate(self.user)
+
+        response = self.client.post(
+            "/api/budgets",
+            {"primary_category": "FOOD_AND_DRINK", "amount_limit": 200},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Budget.objects.using("shard_1").filter(user=self.user).exists())
+        self.assertFalse(Budget.objects.using("default").exists())
+
+    def test_move_user(self):
+        call_command(
+            "rebalance_shards", user=self.user.pk, to="default", stdout=StringIO()
+        )
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.shard, "default")
+        self.assertEqual(
+            Transaction.objects.using("default")
+            .filter(account__item__user=self.user)
+            .count(),
+            20,
+        )
+        self.assertFalse(Item.objects.using("shard_1").exists())
+
+        self.authenticate(self.user)
+        response = self.client.get("/api/get_transactions")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 20)
+
+    def test_rebalance_moves_users_to_emptiest_shard(self):
+        for number in range(2):
+            user = User.objects.create_user(
+                email=f"unsharded{number}@example.com",
+                password="password",
+                first_name="Default",
+                last_name="User",
+                shard="default",
+            )
+            seed_user_data(
+                user, items=1, accounts_per_item=5, transactions_per_account=10
+            )
+
+        call_command("rebalance_shards", stdout=StringIO())
+
+        self.assertEqual(Transaction.objects.using("default").count(), 50)
+        self.assertEqual(Transaction.objects.using("shard_1").count(), 70)
+
+    def test_deleting_user_deletes_sharded_rows(self):
+        self.user.delete()
+
+        self.assertFalse(Item.objects.using("shard_1").exists())
+        self.assertFalse(Transaction.objects.using("shard_1").exists())
+
+
+@override_settings(TRANSACTION_ARCHIVE_AGE_DAYS=3 * 365)
+class TransactionArchiveTests(SeededUserTestCase):
+    """
+    Old transactions move to archives and are still listed when asked for.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.account = Account.objects.filter(item__user=cls.user).first()
+        for years_ago in (4, 5):
+            for index in range(3):
+                cls.create_old_transaction(f"old_{years_ago}_{index}", years_ago)
+
+    @classmethod
+    def create_old_transaction(cls, transaction_id: str, years_ago: int):
+        return Transaction.objects.create(
+            account=cls.account,
+            transaction_id=transaction_id,
+            amount=20,
+            date=date.today() - timedelta(days=365 * years_ago),
+            name="Old Purchase",
+        )
+
+    def archive(self):
+        call_command("archive_transactions", stdout=StringIO())
+
+    def list_transactions(self, years_back: int) -> list:
+        start_date = date.today() - timedelta(days=365 * years_back)
+        response = self.client.get(
+            f"/api/get_transactions?start_date={start_date}&end_date={date.today()}"
+        )
+        self.assertEqual(response.status_code, 200)
+        return sorted(response.data, key=lambda row: row["transaction_id"])
+
+    def test_archives_old_transactions(self):
+        self.archive()
+
+        self.assertEqual(Transaction.objects.count(), 10)
+        self.assertEqual(
+            sum(TransactionArchive.objects.values_list("row_count", flat=True)), 6
+        )
+
+    def test_lists_archived_transactions_in_range(self):
+        before = self.list_transactions(years_back=6)
+
+        self.archive()
+
+        self.assertEqual(len(before), 16)
+        self.assertEqual(self.list_transactions(years_back=6), before)
+        self.assertEqual(len(self.list_transactions(years_back=2)), 10)
+
+    def test_archiving_again_merges_rows(self):
+        self.archive()
+        self.create_old_transaction("old_4_late", 4)
+
+        self.archive()
+
+        self.assertEqual(Transaction.objects.count(), 10)
+        self.assertEqual(len(self.list_transactions(years_back=6)), 17)
+
+
+class SyncAllTests(SeededUserTestCase):
+    """
+    sync_all syncs every Item and resumes after the ones it synced.
+    """
+
+    seed = {"items": 2, "accounts_per_item": 2, "transactions_per_account": 0}
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        seed_user_data(cls.create_user("other@example.com"), **cls.seed)
+
+    def setUp(self):
+        super().setUp()
+        self.plaid = use_fake_plaid(self)
+
+        state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(state_dir.cleanup)
+        self.state_file = os.path.join(state_dir.name, "state.jsonl")
+
+    def sync_all(self, **options) -> str:
+        out = StringIO()
+        call_command(
+            "sync_all", workers=0, state_file=self.state_file, stdout=out, **options
+        )
+        return out.getvalue()
+
+    def test_syncs_every_item(self):
+        output = self.sync_all()
+
+        self.assertIn("Synced 4 of 4 Items", output)
+        self.assertEqual(Account.objects.count(), 4 * 3)
+        self.assertEqual(Transaction.objects.count(), 4 * 3 * 5)
+        self.assertEqual(Investment.objects.count(), 4 * 3 * 5)
+
+    def test_resume_skips_synced_items(self):
+        self.sync_all(products=["accounts"])
+
+        output = self.sync_all(products=["accounts"], resume=True)
+
+        self.assertIn("Syncing 0 of 4 Items", output)
+
+    def test_failed_items_are_retried_on_resume(self):
+        with mock.patch.object(
+            self.plaid, "investments_holdings_get", side_effect=ValueError
+        ):
+            output = self.sync_all(products=["investments"])
+        self.assertIn("4 x investments: ValueError", output)
+
+        output = self.sync_all(products=["investments"], resume=True)
+
+        self.assertIn("Syncing 4 of 4 Items", output)
+        # Holdings of the accounts not synced yet are dropped
+        self.assertEqual(Investment.objects.count(), 4 * 2 * 5)
+
+    @override_settings(
+        PLAID_RATE_LIMIT_ENABLED=True,
+        PLAID_CLIENT_RATE_PER_MINUTE=600,
+        PLAID_CLIENT_RATE_BURST=10,
+    )
+    def test_workers_share_process_local_rate(self):
+        pools = []
+
+        class SerialPool:
+            # Runs the tasks here, recording how workers would be set up
+            def __init__(self, max_workers, initializer, initargs):
+                pools.append(initargs)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def submit(self, func, *args):
+                future = Future()
+                future.set_result(func(*args))
+                return future
+
+        err = StringIO()
+        with mock.patch.object(sync_all, "ProcessPoolExecutor", SerialPool):
+            call_command(
+                "sync_all",
+                workers=4,
+                products=["accounts"],
+                state_file=self.state_file,
+                stdout=StringIO(),
+                stderr=err,
+            )
+
+        self.assertEqual(pools, [((150, 2),)])
+        self.assertIn("each worker is limited to 150 Plaid calls", err.getvalue())
+
+    @override_settings(
+        PLAID_RATE_LIMIT_ENABLED=True,
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "shared": {"BACKEND": "django.core.cache.backends.redis.RedisCache"},
+        },
+        PLAID_RATE_LIMIT_CACHE="shared",
+    )
+    def test_workers_keep_shared_rate(self):
+        self.assertIsNone(sync_all.worker_client_rate(4))
+        self.assertIsNone(sync_all.worker_client_rate(1))
+
+    @override_settings(PLAID_CLIENT_RATE_PER_MINUTE=600, PLAID_CLIENT_RATE_BURST=10)
+    def test_worker_applies_its_share(self):
+        sync_all._init_worker((150, 2))
+
+        self.assertEqual(
+            (settings.PLAID_CLIENT_RATE_PER_MINUTE, settings.PLAID_CLIENT_RATE_BURST),
+            (150, 2),
+        )
+
+
+class RequestLogContextTests(SeededUserTestCase):
+    def test_request_id_is_kept(self):
+        response = self.client.get(
+            "/api/get_transactions", HTTP_X_REQUEST_ID="proxy-id.1_a"
+        )
+
+        self.assertEqual(response["X-Request-ID"], "proxy-id.1_a")
+
+    def test_invalid_request_id_is_replaced(self):
+        for request_id in ["a" * 65, "id\r\nX-Injected: 1", 'id"}', ""]:
+            response = self.client.get(
+                "/api/get_transactions", HTTP_X_REQUEST_ID=request_id
+            )
+
+            self.assertRegex(response["X-Request-ID"], r"^[0-9a-f]{32}$")
+
+    def test_sync_records_name_the_item(self):
+        item = self.items[0]
+
+        def sync(item):
+            logger.info("Syncing")
+
+        logger = logging.getLogger("personal_finance_app")
+        context_filter = ContextFilter()
+        logger.addFilter(context_filter)
+        try:
+            with self.assertLogs(logger) as logs:
+                coalesced_sync("accounts", item, sync)
+        finally:
+            logger.removeFilter(context_filter)
+
+        self.assertEqual(logs.records[0].item_id, item.pk)
+
+
+class QueueStreamHandlerTests(TestCase):
+    def test_close_writes_queued_records(self):
+        stream = StringIO()
+        handler = QueueStreamHandler(stream)
+        handler.setFormatter(JsonFormatter())
+
+        handler.handle(logging.makeLogRecord({"msg": "queued %s", "args": (1,)}))
+        handler.close()
+        # Closing again, e.g. at exit, does nothing
+        handler.close()
+
+        self.assertEqual(json.loads(stream.getvalue())["message"], "queued 1")
+
+
+class ProfilingTests(SeededUserTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(
+            PROFILING_ENABLED=True, PROFILE_DIR=directory.name, PROFILE_KEEP=2
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        # Profiling authenticates the token itself, before the view does
+        self.staff = self.create_user("staff@example.com", is_staff=True)
+        self.client = APIClient(SERVER_NAME="localhost")
+        self.client.cookies[settings.AUTH_COOKIE] = str(
+            RefreshToken.for_user(self.staff).access_token
+        )
+
+    def profile(self) -> str:
+        response = self.client.get("/api/get_transactions", HTTP_X_PROFILE="store")
+        return response["X-Profile"]
+
+    def test_authentication_stays_in_the_request(self):
+        self.profile()
+
+        self.assertIsNone(current_shard())
+
+    def test_download_and_delete(self):
+        name = self.profile()
+
+        response = self.client.get(f"/profiles/{name}")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b"".join(response.streaming_content))
+        report = self.client.get(f"/profiles/{name[:-5]}.txt")
+        self.assertIn(b"SQL statements", b"".join(report.streaming_content))
+
+        self.assertEqual(self.client.delete(f"/profiles/{name}").status_code, 204)
+        self.assertEqual(self.client.get(f"/profiles/{name}").status_code, 404)
+        self.assertEqual(self.client.get("/profiles").data, [])
+
+    def test_only_newest_are_kept(self):
+        names = [self.profile() for _ in range(3)]
+        # Stored in the same second, only the random part orders them
+        newest = sorted(names, reverse=True)[:2]
+
+        self.assertEqual(self.client.get("/profiles").data, newest)
+
+    def test_only_stored_profiles_are_served(self):
+        for name in ["..%2Fsecret.prof", "missing.prof", "settings.py"]:
+            self.assertEqual(self.client.get(f"/profiles/{name}").status_code, 404)
+
+    def test_staff_only(self):
+        name = self.profile()
+        self.client.cookies[settings.AUTH_COOKIE] = str(
+            RefreshToken.for_user(self.user).access_token
+        )
+
+        self.assertEqual(self.client.get(f"/profiles/{name}").status_code, 403)
+        self.assertEqual(self.client.get("/profiles").status_code, 403)
+
+
+class StartupTests(TestCase):
+    def test_numpy_is_imported_on_first_use(self):
+        _, code = benchmark_startup.TARGETS["wsgi"]
+        process = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                f"{code}; import sys; print('numpy' in sys.modules)",
+            ],
+            cwd=benchmark_startup.PROJECT_DIR,
+            capture_output=True,
+            text=True,
+        )
+
+        self.assertEqual(process.stdout.strip(), "False", process.stderr[-2000:])
+
+    def test_parse_import_times(self):
+        output = "\n".join(
+            [
+                "import time: self [us] | cumulative | imported package",
+                "import time:       120 |        120 |   encodings.aliases",
+                "import time:       300 |       2500 | django.urls",
+                "import time:      1000 |     250000 | numpy",
+            ]
+        )
+
+        self.assertEqual(
+            benchmark_startup.parse_import_times(output),
+            {"django.urls": 0.0025, "numpy": 0.25},
+        )
+
+    def test_benchmark_writes_results(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "startup.json")
+            call_command(
+                "benchmark_startup", repeat=1, top=3, json=path, stdout=StringIO()
+            )
+
+            with open(path) as results_file:
+                results = json.load(results_file)
+
+        self.assertEqual(set(results), set(benchmark_startup.TARGETS))
+        self.assertNotIn("numpy", results["wsgi"]["slowest_imports"])
+        self.assertLessEqual(len(results["check"]["slowest_imports"]), 3)
+
+
+class MetricsTests(TestCase):
+    labels = {"method": "metrics_test", "institution": "ins_test"}
+
+    @override_settings(METRICS_AUTH_TOKEN="")
+    def test_disabled_without_token(self):
+        self.assertEqual(self.client.get("/metrics").status_code, 404)
+
+    @override_settings(METRICS_AUTH_TOKEN="secret")
+    def test_requires_token(self):
+        # Metrics are shared by every test, so this one has its own series
+        PLAID_REQUEST_DURATION.observe(
+            0.2, method="metrics_test", institution="ins_token"
+        )
+
+        self.assertEqual(self.client.get("/metrics").status_code, 401)
+        response = self.client.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'plaid_request_duration_seconds_bucket{method="metrics_test",'
+            'institution="ins_token",le="0.25"} 1',
+            response.content.decode(),
+        )
+
+    def test_concurrent_updates(self):
+        before = PLAID_REQUESTS.value(**self.labels, result="success")
+        observed = PLAID_REQUEST_DURATION.count(**self.labels)
+
+        def record():
+            for _ in range(1000):
+                PLAID_REQUESTS.inc(**self.labels, result="success")
+                PLAID_REQUEST_DURATION.observe(0.01, **self.labels)
+
+        threads = [threading.Thread(target=record) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(
+            PLAID_REQUESTS.value(**self.labels, result="success"), before + 4000
+        )
+        self.assertEqual(PLAID_REQUEST_DURATION.count(**self.labels), observed + 4000)
+
+
+@override_settings(
+    PLAID_RATE_LIMIT_ENABLED=True,
+    PLAID_CLIENT_RATE_PER_MINUTE=600,
+    PLAID_CLIENT_RATE_BURST=10,
+    PLAID_ITEM_RATE_PER_MINUTE=60,
+    PLAID_ITEM_RATE_BURST=2,
+)
+class PlaidRateLimitTests(TestCase):
+    """
+    Plaid calls queue on token buckets instead of failing.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.sleeps = []
+        for module in ("core.ratelimit", "api.plaid_client"):
+            patcher = mock.patch(
+                f"personalFinanceAppBackend.{module}.time.sleep", self.sleeps.append
+            )
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_bucket_queues_takes_past_its_capacity(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        state = None
+        waits = []
+        for _ in range(5):
+            state, wait = bucket.take(state, 100.0)
+            waits.append(wait)
+
+        self.assertEqual(waits, [0, 0, 0.5, 1.0, 1.5])
+        # Refilled tokens pay back the debt first
+        _, wait = bucket.take(state, 102.0)
+        self.assertEqual(wait, 0)
+
+    def test_cache_buckets_are_shared_between_stores(self):
+        bucket = TokenBucket(rate=1, capacity=1)
+
+        self.assertEqual(CacheBucketStore().take("shared", bucket), 0)
+        self.assertGreater(CacheBucketStore().take("shared", bucket), 0.9)
+
+    def test_falls_back_to_local_buckets_when_the_cache_fails(self):
+        store = mock.Mock()
+        store.take.side_effect = ConnectionError
+        limiter = RateLimiter(store)
+        bucket = TokenBucket(rate=1, capacity=1)
+
+        self.assertEqual(limiter.acquire("fallback", bucket), 0)
+        self.assertGreater(limiter.acquire("fallback", bucket), 0.9)
+        self.assertEqual(len(self.sleeps), 1)
+
+    def test_item_calls_wait_for_the_item_bucket(self):
+        plaid = mock.Mock()
+        plaid.accounts_get.return_value = FakePlaidResponse(accounts=[])
+        item = mock.Mock(item_id="item_1")
+        item.institution.institution_id = "ins_1"
+        item_client = InstrumentedPlaidClient(plaid).for_item(item)
+
+        for _ in range(4):
+            item_client.accounts_get(None)
+
+        self.assertEqual(plaid.accounts_get.call_count, 4)
+        self.assertEqual(len(self.sleeps), 2)
+        # Calls of other Items only share the client bucket
+        item.item_id = "item_2"
+        InstrumentedPlaidClient(plaid).for_item(item).accounts_get(None)
+        self.assertEqual(len(self.sleeps), 2)
+
+    def test_rate_limited_calls_are_retried(self):
+        from plaid.exceptions import ApiException
+
+        plaid = mock.Mock()
+        plaid.accounts_get.side_effect = [
+            ApiException(status=429),
+            ApiException(status=429),
+            FakePlaidResponse(accounts=[]),
+        ]
+
+        InstrumentedPlaidClient(plaid).accounts_get(None)
+
+        self.assertEqual(plaid.accounts_get.call_count, 3)
+        self.assertEqual(self.sleeps, [1.0, 2.0])
+
+    @override_settings(PLAID_RATE_LIMIT_RETRIES=1)
+    def test_retries_are_limited(self):
+        from plaid.exceptions import ApiException
+
+        plaid = mock.Mock()
+        plaid.accounts_get.side_effect = ApiException(status=429)
+
+        with self.assertRaises(ApiException):
+            InstrumentedPlaidClient(plaid).accounts_get(None)
+
+        self.assertEqual(plaid.accounts_get.call_count, 2)
+
+
+class IdempotencyKeyTests(SeededUserTestCase):
+    """
+    Plaid sync requests repeating an Idempotency-Key get the first response.
+    """
+
+    seed = {"items": 1, "accounts_per_item": 2, "transactions_per_account": 0}
+
+    def setUp(self):
+        super().setUp()
+        self.plaid = use_fake_plaid(self)
+
+    def save_accounts(self, key, **data):
+        return self.client.post(
+            "/api/save_accounts_from_plaid",
+            data,
+            format="json",
+            headers={"Idempotency-Key": key},
+        )
+
+    def test_repeated_key_replays_the_response(self):
+        with mock.patch.object(
+            self.plaid, "accounts_get", wraps=self.plaid.accounts_get
+        ) as accounts_get:
+            first = self.save_accounts("sync-1")
+            repeated = self.save_accounts("sync-1")
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(repeated.status_code, 201)
+        self.assertEqual(repeated.json(), first.json())
+        self.assertEqual(repeated.headers["Idempotent-Replayed"], "true")
+        self.assertEqual(accounts_get.call_count, 1)
+
+    def test_new_key_runs_again(self):
+        self.save_accounts("sync-1")
+
+        response = self.save_accounts("sync-2")
+
+        self.assertEqual(response.json(), "No New Accounts to Save From Plaid")
+        self.assertNotIn("Idempotent-Replayed", response.headers)
+
+    def test_key_reused_for_a_different_request(self):
+        self.save_accounts("sync-1")
+
+        response = self.save_accounts("sync-1", start_date="2024-01-01")
+
+        self.assertEqual(response.status_code, 422)
+
+    @override_settings(IDEMPOTENCY_WAIT_SECONDS=0)
+    def test_key_in_flight(self):
+        with mock.patch(
+            "personalFinanceAppBackend.api.idempotency.cache.add", return_value=False
+        ), mock.patch(
+            "personalFinanceAppBackend.api.idempotency.cache.get",
+            return_value={"fingerprint": mock.ANY, "status": None},
+        ):
+            response = self.save_accounts("sync-1")
+
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Account.objects.count(), 2)
+
+    def test_long_keys_fit_cache_servers(self):
+        key = "retry of sync " + "x" * 241
+        with mock.patch(
+            "personalFinanceAppBackend.api.idempotency.cache.add", wraps=cache.add
+        ) as cache_add:
+            first = self.save_accounts(key)
+        repeated = self.save_accounts(key)
+
+        cache_key = cache_add.call_args.args[0]
+        self.assertLessEqual(len(cache_key), 250)
+        self.assertNotIn(" ", cache_key)
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(repeated.headers["Idempotent-Replayed"], "true")
+
+    def test_server_errors_are_not_kept(self):
+        with mock.patch.object(
+            views, "sync_accounts", side_effect=RuntimeError
+        ), self.assertRaises(RuntimeError):
+            self.save_accounts("sync-1")
+
+        response = self.save_accounts("sync-1")
+
+        self.assertEqual(response.status_code, 201)
+
+
+class SingleFlightSyncTests(TestCase):
+    """
+    Concurrent syncs of a product of an Item join the one running first.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.item = Item(user_id=1, item_id="item_1")
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def blocking_sync(self, result):
+        def sync(item, *args):
+            self.started.set()
+            self.release.wait(5)
+            return result
+
+        return mock.Mock(side_effect=sync)
+
+    def run_concurrently(self, first, second, first_params="", second_params=""):
+        results = {}
+
+        def run(name, sync, params):
+            results[name] = coalesced_sync(
+                "transactions", self.item, sync, params=params
+            )
+
+        thread = threading.Thread(target=run, args=("first", first, first_params))
+        thread.start()
+        self.started.wait(5)
+        joiner = threading.Thread(target=run, args=("second", second, second_params))
+        joiner.start()
+        # Let the second caller find the running sync before it finishes
+        time.sleep(0.2)
+        self.release.set()
+        thread.join(5)
+        joiner.join(5)
+        return results
+
+    def test_concurrent_sync_joins_the_running_one(self):
+        first = self.blocking_sync(["saved"])
+        second = self.blocking_sync(["other"])
+
+        results = self.run_concurrently(first, second)
+
+        self.assertEqual(results["first"], (["saved"], True))
+        self.assertEqual(results["second"], (["saved"], False))
+        second.assert_not_called()
+
+    def test_syncs_with_other_params_wait_and_run(self):
+        first = self.blocking_sync(["first range"])
+        second = self.blocking_sync(["second range"])
+
+        results = self.run_concurrently(first, second, "2024-01", "2024-02")
+
+        self.assertEqual(results["second"], (["second range"], True))
+        first.assert_called_once()
+
+    def test_failed_sync_is_run_by_the_joined_caller(self):
+        def failing_sync(item, *args):
+            self.started.set()
+            self.release.wait(5)
+            raise ValueError
+
+        second = mock.Mock(return_value=["retried"])
+
+        with mock.patch("threading.excepthook"):
+            results = self.run_concurrently(mock.Mock(side_effect=failing_sync), second)
+
+        self.assertNotIn("first", results)
+        self.assertEqual(results["second"], (["retried"], True))
+
+    @override_settings(SYNC_WAIT_SECONDS=0)
+    def test_waiting_is_limited(self):
+        cache.add(
+            "single_flight:sync:1:item_1:transactions",
+            {"id": "running", "params": ""},
+        )
+
+        with self.assertRaises(SingleFlightTimeout):
+            coalesced_sync("transactions", self.item, mock.Mock())
+
+    def test_key_taken_over_after_expiry_is_kept(self):
+        lock_key = "single_flight:sync:1:item_1:transactions"
+
+        def slow_sync(item):
+            # The key expired during the sync and another caller took it
+            cache.set(lock_key, {"id": "next", "params": ""})
+            return ["saved"]
+
+        result = coalesced_sync("transactions", self.item, slow_sync)
+
+        self.assertEqual(result, (["saved"], True))
+        self.assertEqual(cache.get(lock_key)["id"], "next")
+
+    def test_key_is_released(self):
+        coalesced_sync("transactions", self.item, mock.Mock(return_value=[]))
+
+        self.assertIsNone(cache.get("single_flight:sync:1:item_1:transactions"))
+
+
+class PlaidPayloadTests(SeededUserTestCase):
+    """
+    Raw Plaid responses are stored and replayed without calling Plaid.
+    """
+
+    seed = {"items": 2, "accounts_per_item": 3, "transactions_per_account": 0}
+
+    def setUp(self):
+        super().setUp()
+        self.plaid = use_fake_plaid(self)
+
+    def test_sync_stores_the_raw_responses(self):
+        self.client.post("/api/save_transactions_from_plaid")
+
+        pages = load_payloads(self.items[0], "transactions")
+
+        self.assertEqual(len(pages), 1)
+        self.assertEqual(len(pages[0]["response"]["transactions"]), 3 * 5)
+        self.assertEqual(pages[0]["response"]["transactions"][0]["date"], date.today())
+        self.assertIn("end_date", pages[0]["request"])
+
+    def test_fetch_replaces_the_previous_pages(self):
+        response = FakePlaidResponse(accounts=[])
+        save_payloads(self.items[0], "accounts", [response, response])
+
+        save_payloads(self.items[0], "accounts", [response])
+
+        self.assertEqual(PlaidPayload.objects.filter(product="accounts").count(), 1)
+
+    def test_replay_ingests_without_calling_plaid(self):
+        self.client.post("/api/save_transactions_from_plaid")
+        self.client.post("/api/save_investments_from_plaid")
+        Transaction.objects.all().delete()
+        Investment.objects.all().delete()
+
+        with mock.patch.object(views.client, "_client", mock.Mock(spec=[])):
+            out = StringIO()
+            call_command(
+                "replay_plaid_payloads",
+                products=["transactions", "investments"],
+                stdout=out,
+            )
+
+        self.assertIn("transactions: 30 new rows", out.getvalue())
+        self.assertEqual(Transaction.objects.count(), 2 * 3 * 5)
+        self.assertEqual(Investment.objects.count(), 2 * 3 * 5)
+
+
+class ReprocessTests(SeededUserTestCase):
+    """
+    reprocess cleans stored transactions again in resumable chunks.
+    """
+
+    seed = {"items": 1, "accounts_per_item": 2, "transactions_per_account": 12}
+
+    def setUp(self):
+        super().setUp()
+        checkpoint_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(checkpoint_dir.cleanup)
+        self.checkpoint_file = os.path.join(checkpoint_dir.name, "checkpoint.jsonl")
+
+    def reprocess(self, **options) -> str:
+        out = StringIO()
+        call_command(
+            "reprocess",
+            workers=0,
+            chunk_size=5,
+            checkpoint_file=self.checkpoint_file,
+            stdout=out,
+            **options,
+        )
+        return out.getvalue()
+
+    def test_applies_rules_and_updates_budgets(self):
+        CategorizationRule.objects.create(
+            user=self.user, name_contains="coffee", primary_category="COFFEE"
+        )
+        budget = Budget.objects.create(
+            user=self.user,
+            primary_category="COFFEE",
+            period=Budget.YEARLY,
+            amount_limit=1000,
+            period_start=date.today().replace(month=1, day=1),
+        )
+        Transaction.objects.update(merchant="")
+
+        output = self.reprocess()
+
+        self.assertIn("Processed 24 rows", output)
+        self.assertFalse(Transaction.objects.filter(merchant="").exists())
+        coffee = Transaction.objects.filter(name="Coffee Shop")
+        self.assertEqual(
+            set(coffee.values_list("primary_category", flat=True)), {"COFFEE"}
+        )
+        budget.refresh_from_db()
+        self.assertGreater(budget.spent, 0)
+        self.assertEqual(budget.spent, recalculate_budget(budget).spent)
+
+    def test_budgets_are_saved_with_the_transactions(self):
+        Transaction.objects.update(merchant="")
+
+        with mock.patch(
+            "personalFinanceAppBackend.api.reprocessing.apply_budget_changes",
+            side_effect=DatabaseError,
+        ), self.assertRaises(DatabaseError):
+            reprocess_chunk(
+                "transactions", "default", 0, Transaction.objects.latest("pk").pk
+            )
+
+        self.assertEqual(Transaction.objects.exclude(merchant="").count(), 0)
+
+    def test_resume_skips_finished_chunks(self):
+        self.reprocess()
+
+        output = self.reprocess(resume=True)
+
+        self.assertIn("Reprocessing 0 chunks", output)
+
+    def test_reprocesses_from_raw_payloads(self):
+        plaid = FakePlaidClient(accounts_per_item=2, rows_per_account=3)
+        with mock.patch.object(views.client, "_client", plaid):
+            sync_transactions(
+                self.items[0],
+                None,
+                date.today() - timedelta(days=30),
+                date.today(),
+            )
+        Transaction.objects.filter(transaction_id__contains="_plaid_").update(
+            name="", amount=0
+        )
+
+        output = self.reprocess(source="payloads")
+
+        self.assertIn("updated 6 transactions", output)
+        self.assertFalse(Transaction.objects.filter(name="").exists())
+
+
+@override_settings(TRANSACTION_ARCHIVE_AGE_DAYS=3 * 365)
+class SparseFieldsetTests(SeededUserTestCase):
+    """
+    List endpoints select and return only the fields asked for with ?fields=.
+    """
+
+    seed = {
+        "items": 1,
+        "accounts_per_item": 2,
+        "transactions_per_account": 5,
+        "investments_per_account": 2,
+    }
+
+    def test_transactions_select_only_the_fields_asked_for(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/api/get_transactions?fields=date,name,amount")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(set(response.data[0]), {"date", "name", "amount"})
+        select = queries.captured_queries[-1]["sql"]
+        self.assertIn('"name"', select)
+        self.assertNotIn('"payment_channel"', select)
+
+    def test_all_fields_without_the_parameter(self):
+        response = self.client.get("/api/get_accounts")
+
+        self.assertEqual(set(response.data[0]), set(AccountSerializer.Meta.fields))
+
+    def test_investments_with_fields(self):
+        response = self.client.get("/api/get_investments?fields=id,security_id")
+
+        self.assertEqual(len(response.data), 4)
+        self.assertEqual(set(response.data[0]), {"id", "security_id"})
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get("/api/get_transactions?fields=date,secret")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["detail"], "Unknown Fields: secret")
+
+    def test_archived_transactions_are_narrowed_too(self):
+        account = Account.objects.filter(item__user=self.user).first()
+        Transaction.objects.create(
+            account=account,
+            transaction_id="old_purchase",
+            amount=20,
+            date=date.today() - timedelta(days=365 * 4),
+            name="Old Purchase",
+        )
+        call_command("archive_transactions", stdout=StringIO())
+        start_date = date.today() - timedelta(days=365 * 5)
+
+        response = self.client.get(
+            f"/api/get_transactions?start_date={start_date}"
+            f"&end_date={date.today()}&fields=name"
+        )
+
+        self.assertEqual(len(response.data), 11)
+        self.assertIn({"name": "Old Purchase"}, response.data)
+        self.assertEqual({tuple(row) for row in response.data}, {("name",)})
+
+
+class PlaidSyncQueryBudgetTests(QueryBudgetTestCase):
+    """
+    Plaid sync endpoints run a fixed number of queries per Item.
+
+    The number of Items stays the same, while the rows Plaid returns for
+    each of them grow. As in a daily sync, most of the returned rows are
+    stored already and only as many rows as before are new, since new rows
+    are inserted in batches.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="sync@example.com",
+            password="password",
+            first_name="Plaid",
+            last_name="Sync",
+        )
+        cls.items = seed_user_data(
+            cls.user, items=2, accounts_per_item=2, transactions_per_account=5
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_authenticate(self.user)
+        self.plaid = use_fake_plaid(self)
+        self.institutions = count()
+
+    def grow(self):
+        self.plaid.accounts_per_item = 8
+        self.plaid.rows_per_account = 60
+        known_accounts = []
+        for item in self.items:
+            account_ids = self.plaid.account_ids(item.access_token)
+            known_accounts.extend(
+                Account(item=item, account_id=account_id, current_balance=0)
+                for account_id in account_ids[2:7]
+            )
+        Account.objects.bulk_create(known_accounts, ignore_conflicts=True)
+
+        # The last rows of the seeded accounts are the only new ones
+        today = date.today()
+        known_transactions = []
+        known_investments = []
+        for account in Account.objects.filter(item__in=self.items):
+            seeded = account.account_id.endswith(("_account_0", "_account_1"))
+            for index in range(55 if seeded else 60):
+                known_transactions.append(
+                    Transaction(
+                        account=account,
+                        transaction_id=f"{account.account_id}_plaid_{index}",
+                        amount=10,
+                        date=today,
+                    )
+                )
+                known_investments.append(
+                    Investment(
+                        account=account,
+                        security_id=f"{account.account_id}_plaid_security_{index}",
+                        price=50,
+                        price_as_of=today,
+                        cost_basis=40,
+                        quantity=2,
+                    )
+                )
+        Transaction.objects.bulk_create(known_transactions, ignore_conflicts=True)
+        Investment.objects.bulk_create(known_investments, ignore_conflicts=True)
+
+    def test_create_link_token(self):
+        self.assertWithinBudget(
+            0, lambda: ("post", "/api/create_link_token/", {}), status_code=201
+        )
+
+    def test_create_update_link_token(self):
+        self.assertWithinBudget(
+            1,
+            lambda: (
+                "post",
+                "/api/create_link_token/",
+                {"item_id": self.items[0].pk},
+            ),
+            status_code=201,
+        )
+
+    def test_set_access_token(self):
+        def build_request():
+            number = next(self.institutions)
+            return (
+                "post",
+                "/api/set_access_token/",
+                {
+                    "public_token": "public-sandbox-token",
+                    "institution_data": {
+                        "institution_id": f"new_ins_{number}",
+                        "name": f"New Bank {number}",
+                    },
+                },
+            )
+
+        self.assertWithinBudget(6, build_request, status_code=201)
+
+    # Storing the raw Plaid pages of an Item takes an upsert and a delete
+    def test_save_accounts_from_plaid(self):
+        self.assertWithinBudget(
+            9, lambda: ("post", "/api/save_accounts_from_plaid", None), status_code=201
+        )
+
+    def test_save_transactions_from_plaid(self):
+        self.assertWithinBudget(
+            23,
+            lambda: ("post", "/api/save_transactions_from_plaid", None),
+            status_code=201,
+        )
+
+    def test_save_investments_from_plaid(self):
+        self.assertWithinBudget(
+            11,
+            lambda: ("post", "/api/save_investments_from_plaid", None),
+            status_code=201,
+        )
@@ -5,11 +5,20 @@ from .views import (
     AccountDetailsDB,
     AccountListDB,
     AccountListPlaid,
+    BudgetDetailsDB,
+    BudgetListDB,
+    CashFlowForecastDB,
+    CategorizationRuleApply,
+    CategorizationRuleDetailsDB,
+    CategorizationRuleListDB,
     InstitutionDetailsDB,
     InvestmentListDB,
     InvestmentListPlaid,
     PlaidLinkToken,
     PublicTokenExchange,
+    RecurringStreamListDB,
+    SpendingAnomalyListDB,
+    TransactionBulkDB,
     TransactionDetailsDB,
     TransactionListDB,
     TransactionListPlaid,
@@ -28,6 +37,18 @@ urlpatterns = [
     path("api/save_transactions_from_plaid", TransactionListPlaid.as_view()),
     path("api/get_transactions", TransactionListDB.as_view()),
     path("api/transaction/<int:pk>", TransactionDetailsDB.as_view()),
+    path("api/transactions/bulk", TransactionBulkDB.as_view()),
+    path("api/get_cash_flow_forecast", CashFlowForecastDB.as_view()),
+    path("api/budgets", BudgetListDB.as_view()),
+    path("api/budget/<int:pk>", BudgetDetailsDB.as_view()),
+    path("api/get_recurring_streams", RecurringStreamListDB.as_view()),
+    path("api/get_anomalies", SpendingAnomalyListDB.as_view()),
+    path("api/categorization_rules", CategorizationRuleListDB.as_view()),
+    path(
+        "api/categorization_rule/<int:pk>",
+        CategorizationRuleDetailsDB.as_view(),
+    ),
+    path("api/apply_categorization_rules", CategorizationRuleApply.as_view()),
     path("api/save_investments_from_plaid", InvestmentListPlaid.as_view()),
     path("api/get_investments", InvestmentListDB.as_view()),
 ]
@@ -1,14 +1,39 @@
 from datetime import datetime
 from logging import getLogger
 
-from django.core.exceptions import MultipleObjectsReturned
 from django.db import DatabaseError
 
+from .categorization import CategorizationMatcher
 from .models import Account
+from .recurring import normalize_merchant
 
 logger = getLogger("personal_finance_app")
 
 
+def _account_pks(rows: list) -> dict | None:
+    """
+    Map the Plaid account ids of rows to Account primary keys in one query.
+
+    Plaid account ids stored for several Accounts map to None.
+
+    Returns:
+        Dictionary of account ids to primary keys, or None on a database error
+    """
+    account_ids = {row["account_id"] for row in rows if "account_id" in row}
+    account_pks = {}
+
+    try:
+        for account_id, pk in Account.objects.filter(
+            account_id__in=account_ids
+        ).values_list("account_id", "pk"):
+            account_pks[account_id] = None if account_id in account_pks else pk
+    except DatabaseError as e:
+        logger.error("Database error while fetching accounts: %s", e)
+        return None
+
+    return account_pks
+
+
 def clean_accounts_data(item_id: int, accounts: list) -> list:
     """
     Clean and transform Plaid account data into application format.
@@ -51,7 +76,8 @@ def clean_accounts_data(item_id: int, accounts: list) -> list:
 
         except (KeyError, TypeError) as e:
             logger.error(
-                f"Error cleaning account data: {e}",
+                "Error cleaning account data: %s",
+                e,
                 extra={
                     "account_id": account.get("account_id", "unknown"),
                     "error": str(e),
@@ -62,44 +88,49 @@ def clean_accounts_data(item_id: int, accounts: list) -> list:
     return cleaned_accounts
 
 
-def clean_transaction_data(transactions: list) -> list:
+def clean_transaction_data(
+    transactions: list, matcher: CategorizationMatcher | None = None
+) -> list:
     """
     Clean and transform Plaid transaction data into application format.
 
     Args:
         transactions: List of transaction data from Plaid API
+        matcher: Optional user categorization rules overriding Plaid's category
 
     Returns:
         List of cleaned transaction data ready for serialization
     """
     cleaned_transactions = []
 
+    account_pks = _account_pks(transactions)
+    if account_pks is None:
+        return cleaned_transactions
+
     for transaction in transactions:
         try:
             if "account_id" not in transaction or "transaction_id" not in transaction:
                 logger.error("Transaction missing required fields")
                 continue
 
-            try:
-                account = Account.objects.get(account_id=transaction["account_id"])
-            except Account.DoesNotExist:
+            if transaction["account_id"] not in account_pks:
                 logger.error(
-                    f"Account not found for transaction {transaction['transaction_id']}"
+                    "Account not found for transaction %s",
+                    transaction["transaction_id"],
                 )
                 continue
-            except MultipleObjectsReturned:
+            account_pk = account_pks[transaction["account_id"]]
+            if account_pk is None:
                 logger.error(
-                    f"Multiple accounts found for transaction {transaction['transaction_id']}"
+                    "Multiple accounts found for transaction %s",
+                    transaction["transaction_id"],
                 )
                 continue
-            except DatabaseError as e:
-                logger.error(f"Database error while fetching account: {e}")
-                continue
 
             category = transaction.get("personal_finance_category", {})
 
             cleaned_transaction = {
-                "account": account.pk,
+                "account": account_pk,
                 "transaction_id": transaction["transaction_id"],
                 "amount": transaction.get("amount", 0),
                 "date": transaction.get("date", datetime.now().date()),
@@ -107,13 +138,21 @@ def clean_transaction_data(transactions: list) -> list:
                 "payment_channel": transaction.get("payment_channel", ""),
                 "primary_category": category.get("primary", ""),
                 "detailed_category": category.get("detailed", ""),
+                "merchant": normalize_merchant(transaction.get("name", "")),
+                "pending": bool(transaction.get("pending", False)),
+                "pending_transaction_id": transaction.get("pending_transaction_id")
+                or "",
             }
 
+            if matcher:
+                matcher.categorize(cleaned_transaction)
+
             cleaned_transactions.append(cleaned_transaction)
 
         except (ValueError, TypeError) as e:
             logger.error(
-                f"Error cleaning transaction data: {e}",
+                "Error cleaning transaction data: %s",
+                e,
                 extra={
                     "transaction_id": transaction.get("transaction_id", "unknown"),
                     "error": str(e),
@@ -147,33 +186,35 @@ def clean_investment_data(holdings: list, securities: list) -> list:
         if "security_id" in security
     }
 
+    account_pks = _account_pks(holdings)
+    if account_pks is None:
+        return cleaned_investments
+
     for holding in holdings:
         try:
             if "account_id" not in holding:
                 logger.error("Holding missing account_id field")
                 continue
 
-            try:
-                account = Account.objects.get(account_id=holding["account_id"])
-            except Account.DoesNotExist:
+            if holding["account_id"] not in account_pks:
                 logger.error(
-                    f"Account not found for holding {holding.get('security_id', 'unknown')}"
+                    "Account not found for holding %s",
+                    holding.get("security_id", "unknown"),
                 )
                 continue
-            except MultipleObjectsReturned:
+            account_pk = account_pks[holding["account_id"]]
+            if account_pk is None:
                 logger.error(
-                    f"Multiple accounts found for holding {holding.get('security_id', 'unknown')}"
+                    "Multiple accounts found for holding %s",
+                    holding.get("security_id", "unknown"),
                 )
                 continue
-            except DatabaseError as e:
-                logger.error(f"Database error while fetching account: {e}")
-                continue
 
             security_id = holding.get("security_id", "")
             security_info = security_lookup.get(security_id, {"name": "", "ticker": ""})
 
             cleaned_investment = {
-                "account": account.pk,
+                "account": account_pk,
                 "security_id": security_id,
                 "security_name": security_info["name"],
                 "security_ticker": security_info["ticker"],
@@ -189,7 +230,8 @@ def clean_investment_data(holdings: list, securities: list) -> list:
 
         except (ValueError, TypeError) as e:
             logger.error(
-                f"Error cleaning investment data: {e}",
+                "Error cleaning investment data: %s",
+                e,
                 extra={
                     "security_id": holding.get("security_id", "unknown"),
                     "error": str(e),
@@ -220,7 +262,7 @@ def clean_institution_data(institution_id: str, institution_name: object):
         return cleaned_institution
 
     except (KeyError, TypeError) as e:
-        logger.error(f"Error cleaning institution data: {e}", extra={"error": str(e)})
+        logger.error("Error cleaning institution data: %s", e, extra={"error": str(e)})
 
 
 def clean_item_data(item_id: str, access_token: str, institution_id: str):
@@ -245,4 +287,4 @@ def clean_item_data(item_id: str, access_token: str, institution_id: str):
         return cleaned_item
 
     except (KeyError, TypeError) as e:
-        logger.error(f"Error cleaning item data: {e}", extra={"error": str(e)})
+        logger.error("Error cleaning item data: %s", e, extra={"error": str(e)})
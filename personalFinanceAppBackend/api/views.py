@@ -1,69 +1,99 @@
 import json
-import os
 from datetime import datetime, timedelta
 from logging import getLogger
 
-from django.db import IntegrityError
-from plaid.api import plaid_api
-from plaid.api_client import ApiClient, ApiException
-from plaid.configuration import Configuration, Environment
-from plaid.model.accounts_get_request import AccountsGetRequest
-from plaid.model.country_code import CountryCode
-from plaid.model.institutions_get_by_id_request import InstitutionsGetByIdRequest
-from plaid.model.investments_holdings_get_request import InvestmentsHoldingsGetRequest
-from plaid.model.item_get_request import ItemGetRequest
-from plaid.model.item_public_token_exchange_request import (
-    ItemPublicTokenExchangeRequest,
-)
-from plaid.model.link_token_create_request import LinkTokenCreateRequest
-from plaid.model.link_token_create_request_user import LinkTokenCreateRequestUser
-from plaid.model.products import Products
-from plaid.model.transactions_get_request import TransactionsGetRequest
+from django.conf import settings
+from django.db import IntegrityError, router
+from django.db import transaction as db_transaction
 from rest_framework import generics, status
 from rest_framework.decorators import APIView
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
 
-from .models import Account, Institution, Investment, Item, Transaction
+from personalFinanceAppBackend.core.routers import ReplicaReadMixin
+from personalFinanceAppBackend.core.singleflight import SingleFlightTimeout
+
+from .archive import archived_transactions, reaches_archive
+from .budgets import apply_budget_changes, budget_entry
+from .categorization import CategorizationMatcher, apply_categorization_rules
+from .forecasting import get_cash_flow_forecast, invalidate_cash_flow_forecast
+from .idempotency import idempotent
+from .models import (
+    Account,
+    Budget,
+    CategorizationRule,
+    Institution,
+    Investment,
+    Item,
+    RecurringStream,
+    SpendingAnomaly,
+    Transaction,
+)
 from .serializers import (
     AccountSerializer,
+    BudgetSerializer,
+    CategorizationRuleSerializer,
     InstitutionSerializer,
     InvestmentSerializer,
     ItemSerializer,
+    RecurringStreamSerializer,
+    SpendingAnomalySerializer,
+    TransactionBulkSerializer,
+    TransactionBulkUpdateSerializer,
     TransactionSerializer,
 )
-from .utils import (
-    clean_accounts_data,
-    clean_institution_data,
-    clean_investment_data,
-    clean_item_data,
-    clean_transaction_data,
+from .sync import (
+    apply_transaction_changes,
+    client,
+    coalesced_sync,
+    sync_accounts,
+    sync_investments,
+    sync_transactions,
 )
+from .utils import clean_institution_data, clean_item_data
 
-if os.getenv("PLAID_ENV") == "production":
-    host = Environment.Production
-else:
-    host = Environment.Sandbox
-
-configuration = Configuration(
-    host=host,
-    api_key={
-        "clientId": os.getenv("PLAID_CLIENT_ID"),
-        "secret": os.getenv("PLAID_SECRET"),
-        "plaidVersion": "2020-09-14",
-    },
-)
+logger = getLogger("personal_finance_app")
 
-api_client = ApiClient(configuration)
-client = plaid_api.PlaidApi(api_client)
 
-logger = getLogger("personal_finance_app")
+class RequestedFieldsMixin:
+    """
+    View mixin reading the fields a list request asks for with ?fields=,
+    e.g. ?fields=date,name,amount, so only those are selected and serialized.
+    """
+
+    def requested_fields(self, serializer_class) -> list | None:
+        """
+        Return the requested fields of a serializer, or None for all fields.
+
+        Raises:
+            ParseError: When a requested field is not a field of the serializer
+        """
+        param = self.request.query_params.get("fields")
+        if not param:
+            return None
+
+        fields = [field.strip() for field in param.split(",") if field.strip()]
+        unknown = set(fields) - set(serializer_class.Meta.fields)
+        if unknown:
+            raise ParseError(f"Unknown Fields: {', '.join(sorted(unknown))}")
+        return fields
 
 
 class PlaidLinkToken(APIView):
     def post(self, request):
+        from plaid.model.country_code import CountryCode
+        from plaid.model.link_token_create_request import LinkTokenCreateRequest
+        from plaid.model.link_token_create_request_user import (
+            LinkTokenCreateRequestUser,
+        )
+        from plaid.model.products import Products
+
         user = request.user
         if "item_id" in request.data and not request.data["item_id"] is None:
-            item = Item.objects.get(pk=request.data["item_id"])
+            try:
+                item = Item.objects.get(pk=request.data["item_id"], user=user)
+            except Item.DoesNotExist:
+                return Response("Item Not Found", status=status.HTTP_404_NOT_FOUND)
             # Update Link Request for existing user
             update_link_request = LinkTokenCreateRequest(
                 client_name="G&E Personal Finance",
@@ -95,7 +125,13 @@ class PlaidLinkToken(APIView):
 
 
 class PublicTokenExchange(APIView):
+    @idempotent
     def post(self, request):
+        from plaid.exceptions import ApiException
+        from plaid.model.item_public_token_exchange_request import (
+            ItemPublicTokenExchangeRequest,
+        )
+
         user = request.user
         institution_id = request.data["institution_data"]["institution_id"]
         institution_name = request.data["institution_data"]["name"]
@@ -109,7 +145,9 @@ class PublicTokenExchange(APIView):
             )
 
         try:
-            token_response = client.item_public_token_exchange(token_request)
+            token_response = client.for_institution(
+                institution_id
+            ).item_public_token_exchange(token_request)
         except ApiException as e:
             response = json.loads(e.body)
 
@@ -162,13 +200,14 @@ class PublicTokenExchange(APIView):
         )
 
 
-class InstitutionDetailsDB(APIView):
+class InstitutionDetailsDB(ReplicaReadMixin, APIView):
     def get(self, request, account_id):
-        account = Account.objects.get(pk=account_id)
-
-        item = Item.objects.get(item=account.item)
-
-        institution = Institution.objects.get(institution=item.institution)
+        try:
+            institution = Institution.objects.get(
+                item__account=account_id, item__user=request.user
+            )
+        except Institution.DoesNotExist:
+            return Response("Account Not Found", status=status.HTTP_404_NOT_FOUND)
 
         institution_serializer = InstitutionSerializer(institution)
 
@@ -176,18 +215,18 @@ class InstitutionDetailsDB(APIView):
 
 
 class AccountListPlaid(APIView):
+    @idempotent
     def post(self, request):
-        items = Item.objects.filter(user=request.user)
+        from plaid.exceptions import ApiException
+
+        items = Item.objects.filter(user=request.user).select_related("institution")
         accounts_saved_list = []
         accounts_dict = {}
 
         # Get All Accounts For User
         for item in items:
-            access_token = item.access_token
-
             try:
-                accounts_request = AccountsGetRequest(access_token=access_token)
-                accounts_response = client.accounts_get(accounts_request)
+                saved_accounts, _ = coalesced_sync("accounts", item, sync_accounts)
             except ApiException as e:
                 response = json.loads(e.body)
 
@@ -201,29 +240,21 @@ class AccountListPlaid(APIView):
                         }
                     }
                 )
+            except IntegrityError as e:
+                return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+            except SingleFlightTimeout:
+                return Response(
+                    "Sync Already in Progress", status=status.HTTP_409_CONFLICT
+                )
 
-            # Clean the Account Data
-            accounts = clean_accounts_data(item.pk, accounts_response["accounts"])
-
-            # Skip Existing Accounts and Save New Accounts
-            for acc in accounts:
-                if Account.objects.filter(
-                    item=acc["item"], account_id=acc["account_id"]
-                ):
-                    continue
-                else:
-                    try:
-                        # Save Account Data to DB
-                        account_serializer = AccountSerializer(data=acc)
-                        account_serializer.is_valid(raise_exception=True)
-                        account_serializer.save()
-                    except IntegrityError as e:
-                        return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
-
-                accounts_saved_list.append(account_serializer.data)
+            accounts_saved_list.extend(
+                AccountSerializer(saved_accounts, many=True).data
+            )
             if len(accounts_saved_list) != 0:
                 accounts_dict[item.institution_id] = accounts_saved_list
 
+        invalidate_cash_flow_forecast(request.user.pk)
+
         if not accounts_dict:
             return Response(
                 "No New Accounts to Save From Plaid", status=status.HTTP_200_OK
@@ -232,24 +263,23 @@ class AccountListPlaid(APIView):
         return Response(accounts_dict, status=status.HTTP_201_CREATED)
 
 
-class AccountListDB(APIView):
+class AccountListDB(RequestedFieldsMixin, ReplicaReadMixin, APIView):
     def get(self, request):
-        items = Item.objects.filter(user=request.user)
-        accounts = []
-
-        for item in items:
-            db_accounts = Account.objects.filter(item=item.pk)
-            account_serializer = AccountSerializer(db_accounts, many=True)
-            for acc in account_serializer.data:
-                accounts.append(acc)
+        fields = self.requested_fields(AccountSerializer)
+        accounts = Account.objects.filter(item__user=request.user).order_by(
+            "item", "pk"
+        )
+        if fields is not None:
+            accounts = accounts.only(*fields)
+        account_serializer = AccountSerializer(accounts, many=True, fields=fields)
 
-        return Response(accounts, status=status.HTTP_200_OK)
+        return Response(account_serializer.data, status=status.HTTP_200_OK)
 
 
 class AccountDetailsDB(APIView):
     def get(self, request, pk):
         try:
-            account = Account.objects.get(pk=pk)
+            account = Account.objects.get(pk=pk, item__user=request.user)
             account_serializer = AccountSerializer(account)
         except Account.DoesNotExist:
             return Response("Account Not Found", status=status.HTTP_404_NOT_FOUND)
@@ -261,14 +291,16 @@ class AccountDetailsDB(APIView):
 
 
 class TransactionListPlaid(APIView):
+    @idempotent
     def post(self, request):
-        items = Item.objects.filter(user=request.user)
+        items = Item.objects.filter(user=request.user).select_related("institution")
+        matcher = CategorizationMatcher.for_user(request.user)
         transactions_saved_list = []
         transactions_dict = {}
+        all_saved_transactions = []
+        all_removed_transactions = []
 
         for item in items:
-            access_token = item.access_token
-
             start_date = (datetime.now() - timedelta(days=720)).date()
             end_date = datetime.now().date()
 
@@ -278,33 +310,38 @@ class TransactionListPlaid(APIView):
                 start_date = request.data["start_date"]
                 end_date = request.data["end_date"]
 
-            transaction_request = TransactionsGetRequest(
-                access_token=access_token,
-                start_date=start_date,
-                end_date=end_date,
-            )
-
-            response = client.transactions_get(transaction_request)
-
-            ## Clean the Transaction Data
-            transactions = clean_transaction_data(response["transactions"])
+            try:
+                (saved_transactions, removed_transactions), ran = coalesced_sync(
+                    "transactions",
+                    item,
+                    sync_transactions,
+                    matcher,
+                    start_date,
+                    end_date,
+                    params=f"{start_date}:{end_date}",
+                )
+            except IntegrityError as e:
+                return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+            except SingleFlightTimeout:
+                return Response(
+                    "Sync Already in Progress", status=status.HTTP_409_CONFLICT
+                )
 
-            for tran in transactions:
-                # Skip existing transactions and save new transactions
-                if Transaction.objects.filter(transaction_id=tran["transaction_id"]):
-                    continue
-                else:
-                    try:
-                        transaction_serializer = TransactionSerializer(data=tran)
-                        transaction_serializer.is_valid(raise_exception=True)
-                        transaction_serializer.save()
-                    except IntegrityError as e:
-                        return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+            # A joined sync's changes are applied by the request that ran it
+            if ran:
+                all_saved_transactions.extend(saved_transactions)
+                all_removed_transactions.extend(removed_transactions)
 
-                    transactions_saved_list.append(transaction_serializer.data)
+            transactions_saved_list.extend(
+                TransactionSerializer(saved_transactions, many=True).data
+            )
             if len(transactions_saved_list) != 0:
                 transactions_dict[item.institution.pk] = transactions_saved_list
 
+        apply_transaction_changes(
+            request.user, all_saved_transactions, all_removed_transactions
+        )
+
         if not transactions_dict:
             return Response(
                 "No New Transactions to Save From Plaid",
@@ -314,76 +351,299 @@ class TransactionListPlaid(APIView):
         return Response(transactions_dict, status=status.HTTP_201_CREATED)
 
 
-class TransactionListDB(APIView):
+class TransactionListDB(RequestedFieldsMixin, ReplicaReadMixin, APIView):
     def get(self, request):
-        items = Item.objects.filter(user=request.user)
+        fields = self.requested_fields(TransactionSerializer)
         start_date = request.query_params.get(
             "start_date",
         )
         end_date = request.query_params.get("end_date", datetime.now().date())
-        if start_date == "undefined" or end_date == "undefined":
+        if start_date in (None, "undefined") or end_date == "undefined":
             start_date = (datetime.now() - timedelta(days=720)).date()
             end_date = datetime.now().date()
-        transactions = []
-        for item in items:
-            db_accounts = Account.objects.filter(item=item)
-
-            account_id_list = [acc.pk for acc in db_accounts]
+        archived = reaches_archive(start_date)
+        # Archived rows are merged in by account and date
+        selected = fields
+        if archived and fields is not None:
+            selected = list(dict.fromkeys([*fields, "account", "date"]))
+
+        transactions = Transaction.objects.filter(
+            account__item__user=request.user, date__range=(start_date, end_date)
+        ).order_by("account__item", "-date")
+        if selected is not None:
+            transactions = transactions.only(*selected)
+        transaction_serializer = TransactionSerializer(
+            transactions, many=True, fields=selected
+        )
 
-            db_transactions = Transaction.objects.filter(
-                account__in=account_id_list, date__range=(start_date, end_date)
-            ).order_by("-date")
-            transaction_serializer = TransactionSerializer(db_transactions, many=True)
-            for tran in transaction_serializer.data:
-                transactions.append(tran)
+        if not archived:
+            return Response(
+                transaction_serializer.data,
+                status=status.HTTP_200_OK,
+            )
 
-        return Response(
-            transactions,
-            status=status.HTTP_200_OK,
+        # Archived rows of accounts removed since are not returned
+        account_items = dict(
+            Account.objects.filter(item__user=request.user).values_list("pk", "item")
         )
+        rows = transaction_serializer.data + [
+            row
+            for row in archived_transactions(request.user, start_date, end_date)
+            if row["account"] in account_items
+        ]
+        rows.sort(key=lambda row: row["date"], reverse=True)
+        rows.sort(key=lambda row: account_items[row["account"]])
+        if fields is not None:
+            rows = [{field: row[field] for field in fields} for row in rows]
+
+        return Response(rows, status=status.HTTP_200_OK)
 
 
 class TransactionDetailsDB(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Transaction.objects.all()
     serializer_class = TransactionSerializer
 
+    def get_queryset(self):
+        return Transaction.objects.filter(account__item__user=self.request.user)
+
+    def perform_update(self, serializer):
+        previous_entry = budget_entry(serializer.instance)
+        transaction = serializer.save()
+        apply_budget_changes(
+            self.request.user.pk,
+            removed=[previous_entry],
+            added=[budget_entry(transaction)],
+        )
+        invalidate_cash_flow_forecast(self.request.user.pk)
+
+    def perform_destroy(self, instance):
+        removed_entry = budget_entry(instance)
+        instance.delete()
+        apply_budget_changes(self.request.user.pk, removed=[removed_entry])
+        invalidate_cash_flow_forecast(self.request.user.pk)
+
+
+class TransactionBulkDB(APIView):
+    def get_transactions(self, request, data):
+        """
+        Return the user's transactions selected by ids or by filter.
+        """
+        transactions = Transaction.objects.filter(account__item__user=request.user)
+
+        if "ids" in data:
+            return transactions.filter(pk__in=set(data["ids"]))
+
+        filters = data["filter"]
+        if "account" in filters:
+            transactions = transactions.filter(account=filters["account"])
+        if "start_date" in filters:
+            transactions = transactions.filter(date__gte=filters["start_date"])
+        if "end_date" in filters:
+            transactions = transactions.filter(date__lte=filters["end_date"])
+        if "primary_category" in filters:
+            transactions = transactions.filter(
+                primary_category=filters["primary_category"]
+            )
+        if "merchant" in filters:
+            transactions = transactions.filter(merchant=filters["merchant"])
+        return transactions
+
+    def load_rows(self, transactions, data, *fields) -> list | None:
+        """
+        Load the selected transactions, locked until the request's
+        transaction ends.
+
+        Ownership of every requested id is checked by the same query that
+        loads the rows, so a batch is rejected as a whole if any id is not
+        one of the user's transactions.
+        """
+        rows = list(transactions.select_for_update(of=("self",)).only(*fields))
+        if "ids" in data and len(rows) != len(set(data["ids"])):
+            return None
+        return rows
+
+    def patch(self, request):
+        bulk_serializer = TransactionBulkUpdateSerializer(data=request.data)
+        bulk_serializer.is_valid(raise_exception=True)
+        data = bulk_serializer.validated_data
+        changes = data["changes"]
+
+        with db_transaction.atomic(using=router.db_for_write(Transaction)):
+            transactions = self.get_transactions(request, data)
+            rows = self.load_rows(
+                transactions, data, "id", "primary_category", "date", "amount"
+            )
+            if rows is None:
+                return Response(
+                    "Transactions Not Found", status=status.HTTP_404_NOT_FOUND
+                )
+
+            updated_count = transactions.update(**changes)
+
+            if "primary_category" in changes:
+                apply_budget_changes(
+                    request.user.pk,
+                    removed=[budget_entry(transaction) for transaction in rows],
+                    added=[
+                        (changes["primary_category"], *budget_entry(transaction)[1:])
+                        for transaction in rows
+                    ],
+                )
+
+        invalidate_cash_flow_forecast(request.user.pk)
+
+        return Response({"updated": updated_count}, status=status.HTTP_200_OK)
+
+    def delete(self, request):
+        bulk_serializer = TransactionBulkSerializer(data=request.data)
+        bulk_serializer.is_valid(raise_exception=True)
+        data = bulk_serializer.validated_data
+
+        with db_transaction.atomic(using=router.db_for_write(Transaction)):
+            transactions = self.get_transactions(request, data)
+            rows = self.load_rows(
+                transactions,
+                data,
+                "id",
+                "merchant",
+                "primary_category",
+                "date",
+                "amount",
+            )
+            if rows is None:
+                return Response(
+                    "Transactions Not Found", status=status.HTTP_404_NOT_FOUND
+                )
+
+            transactions.delete()
+
+            apply_transaction_changes(request.user, [], rows)
+
+        return Response({"deleted": len(rows)}, status=status.HTTP_200_OK)
+
+
+class CashFlowForecastDB(APIView):
+    def get(self, request):
+        try:
+            days = int(request.query_params.get("days", 30))
+        except ValueError:
+            return Response("Days Must Be a Number", status=status.HTTP_400_BAD_REQUEST)
+
+        if not 1 <= days <= settings.CASH_FLOW_FORECAST_MAX_DAYS:
+            return Response(
+                f"Days Must Be Between 1 and {settings.CASH_FLOW_FORECAST_MAX_DAYS}",
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        forecast = get_cash_flow_forecast(request.user, days)
+
+        return Response(forecast, status=status.HTTP_200_OK)
+
+
+class BudgetListDB(generics.ListCreateAPIView):
+    serializer_class = BudgetSerializer
+
+    def get_queryset(self):
+        return Budget.objects.filter(user=self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["user"] = self.request.user
+        return context
+
+
+class BudgetDetailsDB(generics.RetrieveUpdateDestroyAPIView):
+    serializer_class = BudgetSerializer
+
+    def get_queryset(self):
+        return Budget.objects.filter(user=self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["user"] = self.request.user
+        return context
+
+
+class RecurringStreamListDB(RequestedFieldsMixin, APIView):
+    def get(self, request):
+        fields = self.requested_fields(RecurringStreamSerializer)
+        streams = RecurringStream.objects.filter(user=request.user).order_by(
+            "next_date"
+        )
+        if fields is not None:
+            streams = streams.only(*fields)
+        stream_serializer = RecurringStreamSerializer(streams, many=True, fields=fields)
+
+        return Response(stream_serializer.data, status=status.HTTP_200_OK)
+
+
+class SpendingAnomalyListDB(RequestedFieldsMixin, APIView):
+    def get(self, request):
+        fields = self.requested_fields(SpendingAnomalySerializer)
+        anomalies = SpendingAnomaly.objects.filter(user=request.user).order_by(
+            "-created_at"
+        )
+        if fields is not None:
+            anomalies = anomalies.only(*fields)
+        anomaly_serializer = SpendingAnomalySerializer(
+            anomalies, many=True, fields=fields
+        )
+
+        return Response(anomaly_serializer.data, status=status.HTTP_200_OK)
+
+
+class CategorizationRuleListDB(generics.ListCreateAPIView):
+    serializer_class = CategorizationRuleSerializer
+
+    def get_queryset(self):
+        return CategorizationRule.objects.filter(user=self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["user"] = self.request.user
+        return context
+
+
+class CategorizationRuleDetailsDB(generics.RetrieveUpdateDestroyAPIView):
+    serializer_class = CategorizationRuleSerializer
+
+    def get_queryset(self):
+        return CategorizationRule.objects.filter(user=self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context["user"] = self.request.user
+        return context
+
+
+class CategorizationRuleApply(APIView):
+    def post(self, request):
+        updated_count = apply_categorization_rules(request.user)
+
+        return Response({"updated": updated_count}, status=status.HTTP_200_OK)
+
 
 class InvestmentListPlaid(APIView):
+    @idempotent
     def post(self, request):
-        items = Item.objects.filter(user=request.user)
+        items = Item.objects.filter(user=request.user).select_related("institution")
         investments_saved_list = []
         investments_dict = {}
 
         for item in items:
-            access_token = item.access_token
-
-            investment_request = InvestmentsHoldingsGetRequest(
-                access_token=access_token,
-            )
-
-            response = client.investments_holdings_get(investment_request)
+            try:
+                saved_investments, _ = coalesced_sync(
+                    "investments", item, sync_investments
+                )
+            except IntegrityError as e:
+                return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
+            except SingleFlightTimeout:
+                return Response(
+                    "Sync Already in Progress", status=status.HTTP_409_CONFLICT
+                )
 
-            ## Clean Investment Data
-            investment_data = clean_investment_data(
-                response["holdings"], response["securities"]
+            investments_saved_list.extend(
+                InvestmentSerializer(saved_investments, many=True).data
             )
-
-            # Skip Existing Investments for an Account and Save New Investments for an Account
-            for investment in investment_data:
-                if Investment.objects.filter(
-                    account=investment["account"],
-                    security_id=investment["security_id"],
-                ):
-                    continue
-                else:
-                    try:
-                        investment_serializer = InvestmentSerializer(data=investment)
-                        investment_serializer.is_valid(raise_exception=True)
-                        investment_serializer.save()
-                    except IntegrityError as e:
-                        return Response(str(e), status=status.HTTP_400_BAD_REQUEST)
-
-                    investments_saved_list.append(investment_serializer.data)
             if len(investments_saved_list) != 0:
                 investments_dict[item.institution_id] = investments_saved_list
 
@@ -396,21 +656,17 @@ class InvestmentListPlaid(APIView):
         return Response(investments_dict, status=status.HTTP_201_CREATED)
 
 
-class InvestmentListDB(APIView):
+class InvestmentListDB(RequestedFieldsMixin, ReplicaReadMixin, APIView):
 
     def get(self, request):
-        items = Item.objects.filter(user=request.user)
-        investments = []
-
-        for item in items:
-            db_accounts = Account.objects.filter(item=item)
-
-            account_id_list = [acc.pk for acc in db_accounts]
-
-            db_investments = Investment.objects.filter(account__in=account_id_list)
-            investment_serializer = InvestmentSerializer(db_investments, many=True)
-
-            for inv in investment_serializer.data:
-                investments.append(inv)
+        fields = self.requested_fields(InvestmentSerializer)
+        investments = Investment.objects.filter(
+            account__item__user=request.user
+        ).order_by("account__item", "pk")
+        if fields is not None:
+            investments = investments.only(*fields)
+        investment_serializer = InvestmentSerializer(
+            investments, many=True, fields=fields
+        )
 
-        return Response(investments, status=status.HTTP_200_OK)
+        return Response(investment_serializer.data, status=status.HTTP_200_OK)
@@ -0,0 +1,46 @@
+from contextvars import ContextVar
+
+
+class RequestStats:
+    """
+    Time and query totals accumulated while handling one request.
+    """
+
+    def __init__(self):
+        self.view_name = ""
+        self.query_count = 0
+        self.db_time = 0.0
+        self.plaid_calls = 0
+        self.plaid_time = 0.0
+
+
+_request_stats = ContextVar("request_stats", default=None)
+
+
+def start_request_stats():
+    """
+    Start collecting stats for the current request.
+
+    Returns:
+        The new RequestStats and the token to pass to finish_request_stats
+    """
+    stats = RequestStats()
+    return stats, _request_stats.set(stats)
+
+
+def finish_request_stats(token) -> None:
+    _request_stats.reset(token)
+
+
+def current_request_stats() -> RequestStats | None:
+    return _request_stats.get()
+
+
+def record_plaid_call(duration: float) -> None:
+    """
+    Add a Plaid API call to the current request, if there is one.
+    """
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.plaid_calls += 1
+        stats.plaid_time += duration
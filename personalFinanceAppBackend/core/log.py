@@ -0,0 +1,140 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from .metrics import Counter
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records dropped because the logging queue was full.",
+)
+
+# Attributes every LogRecord has, anything else was passed through extra
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_log_context = ContextVar("log_context", default=None)
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Add fields, e.g. request_id or item_id, to every record logged inside.
+    """
+    token = _log_context.set({**(_log_context.get() or {}), **fields})
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
+
+
+def update_log_context(**fields) -> None:
+    """
+    Add fields to the innermost log_context, e.g. the user once authenticated.
+    """
+    context = _log_context.get()
+    if context is not None:
+        context.update(fields)
+
+
+class ContextFilter(logging.Filter):
+    """
+    Copy the current log context onto records, in the thread that logs them.
+    """
+
+    def filter(self, record):
+        for name, value in (_log_context.get() or {}).items():
+            if not hasattr(record, name):
+                setattr(record, name, value)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Format records as one JSON object per line, including extra fields.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "module": record.module,
+            "message": record.getMessage(),
+        }
+        for name, value in vars(record).items():
+            if name not in _RECORD_ATTRIBUTES and not name.startswith("_"):
+                entry[name] = value
+
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+
+        return json.dumps(entry, default=str)
+
+
+class QueueStreamHandler(QueueHandler):
+    """
+    Stream handler that writes records from a background thread.
+
+    Logging threads only put records on a bounded queue; formatting and
+    stream I/O happen in a QueueListener thread. When the queue is full,
+    records are dropped and counted rather than blocking the caller.
+    """
+
+    def __init__(self, stream=None, max_size: int = 10000):
+        super().__init__(queue.Queue(max_size))
+        self.target = logging.StreamHandler(stream)
+        self._start_listener()
+        atexit.register(self.close)
+        # A forked worker does not inherit the listener thread
+        os.register_at_fork(after_in_child=self._restart_listener)
+
+    def _start_listener(self) -> None:
+        self.listener = QueueListener(self.queue, self.target)
+        self.listener.start()
+
+    def _stop_listener(self) -> None:
+        # Writes the records still queued, then ends the thread
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+
+    def _restart_listener(self) -> None:
+        # A handler closed before the fork stays closed
+        if self.listener is not None:
+            self.queue = queue.Queue(self.queue.maxsize)
+            self._start_listener()
+
+    def setFormatter(self, fmt):
+        # Records are formatted by the listener thread
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        # Merge the arguments now, they may change once the caller continues
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc()
+
+    def close(self):
+        self._stop_listener()
+        super().close()
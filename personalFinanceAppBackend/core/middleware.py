@@ -0,0 +1,229 @@
+import os
+import re
+import time
+import uuid
+from contextlib import ExitStack
+from logging import getLogger
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework.permissions import SAFE_METHODS
+
+from personalFinanceAppBackend.users.authentication import CustomJWTAuthentication
+
+from .instrumentation import (
+    current_request_stats,
+    finish_request_stats,
+    start_request_stats,
+)
+from .log import log_context
+from .profiling import RequestProfile, prune_profiles
+from .routers import pin_user_to_primary, start_shard, stop_shard
+
+logger = getLogger("personal_finance_app")
+
+# Request ids taken from clients end up in logs and response headers
+REQUEST_ID_PATTERN = re.compile(r"[A-Za-z0-9._-]{1,64}")
+
+
+class RequestLogContextMiddleware:
+    """
+    Tag every record logged while handling a request with its request id.
+
+    The id is taken from the X-Request-ID header when the proxy sets one
+    matching REQUEST_ID_PATTERN, and returned in the response so clients
+    can quote it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_id = request.headers.get("X-Request-ID", "")
+        if not REQUEST_ID_PATTERN.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+
+        with log_context(request_id=request_id):
+            response = self.get_response(request)
+
+        response["X-Request-ID"] = request_id
+        return response
+
+
+class RequestTimingMiddleware:
+    """
+    Measure total time, database time and Plaid time of every request.
+
+    The totals are returned in a Server-Timing header to staff users, or to
+    every client with SERVER_TIMING_ENABLED, and requests slower
+    than SLOW_REQUEST_THRESHOLD_MS or running more than
+    SLOW_REQUEST_QUERY_THRESHOLD queries are logged with their view name.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats, token = start_request_stats()
+
+        def record_query(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats.query_count += 1
+                stats.db_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(record_query))
+                response = self.get_response(request)
+        finally:
+            finish_request_stats(token)
+        total_time = time.perf_counter() - start
+
+        if settings.SERVER_TIMING_ENABLED or self.is_staff(request):
+            db_timing = f"db;dur={stats.db_time * 1000:.1f}"
+            plaid_timing = f"plaid;dur={stats.plaid_time * 1000:.1f}"
+            response["Server-Timing"] = ", ".join(
+                [
+                    f"total;dur={total_time * 1000:.1f}",
+                    f'{db_timing};desc="{stats.query_count} queries"',
+                    f'{plaid_timing};desc="{stats.plaid_calls} calls"',
+                ]
+            )
+
+        if (
+            total_time * 1000 >= settings.SLOW_REQUEST_THRESHOLD_MS
+            or stats.query_count >= settings.SLOW_REQUEST_QUERY_THRESHOLD
+        ):
+            logger.warning(
+                "Slow request %s %s (%s): %.1fms total, %.1fms in %d queries, "
+                "%.1fms in %d Plaid calls",
+                request.method,
+                request.path,
+                stats.view_name or "unresolved",
+                total_time * 1000,
+                stats.db_time * 1000,
+                stats.query_count,
+                stats.plaid_time * 1000,
+                stats.plaid_calls,
+            )
+
+        return response
+
+    @staticmethod
+    def is_staff(request) -> bool:
+        # Set by the view that authenticated the request
+        user = getattr(request, "user", None)
+        return user is not None and user.is_staff
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = current_request_stats()
+        if stats is not None:
+            view = getattr(view_func, "view_class", view_func)
+            stats.view_name = view.__name__
+        return None
+
+
+class ProfilingMiddleware:
+    """
+    Run a request under cProfile when a staff user asks for it.
+
+    A request is profiled when it has an X-Profile header or a profile query
+    parameter and carries the access token of a staff user. With the value
+    "inline" the response is replaced by the report of the top functions
+    and SQL statements; any other value stores the pstats data and report
+    in PROFILE_DIR and returns its file name in an X-Profile header, to
+    download from /profiles/<name>. The newest PROFILE_KEEP are kept.
+
+    It runs after the ShardMiddleware, which scopes the shard set by the
+    authentication of staff users to the request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.authentication = CustomJWTAuthentication()
+
+    def __call__(self, request):
+        mode = request.headers.get("X-Profile") or request.GET.get("profile")
+        if not mode or not settings.PROFILING_ENABLED or not self.is_staff(request):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        if not profile.start():
+            response = self.get_response(request)
+            response["X-Profile"] = "busy"
+            return response
+
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(profile.record_query)
+                    )
+                response = self.get_response(request)
+        finally:
+            profile.stop()
+
+        stats = current_request_stats()
+        view_name = stats.view_name if stats and stats.view_name else "unresolved"
+
+        if mode == "inline":
+            return HttpResponse(
+                f"{request.method} {request.path} ({view_name}) "
+                f"returned {response.status_code}\n\n"
+                + profile.report(settings.PROFILE_TOP_N),
+                content_type="text/plain; charset=utf-8",
+            )
+
+        path = profile.save(settings.PROFILE_DIR, f"{view_name}-{uuid.uuid4().hex[:8]}")
+        prune_profiles(settings.PROFILE_DIR, settings.PROFILE_KEEP)
+        logger.info("Stored profile of %s %s in %s", request.method, request.path, path)
+        response["X-Profile"] = os.path.basename(path)
+        return response
+
+    def is_staff(self, request) -> bool:
+        authenticated = self.authentication.authenticate(request)
+        return authenticated is not None and authenticated[0].is_staff
+
+
+class ReplicaStickinessMiddleware:
+    """
+    Keep a user's reads on the primary for a while after they wrote.
+
+    Any successful unsafe request of an authenticated user, such as a Plaid
+    sync or an edit, counts as a write.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            user = getattr(request, "user", None)
+            if user is not None and user.is_authenticated:
+                pin_user_to_primary(response, user.pk)
+
+        return response
+
+
+class ShardMiddleware:
+    """
+    Scope the shard set by authentication to the request it belongs to.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = start_shard(None)
+        try:
+            return self.get_response(request)
+        finally:
+            stop_shard(token)
@@ -0,0 +1,129 @@
+import cProfile
+import io
+import os
+import pstats
+import re
+import threading
+import time
+from datetime import datetime, timezone
+
+# cProfile cannot profile two requests of the same process at once
+_profiler_lock = threading.Lock()
+
+# Names of the files written by RequestProfile.save
+PROFILE_NAME_PATTERN = re.compile(r"[\w.-]+\.(prof|txt)")
+
+
+class RequestProfile:
+    """
+    cProfile run of a single request, with the SQL statements it executed.
+
+    Statements are grouped by their parameterized SQL, so the report lists
+    repeated statements of N+1 patterns once with their count and total time.
+    """
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+        self.statements = {}
+
+    def start(self) -> bool:
+        """
+        Start profiling, unless another request of this process is profiled.
+        """
+        if not _profiler_lock.acquire(blocking=False):
+            return False
+        self.profiler.enable()
+        return True
+
+    def stop(self) -> None:
+        self.profiler.disable()
+        _profiler_lock.release()
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            count, total = self.statements.get(sql, (0, 0.0))
+            self.statements[sql] = (count + 1, total + time.perf_counter() - start)
+
+    def report(self, top: int) -> str:
+        """
+        Return the top functions by cumulative time and the slowest statements.
+        """
+        output = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=output)
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+
+        statements = sorted(
+            self.statements.items(), key=lambda statement: statement[1][1], reverse=True
+        )
+        query_count = sum(count for count, _ in self.statements.values())
+        output.write(
+            f"Top {min(top, len(statements))} of {len(statements)} SQL statements "
+            f"({query_count} queries)\n\n"
+        )
+        for sql, (count, total) in statements[:top]:
+            output.write(f"{total * 1000:10.2f}ms {count:6d}x  {sql}\n")
+
+        return output.getvalue()
+
+    def save(self, directory: str, name: str) -> str:
+        """
+        Write the pstats data and the report next to each other.
+
+        Returns:
+            Path of the written .prof file, loadable with pstats or snakeviz
+        """
+        os.makedirs(directory, exist_ok=True)
+        timestamp = datetime.now(tz=timezone.utc).strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(directory, f"{timestamp}-{name}.prof")
+
+        self.profiler.dump_stats(path)
+        with open(f"{path[:-5]}.txt", "w") as report_file:
+            report_file.write(self.report(top=100))
+
+        return path
+
+
+def stored_profiles(directory: str) -> list:
+    """
+    Return the names of the stored .prof files, newest first.
+    """
+    if not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if name.endswith(".prof")]
+    # Names start with the UTC time they were saved at
+    return sorted(names, reverse=True)
+
+
+def profile_path(directory: str, name: str):
+    """
+    Return the path of a stored .prof or .txt file, None for other names.
+    """
+    if not PROFILE_NAME_PATTERN.fullmatch(name) or name.startswith("."):
+        return None
+    path = os.path.join(directory, name)
+    return path if os.path.isfile(path) else None
+
+
+def delete_profile(directory: str, name: str) -> bool:
+    """
+    Delete a stored profile with its report, given the name of either file.
+    """
+    path = profile_path(directory, name)
+    if path is None:
+        return False
+    base = path.rsplit(".", 1)[0]
+    for extension in (".prof", ".txt"):
+        if os.path.exists(base + extension):
+            os.remove(base + extension)
+    return True
+
+
+def prune_profiles(directory: str, keep: int) -> None:
+    """
+    Delete all but the newest keep stored profiles.
+    """
+    for name in stored_profiles(directory)[keep:]:
+        delete_profile(directory, name)
@@ -0,0 +1,129 @@
+import threading
+import time
+from logging import getLogger
+
+from django.core.cache import caches
+
+logger = getLogger("personal_finance_app")
+
+
+class TokenBucket:
+    """
+    Token bucket holding up to capacity tokens, refilled at rate per second.
+
+    A take reserves a token even when the bucket is empty, leaving it in
+    debt, and returns how long the caller must wait for its token. Callers
+    are so queued in the order they took their tokens, and the bucket
+    never hands out more than capacity plus rate tokens per second.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        if rate <= 0 or capacity < 1:
+            raise ValueError("A token bucket needs a positive rate and capacity")
+        self.rate = rate
+        self.capacity = capacity
+
+    def take(self, state, now: float) -> tuple:
+        """
+        Take one token from a bucket state.
+
+        Args:
+            state: (tokens, updated_at) of the bucket, None for a full bucket
+            now: Current time in seconds since the epoch
+
+        Returns:
+            The new state and the seconds to wait before using the token
+        """
+        tokens, updated_at = state if state is not None else (self.capacity, now)
+        # Clocks of other processes may be slightly behind, never refill backwards
+        elapsed = max(0.0, now - updated_at)
+        tokens = min(self.capacity, tokens + elapsed * self.rate) - 1
+        return (tokens, max(now, updated_at)), max(0.0, -tokens / self.rate)
+
+    @property
+    def idle_seconds(self) -> float:
+        """
+        Seconds after which an unused bucket is full again.
+        """
+        return self.capacity / self.rate
+
+
+class LocalBucketStore:
+    """
+    Token bucket states kept in this process, shared by its threads.
+    """
+
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, bucket: TokenBucket) -> float:
+        with self._lock:
+            self._states[key], wait = bucket.take(self._states.get(key), time.time())
+        return wait
+
+
+class CacheBucketStore:
+    """
+    Token bucket states kept in a Django cache, shared by every process
+    using the same cache.
+
+    Updates are serialized by a lock made with the atomic cache.add, which
+    expires after lock_timeout seconds in case its holder died.
+    """
+
+    def __init__(self, alias: str = "default", lock_timeout: float = 1.0):
+        self.alias = alias
+        self.lock_timeout = lock_timeout
+
+    def take(self, key: str, bucket: TokenBucket) -> float:
+        cache = caches[self.alias]
+        lock_key = f"{key}:lock"
+        deadline = time.monotonic() + self.lock_timeout
+        while not cache.add(lock_key, 1, timeout=self.lock_timeout):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Could not lock token bucket {key}")
+            time.sleep(0.001)
+
+        try:
+            state, wait = bucket.take(cache.get(key), time.time())
+            # A bucket left alone until it is full again needs no state
+            cache.set(key, state, timeout=int(bucket.idle_seconds + wait) + 1)
+        finally:
+            cache.delete(lock_key)
+        return wait
+
+
+class RateLimiter:
+    """
+    Queue callers on token buckets kept in a shared store.
+
+    When the shared store fails, e.g. its cache server is down, buckets
+    fall back to this process so calls are still limited, only per process.
+    """
+
+    def __init__(self, store, fallback=None):
+        self.store = store
+        self.fallback = fallback or LocalBucketStore()
+
+    def reserve(self, key: str, bucket: TokenBucket) -> float:
+        """
+        Take a token and return the seconds to wait before using it.
+        """
+        try:
+            return self.store.take(key, bucket)
+        except Exception as e:
+            logger.warning("Rate limiting %s in process only: %s", key, e)
+            return self.fallback.take(key, bucket)
+
+    def acquire(self, key: str, bucket: TokenBucket) -> float:
+        """
+        Take a token, sleeping until it can be used.
+
+        Returns:
+            The seconds slept
+        """
+        wait = self.reserve(key, bucket)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
@@ -0,0 +1,203 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.signing import BadSignature
+
+_read_database = ContextVar("read_database", default=None)
+_shard = ContextVar("shard", default=None)
+
+# Salt of the signed cookie pinning a client's reads to the primary
+_STICKY_SALT = "replica_sticky"
+
+
+def pin_user_to_primary(response, user_id) -> None:
+    """
+    Serve the user's reads from the primary for REPLICA_STICKY_SECONDS.
+
+    Called after a user wrote, so they read their own writes even when the
+    replicas lag behind. The pin is a signed cookie of the client that
+    wrote, so every worker process sees it without a shared cache.
+    """
+    response.set_signed_cookie(
+        settings.REPLICA_STICKY_COOKIE,
+        str(user_id),
+        salt=_STICKY_SALT,
+        max_age=settings.REPLICA_STICKY_SECONDS,
+        secure=settings.AUTH_COOKIE_SECURE,
+        httponly=True,
+        samesite=settings.AUTH_COOKIE_SAME_SITE,
+    )
+
+
+def is_pinned_to_primary(request, user_id) -> bool:
+    try:
+        pinned = request.get_signed_cookie(
+            settings.REPLICA_STICKY_COOKIE,
+            salt=_STICKY_SALT,
+            # The signature is dated, so an older cookie kept by the client expires
+            max_age=settings.REPLICA_STICKY_SECONDS,
+        )
+    except (KeyError, BadSignature):
+        return False
+    return pinned == str(user_id)
+
+
+def start_replica_reads(request):
+    """
+    Route the reads of the current request to a replica.
+
+    Returns:
+        Token for stop_replica_reads
+    """
+    database = None
+    if settings.DATABASE_REPLICAS and not is_pinned_to_primary(
+        request, request.user.pk
+    ):
+        database = random.choice(settings.DATABASE_REPLICAS)
+    return _read_database.set(database)
+
+
+def stop_replica_reads(token) -> None:
+    _read_database.reset(token)
+
+
+def pick_shard() -> str:
+    """
+    Return the shard holding the data of a new user.
+    """
+    return random.choice(settings.DATABASE_SHARDS)
+
+
+def shard_for_user(user) -> str:
+    return getattr(user, "shard", "") or "default"
+
+
+def current_shard():
+    """
+    Return the shard of the current request or command, None if not set.
+    """
+    return _shard.get()
+
+
+def start_shard(shard):
+    """
+    Route the queries of sharded models to a shard until stop_shard.
+
+    Returns:
+        Token for stop_shard
+    """
+    return _shard.set(shard)
+
+
+def stop_shard(token) -> None:
+    _shard.reset(token)
+
+
+@contextmanager
+def use_shard(shard: str):
+    token = start_shard(shard)
+    try:
+        yield
+    finally:
+        stop_shard(token)
+
+
+def use_user_shard(user):
+    """
+    Route the queries of sharded models to the shard of a user, e.g. in
+    management commands looping over users.
+    """
+    return use_shard(shard_for_user(user))
+
+
+def _is_sharded(model) -> bool:
+    return model._meta.app_label in settings.SHARDED_APPS
+
+
+class ShardRouter:
+    """
+    Send the queries of sharded models to the shard of the current user.
+
+    The shard comes from the database of the instance a query starts from,
+    e.g. item.account_set, the user of a reverse relation, e.g.
+    user.item_set, or else the shard of the current request or command.
+    Other models live in the default database. Queries for the default
+    shard fall through to the ReplicaRouter.
+    """
+
+    def _shard(self, model, hints):
+        instance = hints.get("instance")
+        if instance is not None:
+            if _is_sharded(type(instance)):
+                if instance._state.db in settings.DATABASE_SHARDS:
+                    return instance._state.db
+            elif hasattr(instance, "shard"):
+                return shard_for_user(instance)
+        return _shard.get()
+
+    def _route(self, model, hints):
+        if not _is_sharded(model):
+            instance = hints.get("instance")
+            if instance is not None and instance._state.db in settings.DATABASE_SHARDS:
+                # E.g. item.user for an Item stored in a shard
+                return "default"
+            return None
+
+        shard = self._shard(model, hints)
+        if shard == "default":
+            return None
+        return shard
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if _is_sharded(type(obj1)) != _is_sharded(type(obj2)):
+            # Sharded rows refer to users without a database constraint
+            return True
+        return None
+
+
+class ReplicaRouter:
+    """
+    Send the reads of views using ReplicaReadMixin to a read replica.
+
+    Every other read and all writes go to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return _read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {"default", *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ReplicaReadMixin:
+    """
+    View mixin serving a read-only view's queries from a replica.
+
+    Authentication runs on the primary first, and clients of users who
+    wrote within REPLICA_STICKY_SECONDS keep reading from the primary.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self._replica_token = start_replica_reads(request)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        token = getattr(self, "_replica_token", None)
+        if token is not None:
+            stop_replica_reads(token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
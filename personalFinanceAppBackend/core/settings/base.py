@@ -11,8 +11,10 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
+from corsheaders.defaults import default_headers
 from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
@@ -70,6 +72,11 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = "users.User"
 
 MIDDLEWARE = [
+    "personalFinanceAppBackend.core.middleware.RequestLogContextMiddleware",
+    "personalFinanceAppBackend.core.middleware.RequestTimingMiddleware",
+    "personalFinanceAppBackend.core.middleware.ReplicaStickinessMiddleware",
+    "personalFinanceAppBackend.core.middleware.ShardMiddleware",
+    "personalFinanceAppBackend.core.middleware.ProfilingMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "corsheaders.middleware.CorsMiddleware",
@@ -114,6 +121,7 @@ CORS_ALLOWED_ORIGINS = get_env_value(
     "DJANGO_CORS_ALLOWED_ORIGINS", "http://localhost:3000, http://127.0.0.1:3000"
 ).split(", ")
 CORS_ALLOW_CREDENTIALS = True
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
 
 # CSRF Settings
 CSRF_TRUSTED_ORIGINS = get_env_value(
@@ -131,6 +139,39 @@ AUTH_COOKIE_PATH = "/"
 AUTH_COOKIE_REFRESH_PATH = "/auth/jwt/refresh/"
 AUTH_COOKIE_SAME_SITE = "None"
 
+# Authenticated User Cache Settings
+AUTH_USER_CACHE_TTL = int(get_env_value("AUTH_USER_CACHE_TTL", "60"))
+AUTH_USER_CACHE_MAX_SIZE = int(get_env_value("AUTH_USER_CACHE_MAX_SIZE", "10000"))
+AUTH_USER_CACHE_SHARED = get_env_value("AUTH_USER_CACHE_SHARED", "False") == "True"
+
+# Request Timing Settings
+# Timings reveal how a request was served, so they are only sent to every
+# client while debugging; staff users always get them
+SERVER_TIMING_ENABLED = get_env_value("SERVER_TIMING_ENABLED", str(DEBUG)) == "True"
+SLOW_REQUEST_THRESHOLD_MS = int(get_env_value("SLOW_REQUEST_THRESHOLD_MS", "1000"))
+SLOW_REQUEST_QUERY_THRESHOLD = int(get_env_value("SLOW_REQUEST_QUERY_THRESHOLD", "50"))
+
+# Profiling Settings
+PROFILING_ENABLED = get_env_value("PROFILING_ENABLED", "True") == "True"
+PROFILE_DIR = get_env_value(
+    "PROFILE_DIR", os.path.join(tempfile.gettempdir(), "personal_finance_profiles")
+)
+PROFILE_TOP_N = 30
+# Stored profiles kept, older ones are deleted when a new one is stored
+PROFILE_KEEP = int(get_env_value("PROFILE_KEEP", "50"))
+
+# Metrics Settings
+# The metrics endpoint is disabled without a token. Metrics are kept per
+# process, so it must be scraped from a single worker process
+METRICS_AUTH_TOKEN = get_env_value("METRICS_AUTH_TOKEN", "")
+
+# Token Revocation Settings
+TOKEN_REVOCATION_REFRESH_SECONDS = int(
+    get_env_value("TOKEN_REVOCATION_REFRESH_SECONDS", "30")
+)
+TOKEN_REVOCATION_BLOOM_CAPACITY = 100000
+TOKEN_REVOCATION_BLOOM_ERROR_RATE = 0.001
+
 # Social Auth Settings
 SOCIAL_AUTH_GOOGLE_OAUTH2_KEY = get_env_value("GOOGLE_OAUTH2_KEY", "")
 SOCIAL_AUTH_GOOGLE_OAUTH2_SECRET = get_env_value("GOOGLE_OAUTH2_SECRET", "")
@@ -177,12 +218,39 @@ WSGI_APPLICATION = "personalFinanceAppBackend.core.wsgi.application"
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
 if DEVELOPMENT_MODE is True:
+    # Writers take the lock up front and wait for each other, e.g. the
+    # workers of sync_all, instead of failing with "database is locked"
+    sqlite_options = {"timeout": 20, "transaction_mode": "IMMEDIATE"}
     DATABASES = {
         "default": {
             "ENGINE": "django.db.backends.sqlite3",
             "NAME": BASE_DIR / "db.sqlite3",
-        }
+            "OPTIONS": sqlite_options,
+        },
+        # Stands in for a read replica, used when listed in DATABASE_REPLICAS
+        "replica": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db_replica.sqlite3",
+            "OPTIONS": sqlite_options,
+        },
+        # Stand in for shards, used when listed in DATABASE_SHARDS
+        "shard_1": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db_shard_1.sqlite3",
+            "OPTIONS": sqlite_options,
+        },
+        "shard_2": {
+            "ENGINE": "django.db.backends.sqlite3",
+            "NAME": BASE_DIR / "db_shard_2.sqlite3",
+            "OPTIONS": sqlite_options,
+        },
     }
+    DATABASE_REPLICAS = [
+        alias for alias in get_env_value("DATABASE_REPLICAS").split(",") if alias
+    ]
+    DATABASE_SHARDS = ["default"] + [
+        alias for alias in get_env_value("DATABASE_SHARDS").split(",") if alias
+    ]
 else:
     DATABASES = {
         "default": {
@@ -194,6 +262,59 @@ else:
             "PORT": get_env_value("DATABASE_PORT"),
         }
     }
+    DATABASE_REPLICAS = []
+    for index, host in enumerate(
+        host for host in get_env_value("DATABASE_REPLICA_HOSTS").split(",") if host
+    ):
+        DATABASES[f"replica_{index}"] = {**DATABASES["default"], "HOST": host.strip()}
+        DATABASE_REPLICAS.append(f"replica_{index}")
+    DATABASE_SHARDS = ["default"]
+    for index, host in enumerate(
+        (host for host in get_env_value("DATABASE_SHARD_HOSTS").split(",") if host),
+        start=1,
+    ):
+        DATABASES[f"shard_{index}"] = {**DATABASES["default"], "HOST": host.strip()}
+        DATABASE_SHARDS.append(f"shard_{index}")
+
+DATABASE_ROUTERS = [
+    "personalFinanceAppBackend.core.routers.ShardRouter",
+    "personalFinanceAppBackend.core.routers.ReplicaRouter",
+]
+
+# Apps whose models are sharded by user, the rest lives in the default database
+SHARDED_APPS = {"api"}
+
+# Seconds a user's reads stay on the primary after they wrote, e.g. synced
+REPLICA_STICKY_SECONDS = int(get_env_value("REPLICA_STICKY_SECONDS", "30"))
+REPLICA_STICKY_COOKIE = "replica_sticky"
+
+# Cache
+CACHES = {
+    "default": {
+        "BACKEND": get_env_value(
+            "DJANGO_CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": get_env_value("DJANGO_CACHE_LOCATION", ""),
+    }
+}
+
+# Cash-flow forecast versions, the Plaid rate limit buckets, the locks of
+# running syncs and the responses kept for Idempotency-Key are kept in the
+# default cache, so outside of development, where several workers serve
+# requests, it must be shared by every process for a sync in one worker to
+# reach the others, for the rate limits and locks to hold across workers
+# and for retries to be replayed
+PROCESS_LOCAL_CACHE_BACKENDS = {
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+}
+if (
+    not DEVELOPMENT_MODE
+    and CACHES["default"]["BACKEND"] in PROCESS_LOCAL_CACHE_BACKENDS
+):
+    raise ImproperlyConfigured(
+        "Set DJANGO_CACHE_BACKEND to a cache shared by every process, e.g. Redis"
+    )
 
 # Email
 EMAIL_BACKEND = "django_ses.SESBackend"
@@ -244,11 +365,21 @@ LOGGING = {
             "format": "{levelname} {message}",
             "style": "{",
         },
+        "json": {
+            "()": "personalFinanceAppBackend.core.log.JsonFormatter",
+        },
+    },
+    "filters": {
+        "context": {
+            "()": "personalFinanceAppBackend.core.log.ContextFilter",
+        },
     },
     "handlers": {
+        # Writes from a background thread so request threads never block on I/O
         "console": {
-            "class": "logging.StreamHandler",
-            "formatter": "verbose",
+            "class": "personalFinanceAppBackend.core.log.QueueStreamHandler",
+            "formatter": get_env_value("LOG_FORMATTER", "json"),
+            "filters": ["context"],
         },
         # 'file': {
         #     'class': 'logging.FileHandler',
@@ -284,3 +415,54 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 # Plaid Configuration
 PLAID_CLIENT_ID = os.environ.get("PLAID_CLIENT_ID")
 PLAID_CLIENT_SECRET = os.environ.get("PLAID_CLIENT_SECRET")
+
+# Plaid Rate Limits
+# Every Plaid call takes a token of the client's bucket and, for calls about
+# an Item, of the Item's bucket, waiting for one when the bucket is empty.
+# Buckets are kept in PLAID_RATE_LIMIT_CACHE, so they are shared by every
+# process only with a shared cache backend such as Redis or Memcached. With
+# a process-local cache, sync_all splits the client rate between its workers.
+PLAID_RATE_LIMIT_ENABLED = get_env_value("PLAID_RATE_LIMIT_ENABLED", "True") == "True"
+PLAID_RATE_LIMIT_CACHE = "default"
+PLAID_CLIENT_RATE_PER_MINUTE = int(
+    get_env_value("PLAID_CLIENT_RATE_PER_MINUTE", "1000")
+)
+PLAID_CLIENT_RATE_BURST = int(get_env_value("PLAID_CLIENT_RATE_BURST", "50"))
+PLAID_ITEM_RATE_PER_MINUTE = int(get_env_value("PLAID_ITEM_RATE_PER_MINUTE", "30"))
+PLAID_ITEM_RATE_BURST = int(get_env_value("PLAID_ITEM_RATE_BURST", "5"))
+# Calls Plaid still rejects as rate limited are retried this many times
+PLAID_RATE_LIMIT_RETRIES = int(get_env_value("PLAID_RATE_LIMIT_RETRIES", "3"))
+
+# Plaid Sync Settings
+# Concurrent syncs of a product of an Item join the one running first. A
+# joining request waits this long for it, and a sync held by a worker that
+# died blocks the Item's syncs until its lock expires.
+SYNC_WAIT_SECONDS = int(get_env_value("SYNC_WAIT_SECONDS", "120"))
+SYNC_LOCK_SECONDS = 60 * 10
+
+# Raw Plaid responses of the latest fetch of every product of an Item are
+# stored compressed, for the replay_plaid_payloads command
+PLAID_PAYLOAD_ARCHIVE_ENABLED = (
+    get_env_value("PLAID_PAYLOAD_ARCHIVE_ENABLED", "True") == "True"
+)
+
+# Idempotency Keys
+# Responses of the Plaid sync endpoints are kept this long in the default
+# cache for requests repeating their Idempotency-Key
+IDEMPOTENCY_KEY_SECONDS = int(get_env_value("IDEMPOTENCY_KEY_SECONDS", "86400"))
+# Longest a repeated request waits for the first one to finish
+IDEMPOTENCY_WAIT_SECONDS = int(get_env_value("IDEMPOTENCY_WAIT_SECONDS", "30"))
+# Longest a request holds its key, after which a repeat runs again
+IDEMPOTENCY_LOCK_SECONDS = 60 * 10
+
+# Cash-Flow Forecast Settings
+CASH_FLOW_FORECAST_MAX_DAYS = 365
+CASH_FLOW_FORECAST_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Transaction Archive Settings
+# Transactions older than this are moved to compressed per-year archives by
+# the archive_transactions command. Lowering it is safe, raising it hides
+# archived rows younger than the new age from date range reads.
+TRANSACTION_ARCHIVE_AGE_DAYS = int(
+    get_env_value("TRANSACTION_ARCHIVE_AGE_DAYS", "1095")
+)
@@ -0,0 +1,86 @@
+import time
+import uuid
+
+from django.core.cache import cache
+
+# Seconds between checks of a flight run by another caller
+POLL_INTERVAL = 0.1
+
+
+class SingleFlightTimeout(Exception):
+    """
+    Raised when the flight of another caller did not land in time.
+    """
+
+
+def single_flight(
+    key: str,
+    func,
+    params: str = "",
+    lock_seconds: int = 600,
+    wait_seconds: int = 120,
+    result_seconds: int = 60,
+) -> tuple:
+    """
+    Run func, or join the run of another thread or process holding the key.
+
+    The first caller takes the key with the atomic cache.add and runs func,
+    then shares its result through the cache, which must be shared by every
+    process for callers of other processes to join. Callers arriving meanwhile
+    with the same params wait for that result instead of running func too.
+    Callers with other params wait for the key and run func themselves, as
+    do all waiting callers when the run failed.
+
+    Args:
+        key: Key of the work, callers with the same key never run at once
+        func: Function taking no arguments, its result must be picklable
+        params: Parameters of the work, results are only shared between
+            callers with the same params
+        lock_seconds: Seconds after which a key held by a dead caller expires
+        wait_seconds: Longest to wait for other callers
+        result_seconds: Seconds a result is kept for the callers that joined
+
+    Returns:
+        The result of func and whether this caller ran it
+
+    Raises:
+        SingleFlightTimeout: When other callers held the key for wait_seconds
+    """
+    lock_key = f"single_flight:{key}"
+    deadline = time.monotonic() + wait_seconds
+    joined = None
+
+    while True:
+        if joined is not None:
+            running = cache.get(lock_key)
+            if running is None or running["id"] != joined:
+                # The flight joined has landed, it left a result unless it failed
+                result = cache.get(f"{lock_key}:result:{joined}")
+                if result is not None:
+                    return result[0], False
+                joined = None
+
+        flight = {"id": uuid.uuid4().hex, "params": params}
+        if cache.add(lock_key, flight, lock_seconds):
+            break
+
+        running = cache.get(lock_key)
+        if running is not None and running["params"] == params:
+            joined = running["id"]
+
+        if time.monotonic() > deadline:
+            raise SingleFlightTimeout(f"{key} is still running")
+        time.sleep(POLL_INTERVAL)
+
+    try:
+        result = func()
+        # Wrapped so a None result is told apart from a missing one
+        cache.set(f"{lock_key}:result:{flight['id']}", (result,), result_seconds)
+    finally:
+        # After a run longer than lock_seconds the key may belong to another
+        # caller by now, which keeps it
+        running = cache.get(lock_key)
+        if running is not None and running["id"] == flight["id"]:
+            cache.delete(lock_key)
+
+    return result, True
@@ -0,0 +1,230 @@
+import time
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from personalFinanceAppBackend.api.models import (
+    Account,
+    Institution,
+    Investment,
+    Item,
+    Transaction,
+)
+from personalFinanceAppBackend.users.cache import user_cache
+from personalFinanceAppBackend.users.revocation import revocation_store
+
+User = get_user_model()
+
+MERCHANTS = ["Coffee Shop", "Grocery Store", "Gas Station", "Streaming Service"]
+CATEGORIES = ["FOOD_AND_DRINK", "GENERAL_MERCHANDISE", "TRANSPORTATION"]
+
+
+def seed_user_data(
+    user,
+    items: int,
+    accounts_per_item: int,
+    transactions_per_account: int,
+    investments_per_account: int = 0,
+) -> list:
+    """
+    Create Items with accounts, transactions and investments for a user.
+
+    Returns:
+        List of the created Items
+    """
+    # Plaid identifiers are unique across shards
+    offset = sum(
+        Item.objects.using(shard).count() for shard in settings.DATABASE_SHARDS
+    )
+    institutions = Institution.objects.bulk_create(
+        Institution(
+            institution_id=f"ins_{offset + index}",
+            institution_name=f"Bank {offset + index}",
+        )
+        for index in range(items)
+    )
+    created_items = Item.objects.bulk_create(
+        Item(
+            user=user,
+            institution=institution,
+            item_id=f"item_{institution.institution_id}",
+            access_token=f"access-{institution.institution_id}",
+        )
+        for institution in institutions
+    )
+    accounts = Account.objects.bulk_create(
+        Account(
+            item=item,
+            account_id=f"{item.item_id}_account_{index}",
+            available_balance=1000,
+            current_balance=1200,
+            name=f"Account {index}",
+            account_type="depository",
+            account_subtype="checking",
+        )
+        for item in created_items
+        for index in range(accounts_per_item)
+    )
+
+    today = date.today()
+    Transaction.objects.bulk_create(
+        (
+            Transaction(
+                account=account,
+                transaction_id=f"{account.account_id}_transaction_{index}",
+                amount=5 + index % 40,
+                date=today - timedelta(days=index * 3 % 360),
+                name=MERCHANTS[index % len(MERCHANTS)],
+                merchant=MERCHANTS[index % len(MERCHANTS)].lower(),
+                payment_channel="in store",
+                primary_category=CATEGORIES[index % len(CATEGORIES)],
+            )
+            for account in accounts
+            for index in range(transactions_per_account)
+        ),
+        batch_size=1000,
+    )
+    Investment.objects.bulk_create(
+        Investment(
+            account=account,
+            security_id=f"{account.account_id}_security_{index}",
+            security_name=f"Security {index}",
+            security_ticker=f"SEC{index}",
+            price=100,
+            price_as_of=today,
+            cost_basis=90,
+            quantity=3,
+        )
+        for account in accounts
+        for index in range(investments_per_account)
+    )
+
+    return created_items
+
+
+class SeededUserTestCase(TestCase):
+    """
+    Test case calling the API as a user owning seeded Items.
+
+    The user and the Items described by seed, as arguments of
+    seed_user_data, are created once per class. Caches are cleared and the
+    client is authenticated as the user before every test.
+    """
+
+    seed = {"items": 1, "accounts_per_item": 2, "transactions_per_account": 5}
+
+    @classmethod
+    def create_user(cls, email: str = "user@example.com", **fields):
+        return User.objects.create_user(
+            email=email,
+            password="password",
+            first_name="Test",
+            last_name="User",
+            **fields,
+        )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = cls.create_user()
+        cls.items = seed_user_data(cls.user, **cls.seed)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient(SERVER_NAME="localhost")
+        self.client.force_authenticate(self.user)
+
+
+class QueryBudgetTestCase(TestCase):
+    """
+    Test case asserting that endpoints stay within a query and time budget.
+
+    An endpoint is called on the seeded data, the data is grown, and the
+    endpoint is called again: the number of queries must stay the same and
+    within the budget, and both calls must finish within the time budget.
+    """
+
+    # Seconds a single request may take
+    time_budget = 2.0
+
+    def setUp(self):
+        self.client = APIClient(SERVER_NAME="localhost")
+
+    def grow(self):
+        """
+        Add data to the fixtures, overridden by the test cases.
+        """
+
+    def set_token_cookies(self) -> tuple:
+        """
+        Authenticate the client as self.user with real access and refresh
+        tokens, so requests go through the token authentication, the user
+        cache and the revocation lookups.
+
+        Returns:
+            The access and refresh tokens
+        """
+        refresh = RefreshToken.for_user(self.user)
+        tokens = str(refresh.access_token), str(refresh)
+        self.client.force_authenticate(None)
+        self.client.cookies[settings.AUTH_COOKIE] = tokens[0]
+        self.client.cookies[settings.AUTH_REFRESH_COOKIE] = tokens[1]
+        return tokens
+
+    def measure(self, build_request, warm: bool = False) -> tuple:
+        """
+        Run a request from cold caches and count its queries.
+
+        Args:
+            build_request: Callable returning the (method, url, data) to run,
+                called before counting so it can create the objects it uses
+            warm: Run the request once before counting, so only the shared
+                cache is cold and the in-process user cache and revocation
+                filter are filled
+
+        Returns:
+            The response, number of queries and seconds taken
+        """
+        method, url, data = build_request()
+        cache.clear()
+        user_cache.clear()
+        revocation_store.reset()
+        if warm:
+            getattr(self.client, method)(url, data, format="json")
+            cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(self.client, method)(url, data, format="json")
+            seconds = time.perf_counter() - start
+
+        return response, len(queries), seconds
+
+    def assertWithinBudget(
+        self,
+        max_queries: int,
+        build_request,
+        status_code: int = 200,
+        warm: bool = False,
+    ):
+        response, queries, seconds = self.measure(build_request, warm)
+        self.assertEqual(response.status_code, status_code, response.content[:500])
+        self.assertLess(seconds, self.time_budget)
+
+        self.grow()
+
+        response, grown_queries, seconds = self.measure(build_request, warm)
+        self.assertEqual(response.status_code, status_code, response.content[:500])
+        self.assertLess(seconds, self.time_budget)
+        self.assertEqual(
+            grown_queries, queries, "Number of queries grows with the data size"
+        )
+        self.assertLessEqual(queries, max_queries)
+
+        return response
@@ -18,8 +18,13 @@ from django.contrib import admin
 from django.urls import include, path
 from rest_framework.authtoken.views import obtain_auth_token
 
+from .views import ProfileDetails, ProfileList, metrics
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics),
+    path("profiles", ProfileList.as_view()),
+    path("profiles/<str:name>", ProfileDetails.as_view()),
     path("", include("personalFinanceAppBackend.api.urls")),
     path("", include("personalFinanceAppBackend.users.urls")),
     # path("api/auth/", obtain_auth_token),
@@ -0,0 +1,61 @@
+import hmac
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from rest_framework import status
+from rest_framework.decorators import APIView
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+
+from .metrics import registry
+from .profiling import delete_profile, profile_path, stored_profiles
+
+
+def metrics(request):
+    """
+    Expose the metrics of this worker in the Prometheus text format.
+
+    Scrapers authenticate with METRICS_AUTH_TOKEN as a bearer token, and
+    the endpoint is disabled while no token is configured.
+    """
+    if not settings.METRICS_AUTH_TOKEN:
+        return HttpResponse(status=404)
+
+    authorization = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(authorization, f"Bearer {settings.METRICS_AUTH_TOKEN}"):
+        return HttpResponse(status=401)
+
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+class ProfileList(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response(
+            stored_profiles(settings.PROFILE_DIR), status=status.HTTP_200_OK
+        )
+
+
+class ProfileDetails(APIView):
+    """
+    Download or delete a profile stored by the ProfilingMiddleware, by the
+    name of its .prof file or of its .txt report.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, name):
+        path = profile_path(settings.PROFILE_DIR, name)
+        if path is None:
+            return Response("Profile Not Found", status=status.HTTP_404_NOT_FOUND)
+
+        return FileResponse(open(path, "rb"), as_attachment=name.endswith(".prof"))
+
+    def delete(self, request, name):
+        if not delete_profile(settings.PROFILE_DIR, name):
+            return Response("Profile Not Found", status=status.HTTP_404_NOT_FOUND)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -2,6 +2,14 @@ from logging import getLogger
 
 from django.conf import settings
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from personalFinanceAppBackend.core.log import update_log_context
+from personalFinanceAppBackend.core.routers import shard_for_user, start_shard
+
+from .cache import user_cache
+from .revocation import revocation_store
 
 logger = getLogger("personal_finance_app")
 
@@ -20,8 +28,34 @@ class CustomJWTAuthentication(JWTAuthentication):
                 return None
 
             validated_token = self.get_validated_token(raw_token)
+            user = self.get_user(validated_token)
+            update_log_context(user_id=user.pk)
+            # Reset by the ShardMiddleware once the request is done
+            start_shard(shard_for_user(user))
 
-            return self.get_user(validated_token), validated_token
+            return user, validated_token
 
         except Exception as e:
             logger.error(e)
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+
+        if revocation_store.is_revoked(validated_token.get(api_settings.JTI_CLAIM)):
+            raise InvalidToken("Token has been revoked")
+
+        return validated_token
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        token_id = validated_token.get(api_settings.JTI_CLAIM)
+        if user_id is None:
+            return super().get_user(validated_token)
+
+        user = user_cache.get(user_id, token_id)
+        if user is None:
+            # Only users that passed the active and revocation checks are cached
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, token_id, user)
+
+        return user
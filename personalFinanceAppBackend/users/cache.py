@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+
+# Fields of cached users, other fields such as the password hash are loaded
+# from the database when a request reads them
+CACHED_FIELDS = (
+    "id",
+    "email",
+    "first_name",
+    "last_name",
+    "is_active",
+    "is_staff",
+    "is_superuser",
+    "shard",
+)
+
+
+class UserCache:
+    """
+    In-process LRU cache of authenticated users with a time-to-live.
+
+    Entries are keyed by (user id, token id) and can optionally be backed by
+    the shared Django cache, so a worker that has not seen a user yet can
+    skip the database too. Only the CACHED_FIELDS of a user are kept, so
+    credentials never reach the shared cache. Invalidation is immediate for
+    the current process and the shared cache; other processes drop their
+    copy once its time-to-live expires.
+    """
+
+    def __init__(self, max_size: int, ttl: float, shared: bool = False):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _shared_key(user_id) -> str:
+        return f"auth_user:{user_id}"
+
+    @staticmethod
+    def _fields(user) -> tuple:
+        return user._state.db, tuple(getattr(user, name) for name in CACHED_FIELDS)
+
+    @staticmethod
+    def _user(fields: tuple):
+        # Built as loaded from the database, with the other fields deferred
+        db, values = fields
+        return get_user_model().from_db(db, CACHED_FIELDS, values)
+
+    def get(self, user_id, token_id):
+        """
+        Return a new instance of the cached user, or None on a miss.
+        """
+        key = (str(user_id), token_id)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                fields, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    # Requests never share an instance they might modify
+                    return self._user(fields)
+                self._remove(key)
+
+        if self.shared:
+            fields = cache.get(self._shared_key(user_id))
+            if fields is not None:
+                self._store(key, fields)
+                return self._user(fields)
+
+        return None
+
+    def set(self, user_id, token_id, user) -> None:
+        fields = self._fields(user)
+        self._store((str(user_id), token_id), fields)
+
+        if self.shared:
+            cache.set(self._shared_key(user_id), fields, self.ttl)
+
+    def _store(self, key, fields: tuple) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (fields, time.monotonic() + self.ttl)
+            self._keys_by_user.setdefault(key[0], set()).add(key)
+
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, user_id) -> None:
+        """
+        Drop every cached token of a user, e.g. after a password change.
+        """
+        with self._lock:
+            for key in list(self._keys_by_user.get(str(user_id), ())):
+                self._remove(key)
+
+        if self.shared:
+            cache.delete(self._shared_key(user_id))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _remove(self, key) -> None:
+        self._entries.pop(key, None)
+        keys = self._keys_by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[key[0]]
+
+
+user_cache = UserCache(
+    max_size=settings.AUTH_USER_CACHE_MAX_SIZE,
+    ttl=settings.AUTH_USER_CACHE_TTL,
+    shared=settings.AUTH_USER_CACHE_SHARED,
+)
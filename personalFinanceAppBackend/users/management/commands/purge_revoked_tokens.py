@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from personalFinanceAppBackend.users.models import RevokedToken
+
+
+class Command(BaseCommand):
+    help = "Delete revoked tokens that have expired and no longer need a denylist"
+
+    def handle(self, *args, **options):
+        deleted_count, _ = RevokedToken.objects.filter(
+            expires_at__lte=timezone.now()
+        ).delete()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {deleted_count} expired revoked tokens")
+        )
@@ -0,0 +1,29 @@
+# Generated by Django 5.1.2 on 2026-10-19 13:22
+
+from django.db import migrations, models
+
+import personalFinanceAppBackend.core.routers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_revokedtoken"),
+    ]
+
+    operations = [
+        # Existing users keep their data in the default database
+        migrations.AddField(
+            model_name="user",
+            name="shard",
+            field=models.CharField(default="default", max_length=64),
+        ),
+        migrations.AlterField(
+            model_name="user",
+            name="shard",
+            field=models.CharField(
+                default=personalFinanceAppBackend.core.routers.pick_shard,
+                max_length=64,
+            ),
+        ),
+    ]
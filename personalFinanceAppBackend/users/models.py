@@ -2,8 +2,22 @@ from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, UserM
 from django.db import models
 from django.utils import timezone
 
+from personalFinanceAppBackend.core.routers import pick_shard
 
-class CustomUserManager(UserManager):
+from .cache import user_cache
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Sends no post_save, so deactivated users are dropped from the cache here
+        user_ids = list(self.values_list("pk", flat=True))
+        rows = super().update(**kwargs)
+        for user_id in user_ids:
+            user_cache.invalidate(user_id)
+        return rows
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
     def _create_user(self, email, password, **extra_fields):
         if not email:
             raise ValueError("You have not provided a valid e-mail address")
@@ -43,6 +57,9 @@ class User(AbstractBaseUser, PermissionsMixin):
     date_joined = models.DateTimeField(default=timezone.now)
     last_login = models.DateTimeField(blank=True, null=True)
 
+    # Database alias holding the user's sharded data, see DATABASE_SHARDS
+    shard = models.CharField(max_length=64, default=pick_shard)
+
     objects = CustomUserManager()
 
     USERNAME_FIELD = "email"
@@ -54,3 +71,14 @@ class User(AbstractBaseUser, PermissionsMixin):
 
     def get_full_name(self):
         return self.name
+
+
+class RevokedToken(models.Model):
+    jti = models.CharField(max_length=255, unique=True)
+    token_type = models.CharField(max_length=20, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, blank=True, null=True)
+    expires_at = models.DateTimeField(db_index=True)
+    revoked_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.jti
@@ -0,0 +1,156 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.utils import timezone as django_timezone
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import UntypedToken
+
+from .models import RevokedToken, User
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter of strings.
+
+    Membership tests can return false positives at roughly the configured
+    error rate for the configured capacity, but never false negatives.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        # Double hashing derives all positions from two independent hashes
+        return ((first + i * second) % self.size for i in range(self.hash_count))
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(item)
+        )
+
+
+class RevocationStore:
+    """
+    Revoked token ids, fronted by a per-process Bloom filter.
+
+    The filter is rebuilt from the database every refresh interval, so the
+    common case of a token that was never revoked is answered from memory,
+    and only possible hits are confirmed with a query. A revocation made
+    by another worker takes effect here within one refresh interval.
+    """
+
+    def __init__(self, refresh_interval: float, capacity: int, error_rate: float):
+        self.refresh_interval = refresh_interval
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self._filter = None
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+
+    def _current_filter(self) -> BloomFilter:
+        if time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return self._filter
+
+        with self._lock:
+            if time.monotonic() - self._refreshed_at >= self.refresh_interval:
+                jtis = list(
+                    RevokedToken.objects.filter(
+                        expires_at__gt=django_timezone.now()
+                    ).values_list("jti", flat=True)
+                )
+                bloom_filter = BloomFilter(
+                    max(self.capacity, 2 * len(jtis)), self.error_rate
+                )
+                for jti in jtis:
+                    bloom_filter.add(jti)
+
+                self._filter = bloom_filter
+                self._refreshed_at = time.monotonic()
+
+        return self._filter
+
+    def is_revoked(self, jti: str) -> bool:
+        if not jti or jti not in self._current_filter():
+            return False
+        return RevokedToken.objects.filter(jti=jti).exists()
+
+    def revoke(self, jti: str, expires_at, token_type: str = "", user_id=None) -> None:
+        if user_id is not None and not User.objects.filter(pk=user_id).exists():
+            # The user was deleted after the token was issued
+            user_id = None
+
+        RevokedToken.objects.get_or_create(
+            jti=jti,
+            defaults={
+                "expires_at": expires_at,
+                "token_type": token_type,
+                "user_id": user_id,
+            },
+        )
+
+        self._current_filter().add(jti)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._filter = None
+            self._refreshed_at = 0.0
+
+
+revocation_store = RevocationStore(
+    refresh_interval=settings.TOKEN_REVOCATION_REFRESH_SECONDS,
+    capacity=settings.TOKEN_REVOCATION_BLOOM_CAPACITY,
+    error_rate=settings.TOKEN_REVOCATION_BLOOM_ERROR_RATE,
+)
+
+
+def revoke_token(raw_token: str) -> bool:
+    """
+    Revoke a signed access or refresh token until it expires.
+
+    Returns:
+        True if the token was valid and is now revoked
+    """
+    try:
+        token = UntypedToken(raw_token)
+    except TokenError:
+        return False
+
+    jti = token.get(api_settings.JTI_CLAIM)
+    if not jti:
+        return False
+
+    revocation_store.revoke(
+        jti,
+        expires_at=datetime.fromtimestamp(token["exp"], tz=timezone.utc),
+        token_type=token.get(api_settings.TOKEN_TYPE_CLAIM, ""),
+        user_id=token.get(api_settings.USER_ID_CLAIM),
+    )
+    return True
+
+
+def is_token_revoked(raw_token: str) -> bool:
+    """
+    Return whether a signed token has been revoked, ignoring invalid tokens.
+    """
+    try:
+        token = UntypedToken(raw_token)
+    except TokenError:
+        return False
+
+    return revocation_store.is_revoked(token.get(api_settings.JTI_CLAIM))
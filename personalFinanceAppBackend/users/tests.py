@@ -1,3 +1,285 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from itertools import count
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from personalFinanceAppBackend.core.testing import QueryBudgetTestCase, seed_user_data
+
+from .cache import UserCache, user_cache
+from .models import RevokedToken
+from .revocation import BloomFilter, RevocationStore
+
+User = get_user_model()
+
+REDIRECT_URI = "http://localhost:3000/auth/google"
+
+
+@override_settings(
+    DJOSER={**settings.DJOSER, "SOCIAL_AUTH_ALLOWED_REDIRECT_URIS": [REDIRECT_URI]},
+    SOCIAL_AUTH_GOOGLE_OAUTH2_KEY="google-key",
+)
+class UsersQueryBudgetTests(QueryBudgetTestCase):
+    """
+    Every authentication endpoint runs a fixed number of queries.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            email="auth@example.com",
+            password="password",
+            first_name="Auth",
+            last_name="User",
+        )
+        seed_user_data(
+            cls.user, items=1, accounts_per_item=2, transactions_per_account=5
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.emails = count()
+
+    def grow(self):
+        User.objects.bulk_create(
+            User(
+                email=f"user{index}@example.com",
+                first_name="Other",
+                last_name="User",
+            )
+            for index in range(200)
+        )
+        RevokedToken.objects.bulk_create(
+            RevokedToken(
+                jti=f"revoked-{index}",
+                token_type="access",
+                expires_at=timezone.now() + timedelta(hours=1),
+            )
+            for index in range(500)
+        )
+        seed_user_data(
+            self.user, items=5, accounts_per_item=4, transactions_per_account=50
+        )
+
+    def test_create_user(self):
+        def build_request():
+            number = next(self.emails)
+            return (
+                "post",
+                "/users/",
+                {
+                    "email": f"new{number}@example.com",
+                    "first_name": "New",
+                    "last_name": "User",
+                    "password": "a-long-password-123",
+                    "re_password": "a-long-password-123",
+                },
+            )
+
+        self.assertWithinBudget(5, build_request, status_code=201)
+
+    def test_get_current_user(self):
+        def build_request():
+            self.set_token_cookies()
+            return "get", "/users/me/", None
+
+        self.assertWithinBudget(2, build_request)
+
+    def test_create_token(self):
+        self.assertWithinBudget(
+            2,
+            lambda: (
+                "post",
+                "/auth/jwt/create/",
+                {"email": "auth@example.com", "password": "password"},
+            ),
+        )
+
+    def test_refresh_token(self):
+        def build_request():
+            self.set_token_cookies()
+            return "post", "/auth/jwt/refresh/", {}
+
+        self.assertWithinBudget(1, build_request)
+
+    def test_verify_token(self):
+        def build_request():
+            self.set_token_cookies()
+            return "post", "/auth/jwt/verify/", {}
+
+        self.assertWithinBudget(1, build_request)
+
+    def test_logout(self):
+        def build_request():
+            self.set_token_cookies()
+            return "post", "/auth/logout/", {}
+
+        self.assertWithinBudget(12, build_request, status_code=204)
+
+    def test_provider_auth(self):
+        self.assertWithinBudget(
+            4,
+            lambda: (
+                "get",
+                f"/auth/o/google-oauth2/?redirect_uri={REDIRECT_URI}",
+                None,
+            ),
+        )
+
+    def test_revoked_token_is_rejected(self):
+        access, refresh = self.set_token_cookies()
+        self.client.post("/auth/logout/")
+
+        self.client.cookies[settings.AUTH_COOKIE] = access
+        self.client.cookies[settings.AUTH_REFRESH_COOKIE] = refresh
+
+        self.assertEqual(self.client.get("/users/me/").status_code, 401)
+        self.assertEqual(self.client.post("/auth/jwt/refresh/").status_code, 401)
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = User.objects.create_user(
+            email="cached@example.com",
+            password="password",
+            first_name="Cached",
+            last_name="User",
+        )
+
+    def test_shared_cache_holds_no_credentials(self):
+        shared = UserCache(max_size=10, ttl=60, shared=True)
+        shared.set(self.user.pk, "token", self.user)
+
+        self.assertNotIn(
+            self.user.password, repr(cache.get(f"auth_user:{self.user.pk}"))
+        )
+
+        # A worker that has not seen the user builds it from the shared cache
+        user = UserCache(max_size=10, ttl=60, shared=True).get(self.user.pk, "token")
+        self.assertEqual(
+            (user.pk, user.email, user.shard),
+            (self.user.pk, self.user.email, self.user.shard),
+        )
+        self.assertIn("password", user.get_deferred_fields())
+        self.assertTrue(user.check_password("password"))
+
+    def test_instances_are_not_shared(self):
+        user_cache.set(self.user.pk, "token", self.user)
+
+        user_cache.get(self.user.pk, "token").first_name = "Changed"
+
+        self.assertEqual(user_cache.get(self.user.pk, "token").first_name, "Cached")
+
+    def test_save_invalidates(self):
+        user_cache.set(self.user.pk, "token", self.user)
+
+        self.user.is_active = False
+        self.user.save()
+
+        self.assertIsNone(user_cache.get(self.user.pk, "token"))
+
+    def test_queryset_update_invalidates(self):
+        other = User.objects.create_user(email="other@example.com", password="password")
+        user_cache.set(self.user.pk, "token", self.user)
+        user_cache.set(other.pk, "token", other)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        self.assertIsNone(user_cache.get(self.user.pk, "token"))
+        self.assertIsNotNone(user_cache.get(other.pk, "token"))
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.cookies[settings.AUTH_COOKIE] = str(
+            RefreshToken.for_user(self.user).access_token
+        )
+        self.assertEqual(self.client.get("/users/me/").status_code, 200)
+
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        self.assertEqual(self.client.get("/users/me/").status_code, 401)
+
+
+class BloomFilterTests(TestCase):
+    def test_no_false_negatives(self):
+        bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+        # Past its capacity the filter only gets more false positives
+        items = [f"jti-{index}" for index in range(3000)]
+        for item in items:
+            bloom_filter.add(item)
+
+        self.assertTrue(all(item in bloom_filter for item in items))
+
+    def test_false_positive_rate(self):
+        bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+        for index in range(1000):
+            bloom_filter.add(f"jti-{index}")
+
+        false_positives = sum(
+            f"other-{index}" in bloom_filter for index in range(10000)
+        )
+        self.assertLess(false_positives / 10000, 0.02)
+
+
+class RevocationStoreTests(TestCase):
+    def setUp(self):
+        self.store = RevocationStore(refresh_interval=0, capacity=10, error_rate=0.01)
+
+    def revoked_token(self, jti: str, expires_in: timedelta) -> RevokedToken:
+        return RevokedToken.objects.create(
+            jti=jti, token_type="access", expires_at=timezone.now() + expires_in
+        )
+
+    def test_rebuilt_filter_holds_every_unexpired_token(self):
+        # Rows revoked by other workers, more than the configured capacity
+        for index in range(50):
+            self.revoked_token(f"jti-{index}", timedelta(hours=1))
+
+        self.assertTrue(
+            all(self.store.is_revoked(f"jti-{index}") for index in range(50))
+        )
+        self.assertFalse(self.store.is_revoked("jti-other"))
+
+    def test_revocation_waits_for_refresh_in_other_workers(self):
+        store = RevocationStore(refresh_interval=3600, capacity=10, error_rate=0.01)
+        self.assertFalse(store.is_revoked("jti-late"))
+
+        self.revoked_token("jti-late", timedelta(hours=1))
+        self.assertFalse(store.is_revoked("jti-late"))
+
+        store.reset()
+        self.assertTrue(store.is_revoked("jti-late"))
+
+    def test_filter_rebuilt_after_purge(self):
+        self.revoked_token("jti-expired", -timedelta(minutes=1))
+        self.revoked_token("jti-valid", timedelta(hours=1))
+        store = RevocationStore(refresh_interval=3600, capacity=10, error_rate=0.01)
+        store.revoke("jti-expired", timezone.now() - timedelta(minutes=1))
+        self.assertIn("jti-expired", store._current_filter())
+
+        call_command("purge_revoked_tokens", stdout=StringIO())
+        store.reset()
+
+        self.assertFalse(RevokedToken.objects.filter(jti="jti-expired").exists())
+        self.assertNotIn("jti-expired", store._current_filter())
+        self.assertFalse(store.is_revoked("jti-expired"))
+        self.assertTrue(store.is_revoked("jti-valid"))
+
+    def test_token_of_deleted_user_is_still_revoked(self):
+        user = User.objects.create_user(email="gone@example.com", password="pw")
+        user_id = user.pk
+        user.delete()
+
+        self.store.revoke(
+            "jti-orphan", timezone.now() + timedelta(hours=1), "access", user_id
+        )
+
+        self.assertIsNone(RevokedToken.objects.get(jti="jti-orphan").user_id)
+        self.assertTrue(self.store.is_revoked("jti-orphan"))
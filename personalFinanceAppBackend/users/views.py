@@ -10,6 +10,8 @@ from rest_framework_simplejwt.views import (
     TokenVerifyView,
 )
 
+from .revocation import is_token_revoked, revoke_token
+
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     def post(self, request, *args, **kwargs):
@@ -46,7 +48,7 @@ class CustomTokenRefreshView(TokenRefreshView):
     def post(self, request, *args, **kwargs):
         refresh_token = request.COOKIES.get("refresh")
 
-        if refresh_token:
+        if refresh_token and not is_token_revoked(refresh_token):
             request.data["refresh"] = refresh_token
         else:
             return Response(status=status.HTTP_401_UNAUTHORIZED)
@@ -73,7 +75,7 @@ class CustomTokenVerifyView(TokenVerifyView):
     def post(self, request, *args, **kwargs):
         access_token = request.COOKIES.get("access")
 
-        if access_token:
+        if access_token and not is_token_revoked(access_token):
             request.data["token"] = access_token
         else:
             raise InvalidToken()
@@ -114,6 +116,12 @@ class CustomProviderAuthView(ProviderAuthView):
 
 class LogoutView(APIView):
     def post(self, request, *args, **kwargs):
+        # Revoke both tokens so copies of them stop working too
+        for cookie in (settings.AUTH_COOKIE, settings.AUTH_REFRESH_COOKIE):
+            raw_token = request.COOKIES.get(cookie)
+            if raw_token:
+                revoke_token(raw_token)
+
         response = Response(status=status.HTTP_204_NO_CONTENT)
         response.delete_cookie("access")
         response.delete_cookie("refresh")